@@ -28,7 +28,7 @@ from django.apps import apps
 from legal.common.glob import (
     INERR_SHORT, GR_DAY, GR_BUSDAY, GR_MONTH, GR_YEAR, UNC_DATE)
 from legal.common.utils import (
-    fdt, holiday, ply, plm, YDCONVS, MDCONVS, yfactor, mfactor, ODP,
+    fdt, count_business_days, ply, plm, YDCONVS, MDCONVS, yfactor, mfactor, ODP,
     grammar, getbutton, unrequire, LocalFloat, LOGGER, render)
 from legal.cin.forms import MainForm
 
@@ -67,13 +67,7 @@ def mainpage(request):
                 messages.append((grammar((end_date - beg_date).days, GR_DAY), None))
 
                 if beg_date >= UNC_DATE:
-                    temp = beg_date + ODP
-                    num = 0
-                    while temp <= end_date:
-                        if not holiday(temp):
-                            num += 1
-                        temp += ODP
-                    messages.append((grammar(num, GR_BUSDAY), None))
+                    messages.append((grammar(count_business_days(beg_date, end_date), GR_BUSDAY), None))
 
                 nyear = nmonth = nday = 0
                 while True:
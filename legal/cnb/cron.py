@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# cnb/cron.py
+#
+# Copyright (C) 2011-19 Tomáš Pecina <tomas@pecina.cz>
+#
+# This file is part of legal.pecina.cz, a web-based toolbox for lawyers.
+#
+# This application is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This application is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from datetime import date
+from os.path import isfile
+
+from django.db.models import Max
+from django.db.transaction import atomic
+
+from legal.common.glob import ODP
+from legal.common.utils import get, is_holiday, LOGGER
+from legal.cnb.models import FXrate, FXvalue, FXyear, MPIrate, MPIstat
+from legal.cnb.utils import MPI_URL, MPI_TYPES, parse_mpi_table, invalidate_mpi_index
+
+
+FX_YEAR_URL = 'https://www.cnb.cz/cs/financni_trhy/devizovy_trh/kurzy_devizoveho_trhu/rok.txt?rok={:d}'
+
+FIRST_YEAR = 1991
+
+
+def read_file(filename):
+
+    with open(filename, encoding='utf-8') as infile:
+        return infile.read()
+
+
+def download(url):
+
+    res = get(url)
+    assert res.ok
+    return res.text
+
+
+def parse_fx_year(txt):
+
+    tables = []
+    header = None
+    for lin in txt.replace('\r', '').split('\n'):
+        if not lin:
+            continue
+        fields = lin.split('|')
+        if fields[0] == 'Datum':
+            header = [fld.split() for fld in fields[1:]]
+            continue
+        rates = {}
+        for (qty, curr), val in zip(header, fields[1:]):
+            if not val:
+                continue
+            try:
+                rates[curr] = int(qty), float(val.replace(',', '.'))
+            except ValueError:
+                rates[curr] = None, None
+        tables.append((date(*map(int, fields[0].split('.')[::-1])), rates))
+    return tables
+
+
+@atomic
+def import_fx_year(year, tables):
+
+    if not tables:
+        return 0
+    FXvalue.objects.bulk_create(
+        [FXvalue(date=dreq, currency=curr, quantity=qty, rate=rate)
+         for dreq, rates in tables for curr, (qty, rate) in rates.items()],
+        ignore_conflicts=True)
+
+    valid = FXvalue.objects.filter(date__lt=date(year, 1, 1)).aggregate(Max('date'))['date__max']
+    dat = date(year, 1, 1) if valid else tables[0][0]
+    if year < date.today().year:
+        end = tables[-1][0] + ODP
+        while is_holiday(end):
+            end += ODP
+        end = min(end - ODP, date(year, 12, 31))
+    else:
+        end = tables[-1][0]
+    rats = FXrate.objects.filter(date__range=(dat, end))
+    mapped = set(rats.filter(valid__isnull=False).values_list('date', flat=True))
+    legacy = set(rats.filter(valid__isnull=True).values_list('date', flat=True))
+    new = []
+    idx = 0
+    while dat <= end:
+        while idx < len(tables) and tables[idx][0] <= dat:
+            valid = tables[idx][0]
+            idx += 1
+        if dat in legacy:
+            FXrate.objects.filter(date=dat).update(valid=valid, text='')
+        elif dat not in mapped:
+            new.append(FXrate(date=dat, valid=valid))
+        dat += ODP
+    FXrate.objects.bulk_create(new)
+    if end == date(year, 12, 31):
+        FXyear.objects.get_or_create(year=year)
+    else:
+        LOGGER.warning('FX rates for {:d} end on {}'.format(year, tables[-1][0]))
+    return len(new)
+
+
+def cron_backfill_fx(*args):
+
+    today = date.today()
+    sources = []
+    for arg in args:
+        if isfile(arg):
+            tables = parse_fx_year(read_file(arg))
+            if tables:
+                sources.append((tables[0][0].year, tables))
+        elif '-' in arg:
+            beg, end = map(int, arg.split('-'))
+            sources.extend((year, None) for year in range(beg, end + 1))
+        else:
+            sources.append((int(arg), None))
+    if not args:
+        sources = [(year, None) for year in range(FIRST_YEAR, today.year + 1)]
+
+    num = 0
+    for year, tables in sorted(sources, key=lambda x: x[0]):
+        if tables is None:
+            if FXyear.objects.filter(year=year).exists():
+                continue
+            try:
+                tables = parse_fx_year(download(FX_YEAR_URL.format(year)))
+            except:
+                LOGGER.warning('Failed to download FX rates for {:d}'.format(year))
+                continue
+        num += import_fx_year(year, tables)
+        LOGGER.debug('FX rates for {:d} imported', fmt=(year,))
+    LOGGER.info('FX rates backfilled, {:d} day(s) added'.format(num))
+    return num
+
+
+@atomic
+def import_mpi(typ, rates):
+
+    existing = set(MPIrate.objects.filter(type=typ).values_list('valid', flat=True))
+    new = []
+    for rate, valid in rates:
+        if valid not in existing:
+            existing.add(valid)
+            new.append(MPIrate(type=typ, rate=rate, valid=valid))
+    MPIrate.objects.bulk_create(new)
+    MPIstat.objects.get_or_create(type=typ)[0].save()
+    invalidate_mpi_index(typ)
+    return len(new)
+
+
+def cron_backfill_mpi(*args):
+
+    num = 0
+    for arg in args or MPI_TYPES:
+        try:
+            if isfile(arg):
+                txt = read_file(arg)
+                typ = [key for key, val in MPI_TYPES.items() if txt.startswith(val[1])][0]
+            else:
+                typ = arg
+                txt = download(MPI_URL.format(MPI_TYPES[typ][0]))
+        except:
+            LOGGER.warning('Failed to read MPI rates from "{}"'.format(arg))
+            continue
+        rates = parse_mpi_table(typ, txt)[0]
+        if rates is not None:
+            num += import_mpi(typ, rates)
+    LOGGER.info('MPI rates backfilled, {:d} rate(s) added'.format(num))
+    return num
+
+
+def cron_backfill():
+
+    return cron_backfill_fx() + cron_backfill_mpi()
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnb', '0008_auto_20170805_1002'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fxrate',
+            name='valid',
+            field=models.DateField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='fxrate',
+            name='text',
+            field=models.TextField(blank=True),
+        ),
+        migrations.CreateModel(
+            name='FXvalue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('currency', models.CharField(max_length=3)),
+                ('quantity', models.IntegerField(null=True)),
+                ('rate', models.FloatField(null=True)),
+            ],
+            options={
+                'unique_together': {('date', 'currency')},
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.2.28 on 2026-10-18 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cnb', '0009_fxvalue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FXyear',
+            fields=[
+                ('year', models.SmallIntegerField(primary_key=True, serialize=False)),
+                ('timestamp_add', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
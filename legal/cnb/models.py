@@ -28,12 +28,48 @@ class FXrate(models.Model):
     date = models.DateField(
         db_index=True)
 
-    text = models.TextField()
+    text = models.TextField(
+        blank=True)
+
+    valid = models.DateField(
+        null=True)
 
     def __str__(self):
         return '{}'.format(self.date)
 
 
+class FXvalue(models.Model):
+
+    date = models.DateField()
+
+    currency = models.CharField(
+        max_length=3)
+
+    quantity = models.IntegerField(
+        null=True)
+
+    rate = models.FloatField(
+        null=True)
+
+    class Meta:
+        unique_together = ('date', 'currency')
+
+    def __str__(self):
+        return self.currency
+
+
+class FXyear(models.Model):
+
+    year = models.SmallIntegerField(
+        primary_key=True)
+
+    timestamp_add = models.DateTimeField(
+        auto_now_add=True)
+
+    def __str__(self):
+        return '{:d}'.format(self.year)
+
+
 class MPIrate(models.Model):
 
     type = models.CharField(
@@ -20,165 +20,242 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from bisect import bisect_right
 from datetime import date, datetime, timedelta
 
-from legal.common.utils import new_xml, LOGGER, getcache
-from legal.cnb.models import FXrate, MPIrate, MPIstat
+from legal.settings import TEST
+from legal.common.utils import new_xml, LOGGER, getcache, precache, LRUCache
+from legal.cnb.models import FXrate, FXvalue, MPIrate, MPIstat
 
 
 DOWNLOAD_WAIT = timedelta(days=10)
 DOWNLOAD_REPEAT = timedelta(hours=1)
 
 
-def get_fx_rate(curr, dat, log=None, use_fixed=False, log_fixed=None):
+FIXED_LIST = {
+    'XEU': {'currency_to': 'EUR',
+            'fixed_rate': 1,
+            'date_from': date(1999, 1, 1)},
+    'ATS': {'currency_to': 'EUR',
+            'fixed_rate': 13.7603,
+            'date_from': date(1998, 12, 31)},
+    'BEF': {'currency_to': 'EUR',
+            'fixed_rate': 40.3399,
+            'date_from': date(1998, 12, 31)},
+    'NLG': {'currency_to': 'EUR',
+            'fixed_rate': 2.20371,
+            'date_from': date(1998, 12, 31)},
+    'FIM': {'currency_to': 'EUR',
+            'fixed_rate': 5.94573,
+            'date_from': date(1998, 12, 31)},
+    'FRF': {'currency_to': 'EUR',
+            'fixed_rate': 6.55957,
+            'date_from': date(1998, 12, 31)},
+    'DEM': {'currency_to': 'EUR',
+            'fixed_rate': 1.95583,
+            'date_from': date(1998, 12, 31)},
+    'IEP': {'currency_to': 'EUR',
+            'fixed_rate': .787564,
+            'date_from': date(1998, 12, 31)},
+    'ITL': {'currency_to': 'EUR',
+            'fixed_rate': 1936.27,
+            'date_from': date(1998, 12, 31)},
+    'LUF': {'currency_to': 'EUR',
+            'fixed_rate': 40.3399,
+            'date_from': date(1998, 12, 31)},
+    'MCF': {'currency_to': 'EUR',
+            'fixed_rate': 6.55957,
+            'date_from': date(1998, 12, 31)},
+    'PTE': {'currency_to': 'EUR',
+            'fixed_rate': 200.482,
+            'date_from': date(1998, 12, 31)},
+    'SML': {'currency_to': 'EUR',
+            'fixed_rate': 1936.27,
+            'date_from': date(1998, 12, 31)},
+    'ESP': {'currency_to': 'EUR',
+            'fixed_rate': 166.386,
+            'date_from': date(1998, 12, 31)},
+    'VAL': {'currency_to': 'EUR',
+            'fixed_rate': 1936.27,
+            'date_from': date(1998, 12, 31)},
+    'GRD': {'currency_to': 'EUR',
+            'fixed_rate': 340.75,
+            'date_from': date(2000, 6, 19)},
+    'SIT': {'currency_to': 'EUR',
+            'fixed_rate': 239.64,
+            'date_from': date(2006, 7, 11)},
+    'CYP': {'currency_to': 'EUR',
+            'fixed_rate': .585274,
+            'date_from': date(2007, 7, 10)},
+    'MTL': {'currency_to': 'EUR',
+            'fixed_rate': .4293,
+            'date_from': date(2007, 7, 10)},
+    'SKK': {'currency_to': 'EUR',
+            'fixed_rate': 30.126,
+            'date_from': date(2008, 7, 8)},
+    'EEK': {'currency_to': 'EUR',
+            'fixed_rate': 15.6466,
+            'date_from': date(2010, 7, 13)},
+    'ROL': {'currency_to': 'RON',
+            'fixed_rate': 10000,
+            'date_from': date(2005, 7, 1)},
+    'RUR': {'currency_to': 'RUB',
+            'fixed_rate': 1000,
+            'date_from': date(1998, 1, 1)},
+    'MXP': {'currency_to': 'MXN',
+            'fixed_rate': 1000,
+            'date_from': date(1993, 1, 1)},
+    'UAK': {'currency_to': 'UAH',
+            'fixed_rate': 100000,
+            'date_from': date(1996, 9, 2)},
+    'TRL': {'currency_to': 'TRY',
+            'fixed_rate': 1000000,
+            'date_from': date(2005, 1, 1)},
+    'BGL': {'currency_to': 'BGN',
+            'fixed_rate': 1000,
+            'date_from': date(1999, 7, 5)},
+    'PLZ': {'currency_to': 'PLN',
+            'fixed_rate': 10000,
+            'date_from': date(1995, 1, 1)},
+    'CSD': {'currency_to': 'RSD',
+            'fixed_rate': 1,
+            'date_from': date(2003, 1, 1)},
+}
 
-    LOGGER.debug(
-        'FX rate requested, currency "{0}" for {1.year:d}-{1.month:02d}-{1.day:02d}, fixed "{2}"'
-        .format(curr, dat, use_fixed))
-
-    fixed_list = {
-        'XEU': {'currency_to': 'EUR',
-                'fixed_rate': 1,
-                'date_from': date(1999, 1, 1)},
-        'ATS': {'currency_to': 'EUR',
-                'fixed_rate': 13.7603,
-                'date_from': date(1998, 12, 31)},
-        'BEF': {'currency_to': 'EUR',
-                'fixed_rate': 40.3399,
-                'date_from': date(1998, 12, 31)},
-        'NLG': {'currency_to': 'EUR',
-                'fixed_rate': 2.20371,
-                'date_from': date(1998, 12, 31)},
-        'FIM': {'currency_to': 'EUR',
-                'fixed_rate': 5.94573,
-                'date_from': date(1998, 12, 31)},
-        'FRF': {'currency_to': 'EUR',
-                'fixed_rate': 6.55957,
-                'date_from': date(1998, 12, 31)},
-        'DEM': {'currency_to': 'EUR',
-                'fixed_rate': 1.95583,
-                'date_from': date(1998, 12, 31)},
-        'IEP': {'currency_to': 'EUR',
-                'fixed_rate': .787564,
-                'date_from': date(1998, 12, 31)},
-        'ITL': {'currency_to': 'EUR',
-                'fixed_rate': 1936.27,
-                'date_from': date(1998, 12, 31)},
-        'LUF': {'currency_to': 'EUR',
-                'fixed_rate': 40.3399,
-                'date_from': date(1998, 12, 31)},
-        'MCF': {'currency_to': 'EUR',
-                'fixed_rate': 6.55957,
-                'date_from': date(1998, 12, 31)},
-        'PTE': {'currency_to': 'EUR',
-                'fixed_rate': 200.482,
-                'date_from': date(1998, 12, 31)},
-        'SML': {'currency_to': 'EUR',
-                'fixed_rate': 1936.27,
-                'date_from': date(1998, 12, 31)},
-        'ESP': {'currency_to': 'EUR',
-                'fixed_rate': 166.386,
-                'date_from': date(1998, 12, 31)},
-        'VAL': {'currency_to': 'EUR',
-                'fixed_rate': 1936.27,
-                'date_from': date(1998, 12, 31)},
-        'GRD': {'currency_to': 'EUR',
-                'fixed_rate': 340.75,
-                'date_from': date(2000, 6, 19)},
-        'SIT': {'currency_to': 'EUR',
-                'fixed_rate': 239.64,
-                'date_from': date(2006, 7, 11)},
-        'CYP': {'currency_to': 'EUR',
-                'fixed_rate': .585274,
-                'date_from': date(2007, 7, 10)},
-        'MTL': {'currency_to': 'EUR',
-                'fixed_rate': .4293,
-                'date_from': date(2007, 7, 10)},
-        'SKK': {'currency_to': 'EUR',
-                'fixed_rate': 30.126,
-                'date_from': date(2008, 7, 8)},
-        'EEK': {'currency_to': 'EUR',
-                'fixed_rate': 15.6466,
-                'date_from': date(2010, 7, 13)},
-        'ROL': {'currency_to': 'RON',
-                'fixed_rate': 10000,
-                'date_from': date(2005, 7, 1)},
-        'RUR': {'currency_to': 'RUB',
-                'fixed_rate': 1000,
-                'date_from': date(1998, 1, 1)},
-        'MXP': {'currency_to': 'MXN',
-                'fixed_rate': 1000,
-                'date_from': date(1993, 1, 1)},
-        'UAK': {'currency_to': 'UAH',
-                'fixed_rate': 100000,
-                'date_from': date(1996, 9, 2)},
-        'TRL': {'currency_to': 'TRY',
-                'fixed_rate': 1000000,
-                'date_from': date(2005, 1, 1)},
-        'BGL': {'currency_to': 'BGN',
-                'fixed_rate': 1000,
-                'date_from': date(1999, 7, 5)},
-        'PLZ': {'currency_to': 'PLN',
-                'fixed_rate': 10000,
-                'date_from': date(1995, 1, 1)},
-        'CSD': {'currency_to': 'RSD',
-                'fixed_rate': 1,
-                'date_from': date(2003, 1, 1)},
-        }
 
-    today = date.today()
-    if dat.year < 1991 or dat > today:
-        return None, None, None, 'Chybné datum, data nejsou k disposici'
-    rat = FXrate.objects.filter(date=dat)
+FX_CACHE = LRUCache(0 if TEST else 4096)
+
+FX_URL = (
+    'https://www.cnb.cz/cs/financni_trhy/devizovy_trh/kurzy_devizoveho_trhu/denni_kurz.xml?'
+    'date={0.day:d}.{0.month:d}.{0.year:d}')
+
+
+def parse_fx_table(txt):
+
+    soup = new_xml(txt)
+    assert soup
+    assert soup.find(
+        'tabulka',
+        {'typ': 'XML_TYP_CNB_KURZY_DEVIZOVEHO_TRHU'})
+    dreq = soup.find('kurzy', {'banka': 'CNB'})['datum']
+    dreq = date(int(dreq[6:]), int(dreq[3:5]), int(dreq[:2]))
+    rates = {}
+    for lin in soup.find_all('radek'):
+        try:
+            qty = int(lin['mnozstvi'])
+            rate = float((lin['kurz'] if lin.has_attr('kurz') else lin['pomer']).replace(',', '.'))
+        except:
+            qty = rate = None
+        rates.setdefault(lin['kod'], (qty, rate))
+    return dreq, rates
+
+
+def store_fx_table(dat, dreq, rates):
+
+    FXvalue.objects.bulk_create(
+        [FXvalue(date=dreq, currency=curr, quantity=qty, rate=rate) for curr, (qty, rate) in rates.items()],
+        ignore_conflicts=True)
+    if not FXrate.objects.filter(date=dat).update(valid=dreq, text=''):
+        FXrate(date=dat, valid=dreq).save()
+
+
+def load_fx_tables(dates):
+    """
+    Load normalized FX tables for dates, return {date: (table date, rates)}.
+    """
+
+    res = {}
+    missing = []
+    for dat in dates:
+        table = FX_CACHE.get(dat)
+        if table:
+            res[dat] = table
+        else:
+            missing.append(dat)
+    if not missing:
+        return res
+    valid = {}
+    for rat in FXrate.objects.filter(date__in=missing):
+        if rat.valid:
+            valid[rat.date] = rat.valid
+        else:
+            try:
+                dreq, rates = parse_fx_table(rat.text)
+            except:
+                continue
+            store_fx_table(rat.date, dreq, rates)
+            res[rat.date] = dreq, rates
+            FX_CACHE.put(rat.date, res[rat.date], None)
+    tables = {}
+    for val in FXvalue.objects.filter(date__in=set(valid.values())):
+        tables.setdefault(val.date, {})[val.currency] = val.quantity, val.rate
+    for dat, dreq in valid.items():
+        res[dat] = dreq, tables.get(dreq, {})
+        FX_CACHE.put(dat, res[dat], None)
+    return res
+
+
+def get_fx_table(dat):
+
+    table = load_fx_tables((dat,)).get(dat)
+    if table:
+        return table + (None,)
+    rat = FXrate.objects.filter(date=dat).first()
     if rat:
-        txt = rat[0].text
+        txt = rat.text
     else:
-        surl = (
-            'https://www.cnb.cz/cs/financni_trhy/devizovy_trh/kurzy_devizoveho_trhu/denni_kurz.xml?'
-            'date={0.day:d}.{0.month:d}.{0.year:d}'.format(dat))
-        txt = getcache(surl, DOWNLOAD_REPEAT)[0]
+        txt = getcache(FX_URL.format(dat), DOWNLOAD_REPEAT)[0]
         if not txt:
             LOGGER.warning('No connection to CNB server')
-            return None, None, None, 'Chyba spojení se serverem ČNB'
+            return None, None, 'Chyba spojení se serverem ČNB'
     try:
-        soup = new_xml(txt)
-        assert soup
-        assert soup.find(
-            'tabulka',
-            {'typ': 'XML_TYP_CNB_KURZY_DEVIZOVEHO_TRHU'})
-        dreq = soup.find('kurzy', {'banka': 'CNB'})['datum']
-        dreq = date(int(dreq[6:]), int(dreq[3:5]), int(dreq[:2]))
+        dreq, rates = parse_fx_table(txt)
     except:
         LOGGER.error('Invalid FX table structure for {0.year:d}-{0.month:02d}-{0.day:02d}'.format(dat))
-        return None, None, None, 'Chyba struktury kursové tabulky'
-    if not rat and (dreq == dat or (today - dat) > DOWNLOAD_WAIT):
-        FXrate(date=dat, text=txt).save()
-    lin = soup.find('radek', {'kod': curr})
+        return None, None, 'Chyba struktury kursové tabulky'
+    if not rat and (dreq == dat or (date.today() - dat) > DOWNLOAD_WAIT):
+        store_fx_table(dat, dreq, rates)
+    return dreq, rates, None
+
+
+def prefetch_fx_tables(dates):
+    """
+    Get FX tables for dates as {date: (table date, rates, message)},
+    downloading missing tables concurrently; tables not available
+    are left to get_fx_table().
+    """
+
+    today = date.today()
+    dates = {dat for dat in dates if dat.year >= 1991 and dat <= today}
+    res = {dat: table + (None,) for dat, table in load_fx_tables(dates).items()}
+    missing = dates.difference(res, FXrate.objects.filter(date__in=dates).values_list('date', flat=True))
+    cached = precache((FX_URL.format(dat) for dat in missing), DOWNLOAD_REPEAT)
+    for dat in missing:
+        if FX_URL.format(dat) in cached:
+            res[dat] = get_fx_table(dat)
+    return res
+
+
+def fx_lookup(curr, dat, dreq, rates, log=None, use_fixed=False, log_fixed=None):
+
     frat = 1
     curr_rq = curr
-    if not lin:
-        if use_fixed and curr in fixed_list and fixed_list[curr]['date_from'] <= dat:
-            curr = fixed_list[curr]['currency_to']
-            lin = soup.find('radek', {'kod': curr})
-            if not lin:
+    if curr not in rates:
+        if use_fixed and curr in FIXED_LIST and FIXED_LIST[curr]['date_from'] <= dat:
+            curr = FIXED_LIST[curr]['currency_to']
+            if curr not in rates:
                 return None, None, dreq, 'Kurs není v kursové tabulce'
-            frat = fixed_list[curr_rq]['fixed_rate']
+            frat = FIXED_LIST[curr_rq]['fixed_rate']
             if log_fixed != None:
                 log_fixed.append(
                     {'currency_from': curr_rq,
-                     'currency_to': fixed_list[curr_rq]['currency_to'],
-                     'rate': fixed_list[curr_rq]['fixed_rate'],
-                     'date_from': fixed_list[curr_rq]['date_from']})
+                     'currency_to': FIXED_LIST[curr_rq]['currency_to'],
+                     'rate': FIXED_LIST[curr_rq]['fixed_rate'],
+                     'date_from': FIXED_LIST[curr_rq]['date_from']})
         else:
             return None, None, dreq, 'Kurs není v kursové tabulce'
-    try:
-        qty = int(lin['mnozstvi'])
-        if lin.has_attr('kurz'):
-            rate = lin['kurz']
-        elif lin.has_attr('pomer'):
-            rate = lin['pomer']
-        rate = float(rate.replace(',', '.'))
-    except:
+    qty, rate = rates[curr]
+    if rate is None:
         LOGGER.error('Invalid FX table line for {0.year:d}-{0.month:02d}-{0.day:02d}'.format(dat))
         return None, None, dreq, 'Chyba řádku kursové tabulky'
     if log != None:
@@ -191,72 +268,190 @@ def get_fx_rate(curr, dat, log=None, use_fixed=False, log_fixed=None):
     return rate / frat, qty, dreq, None
 
 
-def get_mpi_rate(typ, dat, log=None):
+def get_fx_rate(curr, dat, log=None, use_fixed=False, log_fixed=None, tables=None):
+
+    LOGGER.debug(
+        'FX rate requested, currency "{0}" for {1.year:d}-{1.month:02d}-{1.day:02d}, fixed "{2}"',
+        fmt=(curr, dat, use_fixed))
+
+    if dat.year < 1991 or dat > date.today():
+        return None, None, None, 'Chybné datum, data nejsou k disposici'
+    if tables and dat in tables:
+        dreq, rates, msg = tables[dat]
+    else:
+        dreq, rates, msg = get_fx_table(dat)
+    if msg:
+        return None, None, None, msg
+    return fx_lookup(curr, dat, dreq, rates, log, use_fixed, log_fixed)
+
+
+def get_fx_rates(curr, dates, use_fixed=False):
+    """
+    Get FX rates for many dates, using one query for stored tables.
+    """
+
+    tables = prefetch_fx_tables(dates)
+    return [get_fx_rate(curr, dat, use_fixed=use_fixed, tables=tables) for dat in dates]
 
-    LOGGER.debug('MPI rate of type "{0}" requested for {1.year:d}-{1.month:02d}-{1.day:02d}'.format(typ, dat))
 
+MPI_URL = 'https://www.cnb.cz/cs/faq/vyvoj_{}_historie.txt'
+
+MPI_TYPES = {
+    'DISC': ('diskontni', 'PLATNA_OD|CNB_DISKONTNI_SAZBA_V_%'),
+    'LOMB': ('lombard', 'PLATNA_OD|CNB_LOMBARDNI_SAZBA_V_%'),
+    'REPO': ('repo', 'PLATNA_OD|CNB_REPO_SAZBA_V_%'),
+}
+
+
+def parse_mpi_table(typ, txt):
+
+    txt = txt.replace('\r', '').split('\n')
+    if txt[0] != MPI_TYPES[typ][1]:
+        LOGGER.error('Error in rate table for {}'.format(MPI_TYPES[typ][0]))
+        return None, 'Chyba tabulky sazeb (1)'
+
+    rates = []
+    try:
+        for lin in filter(None, txt[1:]):
+            assert lin[8] == '|'
+            rates.append(
+                (float(lin[9:].replace(',', '.')),
+                 date(int(lin[:4]), int(lin[4:6]), int(lin[6:8]))))
+    except:
+        LOGGER.error('Error in rate table for {}'.format(MPI_TYPES[typ][0]))
+        return None, 'Chyba tabulky sazeb (2)'
+    return rates, None
+
+
+MPI_TTL = timedelta(minutes=5)
+
+MPI_INDEX = {}
+
+
+class MPIindex:
+    """
+    Sorted in-memory index of MPI rates of one type.
+    """
+
+    def __init__(self, stamp, rates):
+        self.stamp = stamp
+        self.checked = datetime.now()
+        self.dates = [x[0] for x in rates]
+        self.rates = [x[1] for x in rates]
+
+
+def mpi_index(typ):
+    """
+    Get MPI index, reloaded if MPIstat has been updated since.
+    """
+
+    index = None if TEST else MPI_INDEX.get(typ)
     now = datetime.now()
+    if index and now - index.checked < MPI_TTL:
+        return index
+    stat = MPIstat.objects.filter(type=typ).first()
+    stamp = stat.timestamp_update if stat else None
+    if index and index.stamp == stamp:
+        index.checked = now
+        return index
+    index = MPI_INDEX[typ] = MPIindex(
+        stamp,
+        MPIrate.objects.filter(type=typ).order_by('valid', 'id').values_list('valid', 'rate'))
+    return index
+
+
+def invalidate_mpi_index(typ):
+
+    MPI_INDEX.pop(typ, None)
 
-    prefix = 'https://www.cnb.cz/cs/faq/vyvoj_'
-    suffix = '_historie.txt'
-    types = {
-        'DISC': ('diskontni', 'PLATNA_OD|CNB_DISKONTNI_SAZBA_V_%'),
-        'LOMB': ('lombard', 'PLATNA_OD|CNB_LOMBARDNI_SAZBA_V_%'),
-        'REPO': ('repo', 'PLATNA_OD|CNB_REPO_SAZBA_V_%'),
-    }
 
-    if typ not in types.keys():
+def get_mpi_rate(typ, dat, log=None, prefetched=None):
+
+    LOGGER.debug('MPI rate of type "{0}" requested for {1.year:d}-{1.month:02d}-{1.day:02d}'.format(typ, dat))
+
+    now = datetime.now()
+
+    if typ not in MPI_TYPES:
         return None, 'Chybný druh sazby'
 
     if dat.year < 1990 or dat > now.date():
         return None, 'Chybné datum, data nejsou k disposici'
 
-    stat = MPIstat.objects.get_or_create(type=typ)
-    updated = stat[0].timestamp_update.date()
-    if stat[1] or (not MPIrate.objects.filter(type=typ, valid__gte=dat).exists()
-        and (updated - dat) < DOWNLOAD_WAIT):
-        surl = prefix + types[typ][0] + suffix
-        txt = getcache(surl, DOWNLOAD_REPEAT)[0]
-        if not txt:
-            LOGGER.warning('No connection to CNB server')
-            return None, 'Chyba spojení se serverem ČNB'
+    span = prefetched.get(typ) if prefetched else None
+    if span and span[0] <= dat <= span[1]:
+        dates, vals = span[2:]
+    else:
+        index = mpi_index(typ)
+        if not index.stamp or ((not index.dates or index.dates[-1] < dat)
+            and (index.stamp.date() - dat) < DOWNLOAD_WAIT):
+            stat = MPIstat.objects.get_or_create(type=typ)
+            invalidate_mpi_index(typ)
+            updated = stat[0].timestamp_update.date()
+            surl = MPI_URL.format(MPI_TYPES[typ][0])
+            txt = getcache(surl, DOWNLOAD_REPEAT)[0]
+            if not txt:
+                LOGGER.warning('No connection to CNB server')
+                return None, 'Chyba spojení se serverem ČNB'
 
-        txt = txt.replace('\r', '').split('\n')
-        if txt[0] != types[typ][1]:
-            LOGGER.error('Error in rate table for {}'.format(types[typ][0]))
-            return None, 'Chyba tabulky sazeb (1)'
+            rates, msg = parse_mpi_table(typ, txt)
+            if msg:
+                return None, msg
 
-        rates = []
-        try:
-            for lin in txt[1:]:
-                assert lin[8] == '|'
-                rates.append(
-                    (float(lin[9:].replace(',', '.')),
-                     date(int(lin[:4]), int(lin[4:6]), int(lin[6:8]))))
-        except:
-            LOGGER.error('Error in rate table for {}'.format(types[typ][0]))
-            return None, 'Chyba tabulky sazeb (2)'
+            try:
+                for rat in rates:
+                    if stat[1] or (updated - rat[1]) < DOWNLOAD_WAIT:
+                        MPIrate.objects.get_or_create(
+                            type=typ,
+                            rate=rat[0],
+                            valid=rat[1])
+            except:  # pragma: no cover
+                LOGGER.error('Error writing in database')
+                return None, 'Chyba zápisu do database (1)'
+            try:
+                MPIstat.objects.get_or_create(type=typ)[0].save()
+            except:  # pragma: no cover
+                LOGGER.error('Error writing in database')
+                return None, 'Chyba zápisu do database (2)'
 
-        try:
-            for rat in rates:
-                if stat[1] or (updated - rat[1]) < DOWNLOAD_WAIT:
-                    MPIrate.objects.get_or_create(
-                        type=typ,
-                        rate=rat[0],
-                        valid=rat[1])
-        except:  # pragma: no cover
-            LOGGER.error('Error writing in database')
-            return None, 'Chyba zápisu do database (1)'
-        try:
-            MPIstat.objects.get_or_create(type=typ)[0].save()
-        except:  # pragma: no cover
-            LOGGER.error('Error writing in database')
-            return None, 'Chyba zápisu do database (2)'
+            invalidate_mpi_index(typ)
+            index = mpi_index(typ)
+        dates, vals = index.dates, index.rates
 
-    res = MPIrate.objects.filter(type=typ, valid__lte=dat).order_by('-valid')
-    if not res.exists():
+    idx = bisect_right(dates, dat) - 1
+    if idx < 0:
         return None, 'Sazba není k disposici'
+    rate = vals[idx]
 
     if log != None:
-        log.append({'type': typ, 'rate': res[0].rate, 'date': dat})
-    return res[0].rate, None
+        log.append({'type': typ, 'rate': rate, 'date': dat})
+    return rate, None
+
+
+def get_mpi_rates(typ, beg, end):
+    """
+    Get MPI rate in force on beg and all its changes up to end,
+    as list of (date, rate) tuples.
+    """
+
+    for dat in (end, beg):
+        rate, msg = get_mpi_rate(typ, dat)
+        if msg:
+            return None, msg
+    index = mpi_index(typ)
+    lidx = bisect_right(index.dates, beg)
+    ridx = bisect_right(index.dates, end)
+    return [(beg, rate)] + list(zip(index.dates[lidx:ridx], index.rates[lidx:ridx])), None
+
+
+def prefetch_mpi_rates(spans):
+    """
+    Get MPI rates for {type: (first date, last date)} as
+    {type: (first date, last date, dates, rates)}, omitting failed types.
+    """
+
+    res = {}
+    for typ, (beg, end) in spans.items():
+        rates = get_mpi_rates(typ, beg, end)[0]
+        if rates:
+            res[typ] = (beg, end) + tuple(map(list, zip(*rates)))
+    return res
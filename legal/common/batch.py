@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# common/batch.py
+#
+# Copyright (C) 2011-19 Tomáš Pecina <tomas@pecina.cz>
+#
+# This file is part of legal.pecina.cz, a web-based toolbox for lawyers.
+#
+# This application is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This application is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from concurrent.futures import ProcessPoolExecutor
+from importlib import import_module
+from os import cpu_count, listdir, makedirs, sep
+from os.path import basename, dirname, isdir, join, normpath, splitext
+import csv
+import tarfile
+from zipfile import ZipFile, is_zipfile
+
+from django.db import connections
+
+from legal.settings import TEST
+from legal.common.utils import get_xml, LOGGER
+from legal.cnb.utils import MPI_TYPES, mpi_index, prefetch_fx_tables
+
+
+BATCH_WORKERS = 1 if TEST else cpu_count()
+
+BATCH_APPS = ('hsp', 'hjp')
+
+BATCH_HEADER = ('Soubor', 'Aplikace', 'Název', 'Datum', 'Položka', 'Měna', 'Zůstatek', 'Chyba')
+
+
+def read_debts(path):
+    """
+    Yield (name, data) for debt XML files in directory, zip/tar archive or file.
+    """
+
+    if isdir(path):
+        for name in sorted(listdir(path)):
+            if name.lower().endswith('.xml'):
+                with open(join(path, name), 'rb') as infile:
+                    yield name, infile.read()
+    elif is_zipfile(path):
+        with ZipFile(path) as archive:
+            for name in sorted(archive.namelist()):
+                if name.lower().endswith('.xml'):
+                    yield name, archive.read(name)
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path) as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith('.xml'):
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        with open(path, 'rb') as infile:
+            yield basename(path), infile.read()
+
+
+def debt_app(data):
+    """
+    Get application of debt XML data, or None if not supported.
+    """
+
+    string = get_xml(data)
+    app = string.debt.get('application') if string and string.debt else None
+    return app if app in BATCH_APPS else None
+
+
+def parse_debt(name, data):
+    """
+    Parse debt XML data, return (name, application, debt, error message).
+    """
+
+    app = debt_app(data)
+    if not app:
+        return name, '', None, 'Nepodporovaný formát souboru'
+    try:
+        debt, msg = import_module('legal.{}.views'.format(app)).from_xml(data)
+    except:
+        debt, msg = None, 'Chybný formát souboru'
+    return name, app, debt, msg
+
+
+def warm_rates(debts):
+    """
+    Load rates needed by parsed debts before workers are started.
+    """
+
+    dates = set()
+    for _, app, debt, msg in debts:
+        if app == 'hsp' and not msg:
+            currencies = {credit.currency for credit in debt.credits}
+            currencies.update(
+                debit.fixed_currency if debit.model == 'fixed' else debit.principal_currency for debit in debt.debits)
+            if len(currencies) > 1:
+                dates.update(credit.date for credit in debt.credits)
+                dates.update(debit.fixed_date for debit in debt.debits if debit.model == 'fixed')
+                dates.update(balance.date for balance in debt.balances)
+    prefetch_fx_tables(dates)
+    for typ in MPI_TYPES:
+        mpi_index(typ)
+
+
+def pdf_path(pdfdir, name):
+    """
+    Get PDF file path for debt, keeping its relative path inside the archive.
+    """
+
+    parts = [x for x in normpath(splitext(name)[0]).split(sep) if x not in ('', '.', '..')]
+    path = join(pdfdir, *parts) + '.pdf'
+    makedirs(dirname(path), exist_ok=True)
+    return path
+
+
+def calc_debt(name, app, debt, msg, pdfdir=None):
+    """
+    Recalculate parsed debt, return list of rows for consolidated CSV.
+    """
+
+    if msg:
+        return [(name, app, '', '', '', '', '', msg)]
+    views = import_module('legal.{}.views'.format(app))
+    try:
+        rows = calc_rows(name, app, views, debt, pdfdir)
+    except:
+        LOGGER.error('Batch recalculation of "{}" failed'.format(name), exc_info=True)
+        rows = [(name, app, debt.title, '', '', '', '', 'Chyba výpočtu')]
+    return rows or [(name, app, debt.title, '', '', '', '', '')]
+
+
+def calc_rows(name, app, views, debt, pdfdir):
+
+    rows = []
+    if app == 'hsp':
+        res = views.calc(debt)
+        if res.msg:
+            rows.append((name, app, debt.title, '', '', '', '', res.msg))
+        elif res.rows:
+            last = res.rows[-1]
+            for debit, balance in zip(debt.debits, last['post']):
+                rows.append((
+                    name,
+                    app,
+                    debt.title,
+                    last['date'].isoformat(),
+                    '{} {}'.format(debit.id, debit.description).strip(),
+                    debit.currency,
+                    '{:.2f}'.format(balance),
+                    ''))
+        if pdfdir and not res.msg:
+            with open(pdf_path(pdfdir, name), 'wb') as outfile:
+                views.to_pdf(debt, outfile)
+    else:
+        debt.rates = {}
+        trs = views.getrows(debt)
+        err = [row['msg'] for row in trs if 'msg' in row]
+        if err:
+            rows.append((name, app, debt.title, '', '', '', '', err[0]))
+        elif trs:
+            last = trs[-1]
+            for item, key in (('jistina', 'post_principal'), ('úrok', 'post_interest'), ('celkem', 'post_total')):
+                rows.append((
+                    name,
+                    app,
+                    debt.title,
+                    last['date'].isoformat(),
+                    item,
+                    debt.currency,
+                    '{:.2f}'.format(last[key]),
+                    ''))
+        if pdfdir and not err:
+            with open(pdf_path(pdfdir, name), 'wb') as outfile:
+                views.to_pdf(debt, trs, outfile)
+    return rows
+
+
+def recalc(path, outfile, pdfdir=None, workers=None, progress=None):
+    """
+    Recalculate all debts in path across a process pool, write consolidated
+    CSV to outfile and return (number of debts, number of errors).
+    """
+
+    items = [parse_debt(name, data) for name, data in read_debts(path)]
+    workers = workers or BATCH_WORKERS
+    warm_rates(items)
+    writer = csv.writer(outfile)
+    writer.writerow(BATCH_HEADER)
+    num = err = 0
+    if workers == 1:
+        results = (calc_debt(*item, pdfdir) for item in items)
+    else:
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(calc_debt, *zip(*items), [pdfdir] * len(items), chunksize=4)
+    try:
+        for rows in results:
+            writer.writerows(rows)
+            num += 1
+            if rows[0][-1]:
+                err += 1
+            if progress:
+                progress(num, len(items), rows[0][0])
+    finally:
+        if workers != 1:
+            executor.shutdown()
+    LOGGER.info('Batch of {:d} debt(s) recalculated, {:d} error(s)'.format(num, err))
+    return num, err
@@ -20,40 +20,48 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from time import time
+from traceback import format_exc
 
 from django.contrib.auth.models import User
+from django.db import connection
 
-from legal.szr.cron import szr_notice, cron_courts as szr_courts, cron_update as szr_update
+from legal.szr.cron import szr_notices, cron_courts as szr_courts, cron_update as szr_update
 from legal.psj.cron import (
     cron_courtrooms as psj_courtrooms, cron_schedule as psj_schedule, cron_update as psj_update, cron_update2 as psj_update2)
-from legal.settings import TEST
+from legal.settings import CRON_WORKERS, TEST
 from legal.udn.cron import cron_update as udn_update, cron_find as udn_find
-from legal.sur.cron import sur_notice
-from legal.sir.cron import sir_notice, cron_update as sir_update, cron_refresh_links as sir_refresh_links
-from legal.dir.cron import dir_notice
+from legal.sur.cron import sur_notices
+from legal.sir.cron import sir_notices, cron_update as sir_update, cron_refresh_links as sir_refresh_links
+from legal.dir.cron import dir_notices
+from legal.cnb.cron import cron_backfill as cnb_backfill
 from legal.uds.cron import (
-    cron_publishers as uds_publishers, cron_update as uds_update, uds_notice, cron_remove_orphans as uds_remove_orphans)
+    cron_publishers as uds_publishers, cron_update as uds_update, cron_remove_orphans as uds_remove_orphans,
+    uds_notices)
 from legal.common.glob import LOCAL_SUBDOMAIN, LOCAL_URL
-from legal.common.utils import send_mail, LOGGER, holiday
-from legal.common.models import Pending, Lock
+from legal.common.utils import (
+    send_mass_mail, LOGGER, is_holiday, Lease, release_expired_locks, sweepcache, sweepassets)
+from legal.common.models import Pending, Lock, JobRun
 
 
 def cron_notify():
 
-    for user in User.objects.all():
+    notices = [x() for x in (szr_notices, sur_notices, sir_notices, dir_notices, uds_notices)]
+    messages = []
+    for user in User.objects.filter(id__in=set().union(*notices)).exclude(email='').order_by('id'):
         uid = user.id
-        text = szr_notice(uid) + sur_notice(uid) + sir_notice(uid) + dir_notice(uid) + uds_notice(uid)
-        if text and user.email:
-            text += 'Server {} ({})\n'.format(LOCAL_SUBDOMAIN, LOCAL_URL)
-            send_mail(
-                'Zprava ze serveru {}'.format(LOCAL_SUBDOMAIN),
-                text,
-                [user.email])
-            LOGGER.debug(
-                'Email sent to user "{}" ({:d})'
-                .format(User.objects.get(pk=uid).username, uid))
-    LOGGER.info('Emails sent')
+        text = ''.join(x.get(uid, '') for x in notices)
+        text += 'Server {} ({})\n'.format(LOCAL_SUBDOMAIN, LOCAL_URL)
+        messages.append((
+            'Zprava ze serveru {}'.format(LOCAL_SUBDOMAIN),
+            text,
+            [user.email]))
+        LOGGER.debug('Email prepared for user "{}" ({:d})', fmt=(user.username, uid))
+    num = send_mass_mail(messages)
+    LOGGER.info('Emails sent: {:d}'.format(num))
+    return num
 
 
 SCHED = (
@@ -67,7 +75,7 @@ SCHED = (
     },
     {'name': 'cron_notify',
      'when': lambda t: (t.hour % 6) == 0 and t.minute == 0,
-     'lock': 'sir_ws2',
+     'lock': 'notify',
      'blocking': True,
     },
     {'name': 'psj_update',
@@ -112,7 +120,7 @@ SCHED = (
      'blocking': False,
     },
     {'name': 'uds_update',
-     'when': lambda t: not holiday(t.date()) and t.hour == 19 and t.minute == 15,
+     'when': lambda t: not is_holiday(t.date()) and t.hour == 19 and t.minute == 15,
      'lock': 'uds',
      'blocking': False,
     },
@@ -126,10 +134,19 @@ SCHED = (
      'lock': 'sir',
      'blocking': False,
     },
+    {'name': 'cnb_backfill',
+     'when': lambda t: t.hour == 15 and t.minute == 5,
+     'lock': 'cnb',
+     'blocking': False,
+    },
+    {'name': 'cron_sweep',
+     'when': lambda t: t.hour == 3 and t.minute == 30,
+     'lock': 'sweep',
+     'blocking': False,
+    },
 )
 
-EXPIRE = timedelta(hours=71)
-
+JOBRUN_KEEP = timedelta(days=30)
 
 if TEST:
     from tests.utils import testfunc
@@ -137,61 +154,130 @@ if TEST:
 
 LOG_LOCKS = False
 
+WORKERS = {'default': 1} if TEST else CRON_WORKERS
+
+
+def run(name, args, lock='', due=None, lease=None):
+
+    jobrun = JobRun.objects.create(name=name, args=args, lock=lock or '', start=datetime.now())
+    if due:
+        jobrun.wait = max((jobrun.start - due).total_seconds(), 0)
+    LOGGER.debug('Job {} with arguments "{}" started', fmt=(name, args))
+    start = time()
+    if lease:
+        Lease.set_current(lease)
+    try:
+        res = globals()[name](*args.split())
+        Lease.check()
+    except:
+        jobrun.outcome = 'failed'
+        jobrun.exception = format_exc()
+        LOGGER.error(
+            'Job {} with arguments "{}" failed after {:.2f} s'.format(name, args, time() - start),
+            exc_info=True)
+        raise
+    else:
+        jobrun.outcome = 'ok'
+        if isinstance(res, int):
+            jobrun.rows = res
+        LOGGER.debug('Job {} with arguments "{}" completed in {:.2f} s', fmt=(name, args, time() - start))
+    finally:
+        if lease:
+            Lease.set_current(None)
+        jobrun.duration = time() - start
+        jobrun.end = datetime.now()
+        jobrun.save()
+    return res
+
 
-def run(name, args):
+def run_lane(lease, jobs, threaded=False):
 
-    globals()[name](*args.split())
+    try:
+        for name, args, due in jobs:
+            if lease and lease.lost:
+                LOGGER.warning('Job {} with arguments "{}" skipped, lock "{}" lost'.format(name, args, lease.name))
+                continue
+            try:
+                run(name, args, lease.name if lease else '', due, lease)
+            except:
+                LOGGER.error('Job {} with arguments "{}" aborted'.format(name, args), exc_info=True)
+    finally:
+        if lease and lease.release() and LOG_LOCKS:
+            LOGGER.debug('Lock "{}" reset', fmt=(lease.name,))
+        if threaded:
+            connection.close()
 
 
-def cron_run():
+def cron_run(now=None):
 
-    now = datetime.now()
+    if now is None:
+        now = datetime.now()
 
-    expired = Lock.objects.filter(timestamp_add__lt=(now - EXPIRE))
-    for lock in expired:
-        LOGGER.warning('Expired lock "{}" deleted'.format(lock.name))
-    expired.delete()
+    release_expired_locks()
+
+    leases = {}
+    lanes = {}
+    held = set()
+
+    def acquire(lock):
+        if lock in lanes:
+            return True
+        if lock in held:
+            return False
+        lease = Lease(lock)
+        if not lease.acquire():
+            if LOG_LOCKS:
+                LOGGER.debug('Lock "{}" exists', fmt=(lock,))
+            held.add(lock)
+            return False
+        if LOG_LOCKS:
+            LOGGER.debug('Lock "{}" set', fmt=(lock,))
+        leases[lock] = lease
+        lanes[lock] = []
+        return True
 
     for job in Pending.objects.order_by('timestamp_add'):
-        if not Pending.objects.filter(pk=job.id).exists():
-            continue
-        lock = job.lock
-        if not Lock.objects.filter(name=lock).exists():
+        if acquire(job.lock):
             job.delete()
-            Lock.objects.get_or_create(name=lock)
-            args = getattr(job, 'args', '')
-            run(job.name, args)
-            Lock.objects.filter(name=lock).delete()
-            LOGGER.debug('Scheduled job {} with arguments "{}" completed'.format(job.name, args))
+            lanes[job.lock].append((job.name, getattr(job, 'args', ''), job.timestamp_add))
 
+    unlocked = []
     for job in SCHED:
         if job['when'](now):
             args = job.get('args', '')
             if 'lock' in job:
                 lock = job['lock']
-                if Lock.objects.filter(name=lock).exists():
-                    if LOG_LOCKS:
-                        LOGGER.debug('Lock "{}" exists'.format(lock))
-                    if job['blocking']:
-                        Pending(
-                            name=job['name'],
-                            args=args,
-                            lock=lock
-                        ).save()
-                        LOGGER.debug('Job {} with arguments "{}" scheduled'.format(job['name'], args))
-                    continue
-                elif LOG_LOCKS:
-                    LOGGER.debug('Lock "{}" does not exist'.format(lock))
-                Lock.objects.get_or_create(name=lock)
-                if LOG_LOCKS:
-                    LOGGER.debug('Lock "{}" set'.format(lock))
-            run(job['name'], args)
-            if 'lock' in job:
-                reslock = Lock.objects.filter(name=lock)
-                if reslock.exists():
-                    reslock.delete()
-                    if LOG_LOCKS:
-                        LOGGER.debug('Lock "{}" reset'.format(lock))
+                if acquire(lock):
+                    lanes[lock].append((job['name'], args, now))
+                elif job['blocking']:
+                    Pending(
+                        name=job['name'],
+                        args=args,
+                        lock=lock
+                    ).save()
+                    LOGGER.debug('Job {} with arguments "{}" scheduled', fmt=(job['name'], args))
+            else:
+                unlocked.append((None, [(job['name'], args, now)]))
+
+    lanes = [(leases[x], y) for x, y in lanes.items()] + unlocked
+    pools = {}
+    for lease, jobs in lanes:
+        key = lease.name if lease and lease.name in WORKERS else 'default'
+        pools.setdefault(key, []).append((lease, jobs))
+    if sum(min(WORKERS[x], len(y)) for x, y in pools.items()) > 1:
+        executors = []
+        try:
+            for key, pool in pools.items():
+                executor = ThreadPoolExecutor(max_workers=WORKERS[key])
+                executors.append(executor)
+                for lane in pool:
+                    executor.submit(run_lane, *lane, threaded=True)
+        finally:
+            for executor in executors:
+                executor.shutdown()
+    else:
+        for lane in lanes:
+            run_lane(*lane)
 
 
 def cron_unlock():
@@ -200,8 +286,24 @@ def cron_unlock():
     LOGGER.info('Locks removed')
 
 
+def cron_unlock_expired():
+
+    LOGGER.info('{:d} expired lock(s) removed'.format(release_expired_locks()))
+
+
 def cron_clean():
 
     Pending.objects.all().delete()
     LOGGER.info('Pending jobs deleted')
     cron_unlock()
+
+
+def cron_sweep():
+
+    num = JobRun.objects.filter(start__lt=(datetime.now() - JOBRUN_KEEP)).delete()[0]
+    LOGGER.info('Old job runs deleted: {:d}'.format(num))
+    cnum = sweepcache()
+    LOGGER.info('Expired cache entries deleted: {:d}'.format(cnum))
+    anum = sweepassets()
+    LOGGER.info('Expired assets deleted: {:d}'.format(anum))
+    return num + cnum + anum
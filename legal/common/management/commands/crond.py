@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#
+# common/management/commands/crond.py
+#
+# Copyright (C) 2011-19 Tomáš Pecina <tomas@pecina.cz>
+#
+# This file is part of legal.pecina.cz, a web-based toolbox for lawyers.
+#
+# This application is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This application is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from datetime import datetime, timedelta
+from importlib import reload
+from signal import signal, SIGHUP, SIGINT, SIGTERM
+from sys import modules
+from threading import Event, Thread
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+import legal.common.cron
+from legal.common.utils import LOGGER, http_stats
+
+
+TICK = timedelta(minutes=1)
+
+
+def reload_jobs():
+
+    for name in sorted(modules):
+        if name.startswith('legal.') and name.endswith('.cron') and name != 'legal.common.cron':
+            reload(modules[name])
+    reload(legal.common.cron)
+
+
+def tick(now):
+
+    try:
+        legal.common.cron.cron_run(now)
+    except:
+        LOGGER.error('Scheduler tick {:%Y-%m-%d %H:%M} failed'.format(now), exc_info=True)
+    finally:
+        connection.close()
+    if not now.minute:
+        for host, stat in sorted(http_stats().items()):
+            LOGGER.info('HTTP host {}: {}', fmt=(host, stat))
+
+
+class Command(BaseCommand):
+
+    help = 'Runs the job scheduler as a resident process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='run a single tick and exit')
+
+    def handle(self, *args, **options):
+
+        if options['once']:
+            tick(datetime.now().replace(second=0, microsecond=0))
+            return
+
+        self.wakeup = Event()
+        self.stop = self.reload = False
+        signal(SIGHUP, self.sighup)
+        signal(SIGINT, self.sigterm)
+        signal(SIGTERM, self.sigterm)
+
+        LOGGER.info('Scheduler started')
+        threads = []
+        nxt = datetime.now().replace(second=0, microsecond=0) + TICK
+        while True:
+            self.wakeup.wait(max((nxt - datetime.now()).total_seconds(), 0))
+            self.wakeup.clear()
+            if self.stop:
+                break
+            if self.reload:
+                self.reload = False
+                reload_jobs()
+                LOGGER.info('Scheduler reloaded')
+            if datetime.now() < nxt:
+                continue
+            threads = [x for x in threads if x.is_alive()]
+            thread = Thread(target=tick, args=(nxt,), name='tick-{:%H:%M}'.format(nxt))
+            thread.start()
+            threads.append(thread)
+            nxt += TICK
+            if nxt < datetime.now():
+                LOGGER.warning('Scheduler lagging, skipping to current minute')
+                nxt = datetime.now().replace(second=0, microsecond=0) + TICK
+
+        threads = [x for x in threads if x.is_alive()]
+        LOGGER.info('Scheduler stopping, waiting for {:d} running tick(s)'.format(len(threads)))
+        for thread in threads:
+            thread.join()
+        LOGGER.info('Scheduler stopped')
+
+    def sighup(self, *args):
+
+        self.reload = True
+        self.wakeup.set()
+
+    def sigterm(self, *args):
+
+        self.stop = True
+        self.wakeup.set()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+#
+# common/management/commands/recalc.py
+#
+# Copyright (C) 2011-19 Tomáš Pecina <tomas@pecina.cz>
+#
+# This file is part of legal.pecina.cz, a web-based toolbox for lawyers.
+#
+# This application is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This application is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from django.core.management.base import BaseCommand
+
+from legal.common.batch import recalc
+
+
+class Command(BaseCommand):
+
+    help = 'Recalculates hsp/hjp debt XML files in a directory or archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', type=str, help='directory, zip/tar archive or XML file')
+        parser.add_argument('output', type=str, help='consolidated CSV file')
+        parser.add_argument('--pdf', type=str, help='directory for per-file PDFs')
+        parser.add_argument('--workers', type=int, help='number of worker processes')
+
+    def handle(self, *args, **options):
+
+        def progress(num, total, name):
+            self.stderr.write('{:d}/{:d} {}'.format(num, total, name))
+
+        with open(options['output'], 'w', newline='', encoding='utf-8') as outfile:
+            num, err = recalc(
+                options['path'],
+                outfile,
+                pdfdir=options['pdf'],
+                workers=options['workers'],
+                progress=None if options['verbosity'] < 1 else progress)
+        self.stdout.write('{:d} debt(s) recalculated, {:d} error(s)'.format(num, err))
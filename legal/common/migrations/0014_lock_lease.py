@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0013_auto_20190223_2032'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lock',
+            name='owner',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='lock',
+            name='timestamp_update',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
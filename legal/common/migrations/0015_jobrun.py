@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0014_lock_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=150)),
+                ('args', models.CharField(blank=True, max_length=255)),
+                ('lock', models.CharField(blank=True, max_length=150)),
+                ('start', models.DateTimeField(db_index=True)),
+                ('end', models.DateTimeField(null=True)),
+                ('duration', models.FloatField(null=True)),
+                ('wait', models.FloatField(null=True)),
+                ('outcome', models.CharField(default='running', max_length=10)),
+                ('exception', models.TextField(blank=True)),
+                ('rows', models.IntegerField(null=True)),
+            ],
+        ),
+    ]
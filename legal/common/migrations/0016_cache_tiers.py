@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0015_jobrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cache',
+            name='data',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='cache',
+            name='etag',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='cache',
+            name='last_modified',
+            field=models.CharField(blank=True, max_length=40),
+        ),
+        migrations.AlterField(
+            model_name='cache',
+            name='text',
+            field=models.TextField(blank=True),
+        ),
+    ]
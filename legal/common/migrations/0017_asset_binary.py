@@ -0,0 +1,43 @@
+# Generated by Django 2.2.28 on 2026-10-18 21:49
+
+from base64 import b64decode
+from zlib import compress
+
+from django.db import migrations, models
+
+
+def convert(apps, schema_editor):
+    Asset = apps.get_model('common', 'Asset')
+    for asset in Asset.objects.all():
+        Asset.objects.filter(pk=asset.pk).update(blob=compress(b64decode(asset.data)), compressed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0016_cache_tiers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='asset',
+            name='blob',
+            field=models.BinaryField(default=b''),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='asset',
+            name='compressed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(convert, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='asset',
+            name='data',
+        ),
+        migrations.RenameField(
+            model_name='asset',
+            old_name='blob',
+            new_name='data',
+        ),
+    ]
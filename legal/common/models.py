@@ -64,9 +64,17 @@ class Lock(models.Model):
         max_length=150,
         primary_key=True)
 
+    owner = models.CharField(
+        max_length=100,
+        blank=True)
+
     timestamp_add = models.DateTimeField(
         auto_now_add=True)
 
+    timestamp_update = models.DateTimeField(
+        auto_now=True,
+        db_index=True)
+
     def __str__(self):
         return '{}, {}'.format(self.name, str(self.timestamp_add))
 
@@ -90,13 +98,65 @@ class Pending(models.Model):
         return '{}, {}'.format(self.name, str(self.timestamp_add))
 
 
+class JobRun(models.Model):
+
+    name = models.CharField(
+        max_length=150,
+        db_index=True)
+
+    args = models.CharField(
+        max_length=255,
+        blank=True)
+
+    lock = models.CharField(
+        max_length=150,
+        blank=True)
+
+    start = models.DateTimeField(
+        db_index=True)
+
+    end = models.DateTimeField(
+        null=True)
+
+    duration = models.FloatField(
+        null=True)
+
+    wait = models.FloatField(
+        null=True)
+
+    outcome = models.CharField(
+        max_length=10,
+        default='running')
+
+    exception = models.TextField(
+        blank=True)
+
+    rows = models.IntegerField(
+        null=True)
+
+    def __str__(self):
+        return '{}, {}'.format(self.name, str(self.start))
+
+
 class Cache(models.Model):
 
     url = models.URLField(
         max_length=255,
         unique=True)
 
-    text = models.TextField()
+    text = models.TextField(
+        blank=True)
+
+    data = models.BinaryField(
+        null=True)
+
+    etag = models.CharField(
+        max_length=255,
+        blank=True)
+
+    last_modified = models.CharField(
+        max_length=40,
+        blank=True)
 
     expire = models.DateTimeField(
         null=True,
@@ -117,7 +177,10 @@ class Asset(models.Model):
     assetid = models.CharField(
         max_length=150)
 
-    data = models.TextField()
+    data = models.BinaryField()
+
+    compressed = models.BooleanField(
+        default=False)
 
     expire = models.DateTimeField(
         null=True,
@@ -20,22 +20,35 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from logging import getLogger
-from inspect import stack
+from logging import getLogger, DEBUG, INFO, WARNING, ERROR
+from sys import _getframe
 import time
 from datetime import date, datetime, timedelta
 from calendar import monthrange, isleap
-from math import inf
-from os import environ
+from bisect import bisect_left
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from copy import copy
+from functools import lru_cache
+from hashlib import sha1
+from http import HTTPStatus
+from math import ceil, frexp, inf, ldexp
+from os import environ, getpid
 from os.path import join
 from re import compile, sub
-from base64 import b64encode, b64decode
+from socket import gethostname
+from threading import BoundedSemaphore, Lock as Mutex, Thread, local
+from unicodedata import combining, normalize as unicode_normalize
+from urllib.parse import urlsplit
+from uuid import uuid4
+from zlib import compress, decompress
 from xml.sax.saxutils import escape, unescape
 
 from bs4 import BeautifulSoup
 from pdfrw import PdfReader, PdfName
 from urllib3 import disable_warnings
 import requests
+from requests.adapters import HTTPAdapter
 import reportlab.rl_config
 from reportlab.pdfgen.canvas import Canvas
 from reportlab.pdfbase.pdfdoc import PDFName, PDFDictionary, PDFStream
@@ -44,11 +57,26 @@ from reportlab.pdfbase.pdfmetrics import registerFont, registerFontFamily
 from reportlab.lib.pagesizes import A4
 from django.core import mail
 from django.shortcuts import render as orig_render
+from django.db import connection, IntegrityError
+from django.db.models import Count, Max
 from django.db.transaction import atomic
 
 from legal.settings import FONT_DIR, TEST
 from legal.common.glob import LIM, ODP, YDCONVS, MDCONVS, REGISTERS, LOCAL_SUBDOMAIN, LOCAL_EMAIL
-from legal.common.models import Preset, Cache, Asset, Doc
+from legal.common.models import Preset, Cache, Asset, Doc, Lock
+
+
+class LazyMessage:
+    """
+    Log message formatted only when emitted.
+    """
+
+    def __init__(self, fmt, args):
+        self.fmt = fmt
+        self.args = args
+
+    def __str__(self):
+        return self.fmt.format(*self.args)
 
 
 class Logger:
@@ -59,30 +87,31 @@ class Logger:
     _logger = getLogger('logger')
 
     @staticmethod
-    def _proc(meth, args, kwargs):
-        if 'extra' not in kwargs:
-            kwargs['extra'] = {}
-        kwargs['extra']['package'] = stack()[2].frame.f_globals['__package__'].upper().rpartition('.')[2]
+    def _proc(level, args, kwargs):
+        if not Logger._logger.isEnabledFor(level):
+            return
+        extra = kwargs.setdefault('extra', {})
+        extra['package'] = (_getframe(2).f_globals.get('__package__') or '').upper().rpartition('.')[2]
+        msg = args[0]
         if len(args) > 1:
-            kwargs['extra']['request'] = args[1]
-            args = list(args)
-            del args[1]
-            if len(args) > 1:
-                kwargs['extra']['params'] = args[1]
-                del args[1]
-        meth(*args, **kwargs)
+            extra['request'] = args[1]
+            if len(args) > 2:
+                extra['params'] = args[2]
+        if 'fmt' in kwargs:
+            msg = LazyMessage(msg, kwargs.pop('fmt'))
+        Logger._logger.log(level, msg, **kwargs)
 
     def error(self, *args, **kwargs):
-        Logger._proc(self._logger.error, args, kwargs)
+        Logger._proc(ERROR, args, kwargs)
 
     def warning(self, *args, **kwargs):
-        Logger._proc(self._logger.warning, args, kwargs)
+        Logger._proc(WARNING, args, kwargs)
 
     def info(self, *args, **kwargs):
-        Logger._proc(self._logger.info, args, kwargs)
+        Logger._proc(INFO, args, kwargs)
 
     def debug(self, *args, **kwargs):
-        Logger._proc(self._logger.debug, args, kwargs)
+        Logger._proc(DEBUG, args, kwargs)
 
 
 LOGGER = Logger()
@@ -126,6 +155,7 @@ def fdt(dat):
     return '{0.day:02d}.{0.month:02d}.{0.year:02d}'.format(dat)
 
 
+@lru_cache(maxsize=1024)
 def easter_sunday(year):
     """
     Return the date of the Easter Sunday in 'year'.
@@ -145,195 +175,197 @@ def easter_sunday(year):
     return date(year, month, day)
 
 
-def movable_holiday(dat):
-    """
-    Check if 'dat' is a local movable banking holiday.
-    """
+MOVABLE_HOLIDAYS = (
+
+    # Good Friday
+    {'offset': -2, 'from': 1948, 'to': 1951},
+    {'offset': -2, 'from': 2016, 'to': inf},
 
-    holidays = (
+    # Easter Monday
+    {'offset': 1, 'from': -inf, 'to': 1946},
+    {'offset': 1, 'from': 1948, 'to': inf},
 
-        # Good Friday
-        {'offset': -2, 'from': 1948, 'to': 1951},
-        {'offset': -2, 'from': 2016, 'to': inf},
+    # Ascension of Jesus
+    {'offset': 39, 'from': -inf, 'to': 1946},
+    {'offset': 39, 'from': 1948, 'to': 1951},
 
-        # Easter Monday
-        {'offset': 1, 'from': -inf, 'to': 1946},
-        {'offset': 1, 'from': 1948, 'to': inf},
+    # Whit Monday
+    {'offset': 50, 'from': -inf, 'to': 1946},
+    {'offset': 50, 'from': 1948, 'to': 1951},
 
-        # Ascension of Jesus
-        {'offset': 39, 'from': -inf, 'to': 1946},
-        {'offset': 39, 'from': 1948, 'to': 1951},
+    # Corpus Christi
+    {'offset': 60, 'from': -inf, 'to': 1951},
+)
 
-        # Whit Monday
-        {'offset': 50, 'from': -inf, 'to': 1946},
-        {'offset': 50, 'from': 1948, 'to': 1951},
 
-        # Corpus Christi
-        {'offset': 60, 'from': -inf, 'to': 1951},
-    )
+def movable_holiday(dat):
+    """
+    Check if 'dat' is a local movable banking holiday.
+    """
 
     year = dat.year
     esun = easter_sunday(year)
-    for hol in holidays:
+    for hol in MOVABLE_HOLIDAYS:
         if dat == (esun + timedelta(hol['offset'])) and between(hol['from'], year, hol['to']):
             return True
     return False
 
 
-def holiday(dat):
-    """
-    Check if 'dat' is a local banking holiday.
+HOLIDAYS = (
+
+    # Circumcision of Jesus/New Year
+    {'day': 1, 'month': 1, 'from': -inf, 'to': inf},
+
+    # Epiphany/Magi
+    {'day': 6, 'month': 1, 'from': -inf, 'to': 1946},
+    {'day': 6, 'month': 1, 'from': 1948, 'to': 1951},
+
+    # Purification of the Virgin
+    {'day': 2, 'month': 2, 'from': -inf, 'to': 1925},
+
+    # Birthday of T. G. Masaryk
+    {'day': 7, 'month': 3, 'from': 1946, 'to': 1946},
+    {'day': 7, 'month': 3, 'from': 1948, 'to': 1951},
+
+    # Annunciation
+    {'day': 25, 'month': 3, 'from': -inf, 'to': 1925},
+
+    # Labor Day
+    {'day': 1, 'month': 5, 'from': 1925, 'to': inf},
+
+    # Liberation Day
+    {'day': 8, 'month': 5, 'from': 1992, 'to': inf},
+    {'day': 9, 'month': 5, 'from': 1946, 'to': 1946},
+    {'day': 9, 'month': 5, 'from': 1952, 'to': 1991},
+
+    # St. John of Nepomuk
+    {'day': 16, 'month': 5, 'from': -inf, 'to': 1924}, # only in Bohemia
+
+    # Saints Peter and Paul
+    {'day': 29, 'month': 6, 'from': -inf, 'to': 1946},
+    {'day': 29, 'month': 6, 'from': 1948, 'to': 1951},
+
+    # Saints Cyril and Methodius
+    {'day': 5, 'month': 7, 'from': -inf, 'to': 1924}, # only in Moravia
+    {'day': 5, 'month': 7, 'from': 1925, 'to': 1951},
+    {'day': 5, 'month': 7, 'from': 1990, 'to': inf},
+
+    # John Huss
+    {'day': 6, 'month': 7, 'from': 1925, 'to': 1951},
+    {'day': 6, 'month': 7, 'from': 1990, 'to': inf},
+
+    # Ascension of the Virgin
+    {'day': 15, 'month': 8, 'from': -inf, 'to': 1951},
+
+    # Nativity of the Virgin
+    {'day': 8, 'month': 9, 'from': -inf, 'to': 1924},
+
+    # St. Wenceslaus
+    {'day': 28, 'month': 9, 'from': -inf, 'to': 1924}, # only in Bohemia
+    {'day': 28, 'month': 9, 'from': 1925, 'to': 1946},
+    {'day': 28, 'month': 9, 'from': 1948, 'to': 1951},
+    {'day': 28, 'month': 9, 'from': 2000, 'to': inf},
+
+    # Creation of Czechoslovakia/Nationalization Day
+    {'day': 28, 'month': 10, 'from': 1919, 'to': 1939},
+    {'day': 28, 'month': 10, 'from': 1946, 'to': 1969},
+    {'day': 28, 'month': 10, 'from': 1988, 'to': inf},
+
+    # All Saints
+    {'day': 1, 'month': 11, 'from': -inf, 'to': 1951},
+
+    # Velvet Revolution
+    {'day': 17, 'month': 11, 'from': 2000, 'to': inf},
+
+    # Immaculate Conception
+    {'day': 8, 'month': 12, 'from': -inf, 'to': 1946},
+    {'day': 28, 'month': 9, 'from': 1948, 'to': 1951},
+
+    # Christmas Eve
+    {'day': 24, 'month': 12, 'from': 1966, 'to': 1975},
+    {'day': 24, 'month': 12, 'from': 1984, 'to': inf},
+
+    # Nativity of Jesus/First Christmas Holiday
+    {'day': 25, 'month': 12, 'from': -inf, 'to': inf},
+
+    # St. Stephen/Second Christmas Holiday
+    {'day': 26, 'month': 12, 'from': -inf, 'to': inf},
+)
+
+EXTRA_HOLIDAYS = {
+    1966: ((8, 6), (9, 3), (10, 1), (10, 29), (11, 26)),
+    1967: (
+        (1, 7), (1, 21), (2, 4), (2, 18), (3, 4), (3, 18), (4, 1),
+        (4, 15), (4, 29), (5, 13), (5, 27), (6, 10), (6, 24), (7, 8),
+        (7, 22), (8, 5), (8, 19), (9, 2), (9, 16), (9, 30), (10, 14),
+        (11, 11), (11, 25), (12, 9), (12, 23)),
+    1968: (
+        (1, 13), (1, 27), (2, 10), (2, 24), (3, 9), (3, 23), (4, 6),
+        (4, 20), (5, 4), (5, 18), (6, 1), (6, 15), (6, 29), (7, 13),
+        (7, 27), (8, 10), (8, 24), (9, 7), (9, 21), (12, 23), (12, 30),
+        (12, 31)),
+    1969: ((5, 2), (10, 27), (12, 31)),
+    1970: ((1, 2), (10, 30)),
+    1971: ((10, 29),),
+    1972: ((5, 8),),
+    1973: ((12, 31),),
+    1974: ((5, 10), (10, 28), (12, 30), (12, 31)),
+    1975: ((5, 2),),
+    1978: ((5, 8),),
+    1979: ((4, 30), (5, 7), (5, 8), (12, 24), (12, 31)),
+    1980: ((5, 2),),
+    1981: ((1, 2),),
+    1984: ((4, 30), (12, 31)),
+    1985: ((5, 2), (5, 3), (5, 10), (12, 30), (12, 31)),
+    1986: ((5, 2), (12, 31)),
+    1987: ((1, 2), (1, 9), (12, 31)),
+    1988: ((1, 8),),
+    1989: ((5, 8),),
+    1990: ((4, 30),),
+}
+
+EXTRA_NON_HOLIDAYS = {
+    1968: ((12, 21), (12, 22), (12, 28), (12, 29)),
+    1969: ((5, 4), (10, 25), (12, 28)),
+    1970: ((1, 3), (1, 4), (4, 4), (5, 16), (10, 25), (11, 14), (12, 27)),
+    1971: ((1, 3), (4, 17), (10, 24), (12, 24)),
+    1972: ((4, 8), (5, 6), (5, 13), (11, 11)),
+    1973: ((4, 14), (9, 29), (11, 17), (12, 22), (12, 29)),
+    1974: ((4, 6), (5, 12), (9, 28), (11, 16), (12, 22), (12, 28), (12, 29)),
+    1975: ((3, 22), (4, 5), (5, 4), (9, 27), (11, 15), (12, 27), (12, 28)),
+    1977: ((4, 16), (9, 24), (11, 12)),
+    1978: ((3, 11), (4, 1), (5, 6), (5, 13), (9, 23), (9, 23), (10, 14)),
+    1979: ((3, 31), (4, 21), (4, 28), (5, 5), (5, 6), (5, 12), (9, 22), (11, 10), (12, 22), (12, 29)),
+    1980: ((3, 22), (4, 12), (5, 4), (9, 20), (10, 11)),
+    1981: ((1, 4), (4, 25), (10, 24), (11, 28)),
+    1982: ((4, 17),),
+    1983: ((4, 9), (9, 24), (10, 22)),
+    1984: ((3, 31), (4, 28), (5, 12), (9, 29), (11, 10), (12, 22), (12, 29)),
+    1985: ((3, 23), (4, 13), (5, 4), (5, 5), (5, 12), (9, 28), (10, 19), (11, 16), (12, 21), (12, 28), (12, 29)),
+    1986: ((3, 15), (11, 22), (4, 5), (5, 4), (10, 18), (10, 22), (12, 27), (12, 28)),
+    1987: ((1, 3), (1, 4), (4, 25), (10, 17), (12, 12), (12, 27)),
+    1988: ((1, 3), (4, 9)),
+    1989: ((3, 11), (5, 6)),
+    1990: ((4, 28),),
+}
+
+
+def calc_holiday(dat):
+    """
+    Check if 'dat' is a local banking holiday, without using the calendar.
     """
 
-    holidays = (
-
-        # Circumcision of Jesus/New Year
-        {'day': 1, 'month': 1, 'from': -inf, 'to': inf},
-
-        # Epiphany/Magi
-        {'day': 6, 'month': 1, 'from': -inf, 'to': 1946},
-        {'day': 6, 'month': 1, 'from': 1948, 'to': 1951},
-
-        # Purification of the Virgin
-        {'day': 2, 'month': 2, 'from': -inf, 'to': 1925},
-
-        # Birthday of T. G. Masaryk
-        {'day': 7, 'month': 3, 'from': 1946, 'to': 1946},
-        {'day': 7, 'month': 3, 'from': 1948, 'to': 1951},
-
-        # Annunciation
-        {'day': 25, 'month': 3, 'from': -inf, 'to': 1925},
-
-        # Labor Day
-        {'day': 1, 'month': 5, 'from': 1925, 'to': inf},
-
-        # Liberation Day
-        {'day': 8, 'month': 5, 'from': 1992, 'to': inf},
-        {'day': 9, 'month': 5, 'from': 1946, 'to': 1946},
-        {'day': 9, 'month': 5, 'from': 1952, 'to': 1991},
-
-        # St. John of Nepomuk
-        {'day': 16, 'month': 5, 'from': -inf, 'to': 1924}, # only in Bohemia
-
-        # Saints Peter and Paul
-        {'day': 29, 'month': 6, 'from': -inf, 'to': 1946},
-        {'day': 29, 'month': 6, 'from': 1948, 'to': 1951},
-
-        # Saints Cyril and Methodius
-        {'day': 5, 'month': 7, 'from': -inf, 'to': 1924}, # only in Moravia
-        {'day': 5, 'month': 7, 'from': 1925, 'to': 1951},
-        {'day': 5, 'month': 7, 'from': 1990, 'to': inf},
-
-        # John Huss
-        {'day': 6, 'month': 7, 'from': 1925, 'to': 1951},
-        {'day': 6, 'month': 7, 'from': 1990, 'to': inf},
-
-        # Ascension of the Virgin
-        {'day': 15, 'month': 8, 'from': -inf, 'to': 1951},
-
-        # Nativity of the Virgin
-        {'day': 8, 'month': 9, 'from': -inf, 'to': 1924},
-
-        # St. Wenceslaus
-        {'day': 28, 'month': 9, 'from': -inf, 'to': 1924}, # only in Bohemia
-        {'day': 28, 'month': 9, 'from': 1925, 'to': 1946},
-        {'day': 28, 'month': 9, 'from': 1948, 'to': 1951},
-        {'day': 28, 'month': 9, 'from': 2000, 'to': inf},
-
-        # Creation of Czechoslovakia/Nationalization Day
-        {'day': 28, 'month': 10, 'from': 1919, 'to': 1939},
-        {'day': 28, 'month': 10, 'from': 1946, 'to': 1969},
-        {'day': 28, 'month': 10, 'from': 1988, 'to': inf},
-
-        # All Saints
-        {'day': 1, 'month': 11, 'from': -inf, 'to': 1951},
-
-        # Velvet Revolution
-        {'day': 17, 'month': 11, 'from': 2000, 'to': inf},
-
-        # Immaculate Conception
-        {'day': 8, 'month': 12, 'from': -inf, 'to': 1946},
-        {'day': 28, 'month': 9, 'from': 1948, 'to': 1951},
-
-        # Christmas Eve
-        {'day': 24, 'month': 12, 'from': 1966, 'to': 1975},
-        {'day': 24, 'month': 12, 'from': 1984, 'to': inf},
-
-        # Nativity of Jesus/First Christmas Holiday
-        {'day': 25, 'month': 12, 'from': -inf, 'to': inf},
-
-        # St. Stephen/Second Christmas Holiday
-        {'day': 26, 'month': 12, 'from': -inf, 'to': inf},
-    )
-
-    extra_holidays = {
-        1966: ((8, 6), (9, 3), (10, 1), (10, 29), (11, 26)),
-        1967: (
-            (1, 7), (1, 21), (2, 4), (2, 18), (3, 4), (3, 18), (4, 1),
-            (4, 15), (4, 29), (5, 13), (5, 27), (6, 10), (6, 24), (7, 8),
-            (7, 22), (8, 5), (8, 19), (9, 2), (9, 16), (9, 30), (10, 14),
-            (11, 11), (11, 25), (12, 9), (12, 23)),
-        1968: (
-            (1, 13), (1, 27), (2, 10), (2, 24), (3, 9), (3, 23), (4, 6),
-            (4, 20), (5, 4), (5, 18), (6, 1), (6, 15), (6, 29), (7, 13),
-            (7, 27), (8, 10), (8, 24), (9, 7), (9, 21), (12, 23), (12, 30),
-            (12, 31)),
-        1969: ((5, 2), (10, 27), (12, 31)),
-        1970: ((1, 2), (10, 30)),
-        1971: ((10, 29),),
-        1972: ((5, 8),),
-        1973: ((12, 31),),
-        1974: ((5, 10), (10, 28), (12, 30), (12, 31)),
-        1975: ((5, 2),),
-        1978: ((5, 8),),
-        1979: ((4, 30), (5, 7), (5, 8), (12, 24), (12, 31)),
-        1980: ((5, 2),),
-        1981: ((1, 2),),
-        1984: ((4, 30), (12, 31)),
-        1985: ((5, 2), (5, 3), (5, 10), (12, 30), (12, 31)),
-        1986: ((5, 2), (12, 31)),
-        1987: ((1, 2), (1, 9), (12, 31)),
-        1988: ((1, 8),),
-        1989: ((5, 8),),
-        1990: ((4, 30),),
-    }
-
-    extra_non_holidays = {
-        1968: ((12, 21), (12, 22), (12, 28), (12, 29)),
-        1969: ((5, 4), (10, 25), (12, 28)),
-        1970: ((1, 3), (1, 4), (4, 4), (5, 16), (10, 25), (11, 14), (12, 27)),
-        1971: ((1, 3), (4, 17), (10, 24), (12, 24)),
-        1972: ((4, 8), (5, 6), (5, 13), (11, 11)),
-        1973: ((4, 14), (9, 29), (11, 17), (12, 22), (12, 29)),
-        1974: ((4, 6), (5, 12), (9, 28), (11, 16), (12, 22), (12, 28), (12, 29)),
-        1975: ((3, 22), (4, 5), (5, 4), (9, 27), (11, 15), (12, 27), (12, 28)),
-        1977: ((4, 16), (9, 24), (11, 12)),
-        1978: ((3, 11), (4, 1), (5, 6), (5, 13), (9, 23), (9, 23), (10, 14)),
-        1979: ((3, 31), (4, 21), (4, 28), (5, 5), (5, 6), (5, 12), (9, 22), (11, 10), (12, 22), (12, 29)),
-        1980: ((3, 22), (4, 12), (5, 4), (9, 20), (10, 11)),
-        1981: ((1, 4), (4, 25), (10, 24), (11, 28)),
-        1982: ((4, 17),),
-        1983: ((4, 9), (9, 24), (10, 22)),
-        1984: ((3, 31), (4, 28), (5, 12), (9, 29), (11, 10), (12, 22), (12, 29)),
-        1985: ((3, 23), (4, 13), (5, 4), (5, 5), (5, 12), (9, 28), (10, 19), (11, 16), (12, 21), (12, 28), (12, 29)),
-        1986: ((3, 15), (11, 22), (4, 5), (5, 4), (10, 18), (10, 22), (12, 27), (12, 28)),
-        1987: ((1, 3), (1, 4), (4, 25), (10, 17), (12, 12), (12, 27)),
-        1988: ((1, 3), (4, 9)),
-        1989: ((3, 11), (5, 6)),
-        1990: ((4, 28),),
-    }
-
     year = dat.year
     month = dat.month
     day = dat.day
 
-    if year in extra_holidays and (month, day) in extra_holidays[year]:
+    if year in EXTRA_HOLIDAYS and (month, day) in EXTRA_HOLIDAYS[year]:
         return True
 
-    if year in extra_non_holidays and (month, day) in extra_non_holidays[year]:
+    if year in EXTRA_NON_HOLIDAYS and (month, day) in EXTRA_NON_HOLIDAYS[year]:
         return False
 
-    for hol in holidays:
+    for hol in HOLIDAYS:
         if day == hol['day'] and month == hol['month'] and between(hol['from'], year, hol['to']):
             return True
 
@@ -343,6 +375,70 @@ def holiday(dat):
     return dat.weekday() > (5 if dat < date(1968, 10, 5) else 4)
 
 
+@lru_cache(maxsize=1024)
+def holiday_calendar(year):
+    """
+    Return holiday bitmap of 'year' and prefix sums of its business days,
+    the i-th sum being the number of business days among the first i days.
+    """
+
+    dat = date(year, 1, 1)
+    bitmap = bytearray(366 if isleap(year) else 365)
+    cum = [0]
+    for idx in range(len(bitmap)):
+        bitmap[idx] = calc_holiday(dat)
+        cum.append(cum[-1] + 1 - bitmap[idx])
+        dat += ODP
+    return bytes(bitmap), tuple(cum)
+
+
+def is_holiday(dat):
+    """
+    Check if 'dat' is a local banking holiday.
+    """
+
+    return bool(holiday_calendar(dat.year)[0][dat.timetuple().tm_yday - 1])
+
+
+holiday = is_holiday
+
+
+def count_business_days(beg, end):
+    """
+    Return the number of business days in the interval ('beg', 'end'],
+    negative if 'end' precedes 'beg'.
+    """
+
+    if beg > end:
+        return -count_business_days(end, beg)
+    res = (holiday_calendar(end.year)[1][end.timetuple().tm_yday]
+           - holiday_calendar(beg.year)[1][beg.timetuple().tm_yday])
+    for year in range(beg.year, end.year):
+        res += holiday_calendar(year)[1][-1]
+    return res
+
+
+def add_business_days(dat, num):
+    """
+    Return the 'num'-th business day after (if 'num' is negative, before)
+    'dat'; for zero, the first business day not preceding 'dat'.
+    """
+
+    year = dat.year
+    cum = holiday_calendar(year)[1]
+    idx = dat.timetuple().tm_yday
+    key = cum[idx] + num if num > 0 else cum[idx - 1] + num + 1
+    while key > cum[-1]:
+        key -= cum[-1]
+        year += 1
+        cum = holiday_calendar(year)[1]
+    while key <= 0:
+        year -= 1
+        cum = holiday_calendar(year)[1]
+        key += cum[-1]
+    return date(year, 1, 1) + timedelta(days=(bisect_left(cum, key) - 1))
+
+
 def ply(dat, num):
     """
     Return 'dat' plus 'num' years.
@@ -366,6 +462,31 @@ def plm(dat, num):
     return date(year, month, day)
 
 
+def nleaps(year):
+    """
+    Return number of leap years in the interval [1, 'year'].
+    """
+
+    return year // 4 - year // 100 + year // 400
+
+
+def addones(res, num):
+    """
+    Return 'res' with 1.0 added 'num' times, rounded exactly as the
+    individual additions would be.
+    """
+
+    while num > 0:
+        step = min(num, ceil(ldexp(1., frexp(res)[1]) - res) - 1)
+        if step > 0:
+            res += step
+            num -= step
+        else:
+            res += 1.
+            num -= 1
+    return res
+
+
 def yfactor(beg, end, dconv):
     """
     Return number of years between 'beg' and 'end', using day-count convention 'dconv'.
@@ -384,20 +505,24 @@ def yfactor(beg, end, dconv):
         end_month = end.month
         end_day = end.day
         if dconv == 'ACT/ACT':
+            if beg_year == end_year:
+                num = (end - beg).days
+                return (num / 366) if isleap(beg_year) else (num / 365)
+            head = (date((beg_year + 1), 1, 1) - beg).days
+            tail = (end - date(end_year, 1, 1)).days
             leap = nleap = 0
-            while beg_year < end_year:
-                num = (date((beg_year + 1), 1, 1) - date(beg_year, beg_month, beg_day)).days
-                if isleap(beg_year):
-                    leap += num
-                else:
-                    nleap += num
-                beg_day = beg_month = 1
-                beg_year += 1
-            num = (date(end_year, end_month, end_day) - date(beg_year, beg_month, beg_day)).days
             if isleap(beg_year):
-                leap += num
+                leap += head
+            else:
+                nleap += head
+            if isleap(end_year):
+                leap += tail
             else:
-                nleap += num
+                nleap += tail
+            full = end_year - beg_year - 1
+            nleapyears = nleaps(end_year - 1) - nleaps(beg_year)
+            leap += 366 * nleapyears
+            nleap += 365 * (full - nleapyears)
             return (nleap / 365) + (leap / 366)
         if dconv == 'ACT/365':
             return (end - beg).days / 365
@@ -449,17 +574,19 @@ def mfactor(beg, end, dconv):
         year = beg.year
         month = beg.month
         day = beg.day
-        res = .0
-        while year < end.year or month != end.month:
+        if beg > end:
+            return .0
+        if year == end.year and month == end.month:
+            res = .0
+        else:
             if day == 1:
-                res += 1
+                res = 1.
             else:
                 dim = monthrange(year, month)[1]
-                res += float(dim - day + 1) / dim
-            month += 1
-            if month > 12:
-                month = 1
-                year += 1
+                res = float(dim - day + 1) / dim
+            res = addones(res, (12 * (end.year - year) + end.month - month - 1))
+            year = end.year
+            month = end.month
             day = 1
         res += float(end.day - day + 1) / monthrange(year, month)[1]
         return res
@@ -495,6 +622,22 @@ def mfactor(beg, end, dconv):
         return (360 * (end_year - beg_year) + 30 * (end_month - beg_month) + (end_day - beg_day)) / 30
 
 
+def yfactors(begs, ends, dconv):
+    """
+    Return list of yfactor() results for pairs of 'begs' and 'ends'.
+    """
+
+    return [yfactor(beg, end, dconv) for beg, end in zip(begs, ends)]
+
+
+def mfactors(begs, ends, dconv):
+    """
+    Return list of mfactor() results for pairs of 'begs' and 'ends'.
+    """
+
+    return [mfactor(beg, end, dconv) for beg, end in zip(begs, ends)]
+
+
 def grammar(num, noun):
     """
     Return correct form of plural, 'num noun(s)'.
@@ -767,7 +910,135 @@ def make_pdf(doc, flow, string=None, xml=None):
         canvasmaker=CanvasXML if xml else Canvas)
 
 
-TIMEOUT = 1000
+TIMEOUT = (10, 300)
+
+RETRIES = 3
+
+BACKOFF = 2
+
+RETRY_STATUS = (HTTPStatus.BAD_GATEWAY, HTTPStatus.SERVICE_UNAVAILABLE, HTTPStatus.GATEWAY_TIMEOUT)
+
+POOL_SIZE = 8
+
+RATE_LIMITS = {
+    'infosoud.justice.cz': (3, 3),
+    'infodeska.justice.cz': (2, 2),
+    'isir.justice.cz': (5, 5),
+    'www.nssoud.cz': (1, 2),
+}
+
+DEFAULT_RATE_LIMIT = (10, 10)
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self.mutex = Mutex()
+
+    def wait(self):
+        with self.mutex:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            sleep(delay)
+        return delay
+
+
+class HostStat:
+    """
+    Per-host HTTP counters.
+    """
+
+    def __init__(self):
+        self.requests = self.errors = self.retries = 0
+        self.latency = .0
+
+    def __repr__(self):
+        return 'requests: {:d}, errors: {:d}, retries: {:d}, average latency: {:.3f} s'.format(
+            self.requests, self.errors, self.retries, self.latency / self.requests if self.requests else 0)
+
+
+class HTTPClient(local):
+    """
+    Pooled HTTP client with per-host rate limits, retries and counters.
+    """
+
+    buckets = {}
+    stats = {}
+    mutex = Mutex()
+
+    def __init__(self):
+        super().__init__()
+        self.sessions = {}
+
+    def session(self, host):
+        session = self.sessions.get(host)
+        if session is None:
+            disable_warnings()
+            session = self.sessions[host] = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return session
+
+    def hostinfo(self, host):
+        with self.mutex:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(*RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT))
+                self.stats[host] = HostStat()
+            return self.buckets[host], self.stats[host]
+
+    def request(self, method, url, **kwargs):
+        host = urlsplit(url).hostname or ''
+        bucket, stat = self.hostinfo(host)
+        kwargs.setdefault('timeout', TIMEOUT)
+        attempt = 0
+        while True:
+            bucket.wait()
+            start = time.monotonic()
+            try:
+                res = self.session(host).request(method, url, **kwargs)
+                err = None
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                err = exc
+            with self.mutex:
+                stat.requests += 1
+                stat.latency += time.monotonic() - start
+                if err or res.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+                    stat.errors += 1
+                if attempt < RETRIES and (err or res.status_code in RETRY_STATUS):
+                    stat.retries += 1
+                else:
+                    break
+            LOGGER.debug('Retrying {} {}, attempt {:d}', fmt=(method, url, attempt + 1))
+            sleep(BACKOFF ** attempt)
+            attempt += 1
+        if err:
+            raise err
+        return res
+
+
+HTTP_CLIENT = HTTPClient()
+
+
+def http_stats():
+    """
+    Get snapshot of per-host HTTP counters.
+    """
+
+    with HTTPClient.mutex:
+        return {host: copy(stat) for host, stat in HTTPClient.stats.items()}
+
 
 def get(*args, **kwargs):  # pragma: no cover
     """
@@ -778,10 +1049,7 @@ def get(*args, **kwargs):  # pragma: no cover
         from tests.utils import test_req
         return test_req(False, *args)
     else:
-        if 'timeout' not in kwargs:
-            kwargs['timeout'] = TIMEOUT
-        disable_warnings()
-        return requests.get(*args, **kwargs, verify=False)
+        return HTTP_CLIENT.request('GET', *args, **kwargs, verify=False)
 
 
 def post(*args, **kwargs):  # pragma: no cover
@@ -793,9 +1061,69 @@ def post(*args, **kwargs):  # pragma: no cover
         from tests.utils import test_req
         return test_req(True, *args)
     else:
-        if 'timeout' not in kwargs:
-            kwargs['timeout'] = TIMEOUT
-        return requests.post(*args, **kwargs)
+        return HTTP_CLIENT.request('POST', *args, **kwargs)
+
+
+FETCH_WORKERS = 1 if TEST else 8
+
+HOST_CONCURRENCY = {
+    'infosoud.justice.cz': 3,
+    'infodeska.justice.cz': 2,
+    'isir.justice.cz': 4,
+}
+
+DEFAULT_HOST_CONCURRENCY = 2
+
+HOST_SEMAPHORES = {}
+
+
+def fetch(method, url, data, kwargs):
+    """
+    Fetch single URL within per-host concurrency cap, return None on failure.
+    """
+
+    host = urlsplit(url).hostname or ''
+    with HTTPClient.mutex:
+        if host not in HOST_SEMAPHORES:
+            HOST_SEMAPHORES[host] = BoundedSemaphore(HOST_CONCURRENCY.get(host, DEFAULT_HOST_CONCURRENCY))
+        semaphore = HOST_SEMAPHORES[host]
+    with semaphore:
+        try:
+            if method == 'POST':
+                return post(url, *data, **kwargs)
+            return get(url, **kwargs)
+        except:
+            LOGGER.warning('Failed to fetch URL: "{}"', fmt=(url,), exc_info=True)
+            return None
+
+
+def fetch_all(items, method='GET', **kwargs):
+    """
+    Fetch (key, url[, data]) items concurrently, yield (key, response)
+    as responses arrive, response being None on failure.
+    """
+
+    if FETCH_WORKERS == 1:
+        for key, url, *data in items:
+            yield key, fetch(method, url, data, kwargs)
+        return
+    items = iter(items)
+    pending = {}
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        try:
+            while True:
+                for key, url, *data in items:
+                    pending[executor.submit(fetch, method, url, data, kwargs)] = key
+                    if len(pending) >= 2 * FETCH_WORKERS:
+                        break
+                if not pending:
+                    return
+                done = wait(pending, return_when=FIRST_COMPLETED)[0]
+                for future in done:
+                    yield pending.pop(future), future.result()
+        finally:
+            for future in pending:
+                future.cancel()
 
 
 def sleep(*args, **kwargs):  # pragma: no cover
@@ -875,6 +1203,23 @@ def send_mail(subject, text, recipients):
         LOGGER.warning('Failed to send mail')
 
 
+def send_mass_mail(messages):
+    """
+    Project-wide sender of multiple mails over a single connection.
+    """
+
+    if not messages:
+        return 0
+    try:
+        return mail.send_mass_mail(
+            [(subject, text, 'Server {} <{}>'.format(LOCAL_SUBDOMAIN, LOCAL_EMAIL), recipients)
+             for subject, text, recipients in messages],
+            fail_silently=True)
+    except:  # pragma: no cover
+        LOGGER.warning('Failed to send mail')
+        return 0
+
+
 class Pager:
     """
     General pager.
@@ -1028,6 +1373,150 @@ def icmp(string1, string2):
     return string1 == string2
 
 
+@lru_cache(maxsize=None)
+def fold_char(char):
+
+    return ''.join(x for x in unicode_normalize('NFD', char) if not combining(x))
+
+
+def fold(string):
+    """
+    Lower-case string and strip diacritics, character by character, so that
+    case-insensitive substrings stay substrings.
+    """
+
+    return ''.join(map(fold_char, string.lower()))
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton finding all keys contained in a text.
+    """
+
+    def __init__(self, keys):
+        self.goto = [{}]
+        self.out = [()]
+        self.fail = [0]
+        for key, value in keys:
+            node = 0
+            for char in key:
+                nxt = self.goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][char] = nxt
+                    self.goto.append({})
+                    self.out.append(())
+                    self.fail.append(0)
+                node = nxt
+            self.out[node] += (value,)
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, nxt in self.goto[node].items():
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[nxt] = self.goto[fail].get(char, 0)
+                self.out[nxt] += self.out[self.fail[nxt]]
+                queue.append(nxt)
+
+    def find(self, text):
+        res = set()
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            res.update(self.out[node])
+        return res
+
+
+class TextIndex:
+    """
+    Candidate index for text_opt searches: automaton for 'contains', hash maps
+    for prefix, suffix and exact searches, all on folded text.
+    """
+
+    def __init__(self, items):
+        contains = []
+        self.always = []
+        self.maps = ({}, {}, {}, {})
+        for needle, opt, value in items:
+            key = fold(needle or '')
+            if not key:
+                self.always.append(value)
+            elif opt == 0:
+                contains.append((key, value))
+            else:
+                self.maps[opt].setdefault(key, []).append(value)
+        self.automaton = Automaton(contains)
+        self.prefix_lengths = sorted({len(x) for x in self.maps[1]})
+        self.suffix_lengths = sorted({len(x) for x in self.maps[2]})
+
+    def find(self, haystack):
+        """
+        Get values whose needle may match haystack, a superset of text_opt matches.
+        """
+
+        key = fold(haystack or '')
+        res = self.automaton.find(key)
+        res.update(self.always)
+        res.update(self.maps[3].get(key, ()))
+        for length in self.prefix_lengths:
+            if length > len(key):
+                break
+            res.update(self.maps[1].get(key[:length], ()))
+        for length in self.suffix_lengths:
+            if length > len(key):
+                break
+            res.update(self.maps[2].get(key[-length:], ()))
+        return res
+
+
+class ModelIndex:
+    """
+    In-memory index of model rows, reloaded incrementally when rows are added,
+    updated or deleted; build(rows) turns {id: {field: value}} into the state.
+    """
+
+    def __init__(self, model, fields, build):
+        self.model = model
+        self.fields = fields
+        self.build = build
+        self.version = self.stamp = None
+        self.mutex = Mutex()
+        self.state = build({})
+
+    def refresh(self):
+        """
+        Reload rows added or updated since last refresh, return current state.
+        """
+
+        stat = self.model.objects.aggregate(Count('id'), Max('id'), Max('timestamp_update'))
+        version = (stat['id__count'], stat['id__max'], stat['timestamp_update__max'])
+        if version == self.version:
+            return self.state
+        with self.mutex:
+            if version == self.version:
+                return self.state
+            res = self.model.objects.values_list('id', *self.fields)
+            if self.stamp:
+                current = set(self.model.objects.values_list('id', flat=True))
+                rows = {x: y for x, y in self.state[0].items() if x in current}
+                res = res.filter(timestamp_update__gte=self.stamp)
+            else:
+                rows = {}
+            num = 0
+            for row in res:
+                rows[row[0]] = dict(zip(self.fields, row[1:]))
+                num += 1
+            self.state = self.build(rows)
+            self.version, self.stamp = version, version[2]
+            LOGGER.debug(
+                'Index of {} refreshed, {:d} row(s) reloaded, {:d} total',
+                fmt=(self.model.__name__, num, len(rows)))
+            return self.state
+
+
 def getpreset(key, as_func=False):
     """
     Get current preset.
@@ -1042,36 +1531,217 @@ def getpreset(key, as_func=False):
     return _getpreset if as_func else _getpreset()
 
 
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with per-entry expiry.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.mutex = Mutex()
+
+    def get(self, key):
+        with self.mutex:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] and entry[1] < datetime.now():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, expire):
+        if not self.size:
+            return
+        with self.mutex:
+            self.entries[key] = (value, expire)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.mutex:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.mutex:
+            self.entries.clear()
+
+
+CACHE_SIZE = 0 if TEST else 256
+
+CACHE_LRU = LRUCache(CACHE_SIZE)
+
+CACHE_KEEP = timedelta(days=30)
+
+
+def cache_text(cache):
+    """
+    Get text stored in Cache row.
+    """
+
+    if cache.data is None:
+        return cache.text
+    return decompress(cache.data).decode('utf-8')
+
+
+def setcache(url, txt, lifespan, etag='', last_modified=''):
+    """
+    Store text in both cache tiers.
+    """
+
+    expire = datetime.now() + lifespan if lifespan else None
+    Cache.objects.update_or_create(url=url, defaults={
+        'text': '',
+        'data': compress(txt.encode('utf-8')),
+        'etag': etag,
+        'last_modified': last_modified,
+        'expire': expire,
+    })
+    CACHE_LRU.put(url, txt, expire)
+
+
 def getcache(url, lifespan):
-    Cache.objects.filter(expire__lt=datetime.now()).delete()
-    cache = Cache.objects.filter(url=url)
-    if cache:
-        LOGGER.debug("URL '{}' retrieved from cache".format(url))
-        return cache[0].text.replace('\ufeff', ''), None
-    res = get(url)
+    """
+    Get URL content, using the process tier, the database tier
+    and conditional revalidation of expired entries.
+    """
+
+    txt = CACHE_LRU.get(url)
+    if txt is not None:
+        return txt.replace('\ufeff', ''), None
+    cache = Cache.objects.filter(url=url).first()
+    now = datetime.now()
+    if cache and (not cache.expire or cache.expire >= now):
+        txt = cache_text(cache)
+        CACHE_LRU.put(url, txt, cache.expire)
+        LOGGER.debug("URL '{}' retrieved from cache", fmt=(url,))
+        return txt.replace('\ufeff', ''), None
+    headers = {}
+    if cache and cache.etag:
+        headers['If-None-Match'] = cache.etag
+    if cache and cache.last_modified:
+        headers['If-Modified-Since'] = cache.last_modified
+    res = get(url, headers=headers) if headers else get(url)
+    if cache and res.status_code == HTTPStatus.NOT_MODIFIED:
+        txt = cache_text(cache)
+        expire = now + lifespan if lifespan else None
+        Cache.objects.filter(pk=cache.pk).update(expire=expire)
+        CACHE_LRU.put(url, txt, expire)
+        LOGGER.debug("URL '{}' revalidated", fmt=(url,))
+        return txt.replace('\ufeff', ''), None
     if not res.ok:
         LOGGER.warning('Failed to access URL: "{}"'.format(url))
         return None, 'Chyba při komunikaci se serverem'
     txt = res.text
-    Cache(
-        url=url,
-        text=txt,
-        expire=datetime.now() + lifespan if lifespan else None,
-    ).save()
-    LOGGER.debug("URL '{}' saved in cache".format(url))
+    res_headers = getattr(res, 'headers', {})
+    setcache(url, txt, lifespan, res_headers.get('ETag', ''), res_headers.get('Last-Modified', ''))
+    LOGGER.debug("URL '{}' saved in cache", fmt=(url,))
     return txt.replace('\ufeff', ''), None
 
 
+def precache(urls, lifespan):
+    """
+    Download URLs missing in cache concurrently and store them,
+    return set of URLs available in cache.
+    """
+
+    urls = set(urls)
+    fresh = {url for url in urls if CACHE_LRU.get(url) is not None}
+    if urls - fresh:
+        fresh.update(
+            Cache.objects.filter(url__in=(urls - fresh)).exclude(expire__lt=datetime.now())
+            .values_list('url', flat=True))
+    for url, res in fetch_all((url, url) for url in sorted(urls - fresh)):
+        if res is not None and res.ok:
+            res_headers = getattr(res, 'headers', {})
+            setcache(url, res.text, lifespan, res_headers.get('ETag', ''), res_headers.get('Last-Modified', ''))
+            fresh.add(url)
+    return fresh
+
+
+CHECKPOINTS = LRUCache(0 if TEST else 256)
+
+CHECKPOINT_LIFESPAN = timedelta(hours=1)
+
+
+def chain_hash(hsh, item):
+    """
+    Extend chained content hash with item.
+    """
+
+    return sha1('{}{!r}'.format(hsh, item).encode('utf-8')).hexdigest()
+
+
+def get_checkpoints(key, hashes):
+    """
+    Get stored calculation states matching leading chained hashes.
+    """
+
+    entry = CHECKPOINTS.get(key)
+    if not entry:
+        return []
+    num = 0
+    for old, new in zip(entry[0], hashes):
+        if old != new:
+            break
+        num += 1
+    return entry[1][:num]
+
+
+def put_checkpoints(key, hashes, states):
+    """
+    Store calculation states, one for each chained hash.
+    """
+
+    CHECKPOINTS.put(key, (hashes, states), datetime.now() + CHECKPOINT_LIFESPAN)
+
+
+def sweepcache():
+    """
+    Delete cache entries expired longer than CACHE_KEEP.
+    """
+
+    return Cache.objects.filter(expire__lt=(datetime.now() - CACHE_KEEP)).delete()[0]
+
+
+ASSET_COMPRESS = 512
+
+
+def asset_memo(request):
+    """
+    Get per-request asset memo.
+    """
+
+    memo = getattr(request, '_assets', None)
+    if memo is None:
+        memo = request._assets = {}
+    return memo
+
+
 def getasset(request, asset_id):
-    Asset.objects.filter(expire__lt=datetime.now()).delete()
     sid = request.COOKIES.get('sessionid')
     if not sid:
-        LOGGER.debug("Requested asset '{}' and SID='{}' not found".format(asset_id, sid))
+        LOGGER.debug("Requested asset '{}' and SID='{}' not found", fmt=(asset_id, sid))
         return None
-    asset = Asset.objects.filter(sessionid=sid, assetid=asset_id)
-    data = b64decode(asset[0].data) if asset else None
+    memo = asset_memo(request)
+    now = datetime.now()
+    if asset_id in memo:
+        data, expire = memo[asset_id]
+        if not expire or expire >= now:
+            return data
+    asset = Asset.objects.filter(sessionid=sid, assetid=asset_id).exclude(expire__lt=now).first()
+    if asset:
+        data = bytes(asset.data)
+        if asset.compressed:
+            data = decompress(data)
+        memo[asset_id] = (data, asset.expire)
+    else:
+        data = None
     LOGGER.debug(
-        "Asset '{}' for session '{}' retrieved, length: {:d}".format(asset_id, sid, len(data or '')))
+        "Asset '{}' for session '{}' retrieved, length: {:d}", fmt=(asset_id, sid, len(data or '')))
     return data
 
 
@@ -1079,16 +1749,28 @@ def getasset(request, asset_id):
 def setasset(request, asset_id, data, lifespan):
     sid = request.COOKIES.get('sessionid')
     if not sid:
-        LOGGER.debug("Asset '{}' requested for empty session".format(asset_id))
+        LOGGER.debug("Asset '{}' requested for empty session", fmt=(asset_id,))
         return False
+    expire = datetime.now() + lifespan
+    compressed = len(data) > ASSET_COMPRESS
     Asset.objects.update_or_create(sessionid=sid, assetid=asset_id, defaults={
-        'data': b64encode(data).decode(),
-        'expire': datetime.now() + lifespan,
+        'data': compress(data) if compressed else data,
+        'compressed': compressed,
+        'expire': expire,
     })
-    LOGGER.debug("Asset '{}' for session '{}' stored, length: {:d}".format(asset_id, sid, len(data)))
+    asset_memo(request)[asset_id] = (data, expire)
+    LOGGER.debug("Asset '{}' for session '{}' stored, length: {:d}", fmt=(asset_id, sid, len(data)))
     return True
 
 
+def sweepassets():
+    """
+    Delete expired assets.
+    """
+
+    return Asset.objects.filter(expire__lt=datetime.now()).delete()[0]
+
+
 def adddoc(app, filename, url):
     Doc.objects.update_or_create(app=app, filename=filename, defaults={'url': url})
 
@@ -1099,3 +1781,140 @@ def getdocurl(filename):
         return None
     docs = Doc.objects.filter(app=spl[1], filename=spl[2])
     return docs[0].url if docs.exists() else None
+
+
+LOCK_LEASE = timedelta(minutes=5)
+
+LOCK_HEARTBEAT = 60
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class Lease:
+    """
+    Lease-based lock stored in the Lock table.
+    """
+
+    _held = set()
+    _mutex = Mutex()
+    _heartbeat = None
+    _current = local()
+
+    def __init__(self, name, owner=None):
+        self.name = name
+        self.attached = owner is not None
+        self.owner = owner or '{}:{:d}:{}'.format(gethostname(), getpid(), uuid4().hex[:8])
+        self.lost = False
+
+    def acquire(self):
+        """
+        Acquire the lease, taking over a dead one, return True if successful.
+        """
+
+        try:
+            with atomic():
+                Lock.objects.create(name=self.name, owner=self.owner)
+        except IntegrityError:
+            now = datetime.now()
+            if not Lock.objects.filter(name=self.name, timestamp_update__lt=(now - LOCK_LEASE)).update(
+                    owner=self.owner, timestamp_add=now, timestamp_update=now):
+                return False
+            LOGGER.warning('Expired lock "{}" taken over'.format(self.name))
+        if not TEST:
+            with Lease._mutex:
+                Lease._held.add(self)
+                if not Lease._heartbeat:
+                    Lease._heartbeat = Thread(target=Lease._beat, name='lease-heartbeat', daemon=True)
+                    Lease._heartbeat.start()
+        return True
+
+    def renew(self):
+        """
+        Extend the lease, return False if it has been lost.
+        """
+
+        return bool(Lock.objects.filter(name=self.name, owner=self.owner).update(timestamp_update=datetime.now()))
+
+    def held(self):
+        """
+        Check in the database whether the lease is still held.
+        """
+
+        return Lock.objects.filter(name=self.name, owner=self.owner).exists()
+
+    def release(self):
+        """
+        Release the lease if still held.
+        """
+
+        with Lease._mutex:
+            Lease._held.discard(self)
+        return bool(Lock.objects.filter(name=self.name, owner=self.owner).delete()[0])
+
+    @staticmethod
+    def set_current(lease):
+        """
+        Make lease current for jobs running in this thread.
+        """
+
+        Lease._current.lease = lease
+
+    @staticmethod
+    def get_current():
+        """
+        Get the lease current in this thread, None if there is none.
+        """
+
+        return getattr(Lease._current, 'lease', None)
+
+    @staticmethod
+    def check():
+        """
+        Raise LeaseLost if the lease current in this thread has been lost,
+        leases attached from another process are checked in the database.
+        """
+
+        lease = Lease.get_current()
+        if lease and lease.attached and not lease.lost and not lease.held():
+            lease.lost = True
+        if lease and lease.lost:
+            raise LeaseLost('Lock "{}" lost'.format(lease.name))
+
+    @staticmethod
+    def renew_held():
+        """
+        Renew all leases held by this process, flag the lost ones.
+        """
+
+        with Lease._mutex:
+            held = list(Lease._held)
+        for lease in held:
+            if not lease.renew():
+                LOGGER.warning('Lock "{}" lost'.format(lease.name))
+                lease.lost = True
+                with Lease._mutex:
+                    Lease._held.discard(lease)
+
+    @staticmethod
+    def _beat():
+        while True:
+            time.sleep(LOCK_HEARTBEAT)
+            try:
+                Lease.renew_held()
+            except:
+                LOGGER.error('Lock heartbeat failed', exc_info=True)
+            finally:
+                connection.close()
+
+
+def release_expired_locks():
+    """
+    Delete locks whose holders stopped renewing them.
+    """
+
+    expired = Lock.objects.filter(timestamp_update__lt=(datetime.now() - LOCK_LEASE))
+    for lock in expired:
+        LOGGER.warning('Expired lock "{}" deleted'.format(lock.name))
+    return expired.delete()[0]
@@ -21,6 +21,8 @@
 #
 
 from http import HTTPStatus
+from json import dump
+from math import ceil
 from random import getrandbits, choice
 from datetime import datetime, timedelta
 from platform import python_version
@@ -28,6 +30,7 @@ from os import uname
 from os.path import join, isfile, split, basename, getmtime
 from mimetypes import guess_type
 
+from django.http import HttpResponse
 from django.shortcuts import redirect, get_object_or_404, Http404
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
@@ -42,7 +45,7 @@ from legal.settings import APPS, BASE_DIR
 from legal.common.glob import INERR, LOCAL_SUBDOMAIN, LOCAL_URL, MIN_PWLEN
 from legal.common.utils import send_mail, LOGGER, render, getdocurl
 from legal.common.forms import UserAddForm, LostPwForm
-from legal.common.models import PwResetLink
+from legal.common.models import PwResetLink, JobRun
 
 
 @require_http_methods(('GET',))
@@ -382,18 +385,81 @@ def getappstat():
     return appstat
 
 
+JOBSTAT_DAYS = 7
+
+
+def percentile(data, pct):
+
+    return data[max(ceil(len(data) * pct / 100) - 1, 0)] if data else None
+
+
+def getjobstat():
+
+    runs = {}
+    for name, outcome, duration, wait in JobRun.objects.filter(
+            start__gte=(datetime.now() - timedelta(days=JOBSTAT_DAYS))).values_list(
+                'name', 'outcome', 'duration', 'wait'):
+        runs.setdefault(name, []).append((outcome, duration, wait))
+    jobstat = []
+    for name in sorted(runs):
+        lst = runs[name]
+        durations = sorted(x[1] for x in lst if x[1] is not None)
+        waits = sorted(x[2] for x in lst if x[2] is not None)
+        finished = sum(x[0] != 'running' for x in lst)
+        failed = sum(x[0] == 'failed' for x in lst)
+        jobstat.append(
+            {'name': name,
+             'runs': len(lst),
+             'failed': failed,
+             'failure_rate': (failed / finished) if finished else None,
+             'p50': percentile(durations, 50),
+             'p95': percentile(durations, 95),
+             'total': sum(durations),
+             'wait_p50': percentile(waits, 50),
+             'wait_p95': percentile(waits, 95),
+            })
+    LOGGER.debug('Job statistics combined')
+    return jobstat
+
+
+def fmtsec(val):
+
+    return '–' if val is None else '{:.2f} s'.format(val).replace('.', ',')
+
+
 @require_http_methods(('GET',))
 def stat(request):
 
     LOGGER.debug('Statistics page accessed', request)
+    jobs = [
+        (job['name'],
+         '{:d}× ({:d} chyb), medián {}, p95 {}, celkem {}, čekání p95 {}'.format(
+             job['runs'],
+             job['failed'],
+             fmtsec(job['p50']),
+             fmtsec(job['p95']),
+             fmtsec(job['total']),
+             fmtsec(job['wait_p95'])))
+        for job in getjobstat()]
     return render(
         request,
         'stat.xhtml',
         {'page_title': 'Statistické údaje',
          'apps': getappstat(),
+         'jobs': jobs,
+         'jobstat_days': JOBSTAT_DAYS,
         })
 
 
+@require_http_methods(('GET',))
+def jobstat(request):
+
+    LOGGER.debug('Job statistics requested', request)
+    response = HttpResponse(content_type='application/json; charset=utf-8')
+    dump({'days': JOBSTAT_DAYS, 'jobs': getjobstat()}, response)
+    return response
+
+
 def getuserinfo(user):
 
     res = []
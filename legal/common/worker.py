@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+#
+# common/worker.py
+#
+# Copyright (C) 2011-19 Tomáš Pecina <tomas@pecina.cz>
+#
+# This file is part of legal.pecina.cz, a web-based toolbox for lawyers.
+#
+# This application is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This application is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+import django
+
+
+def setup_worker(databases):
+    """
+    Set up Django in a spawned worker process, using the parent's databases;
+    must not import models, it runs before the app registry is ready.
+    """
+
+    from django.conf import settings
+    for alias, name in databases.items():
+        settings.DATABASES[alias]['NAME'] = name
+    django.setup()
@@ -20,55 +20,65 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from django.contrib.auth.models import User
-
-from legal.common.utils import text_opt, icmp, LOGGER
+from legal.common.utils import LOGGER
 from legal.sir.glob import L2S
 from legal.dir.models import Debtor, Discovered
+from legal.dir.utils import DEBTOR_FIELDS, DEBTOR_INDEX, debtor_match
 
 
-def dir_notice(uid):
+def dir_notices(uids=None):
 
-    text = ''
-    debtors = Discovered.objects.filter(uid=uid, vec__link__isnull=False).order_by('desc', 'id').distinct()
-    if debtors:
-        text = 'Byli nově zaznamenáni tito dlužníci, které sledujete:\n\n'
-        for debtor in debtors:
-            text += ' - {0}, sp. zn. {1} {2.senat:d} INS {2.bc:d}/{2.rocnik:d}\n'.format(
-                    debtor.desc,
-                    L2S[debtor.vec.idOsobyPuvodce],
-                    debtor.vec)
-            text += '   {}\n\n'.format(debtor.vec.link)
-        Discovered.objects.filter(uid=uid, vec__link__isnull=False).delete()
+    notices = {}
+    users = {}
+    debtors = Discovered.objects.filter(vec__link__isnull=False).select_related('uid', 'vec').order_by(
+        'uid', 'desc', 'id')
+    watched = Debtor.objects.filter(notify=True)
+    if uids is not None:
+        debtors = debtors.filter(uid__in=uids)
+        watched = watched.filter(uid__in=uids)
+    for debtor in debtors:
+        uid = debtor.uid_id
+        text = notices.get(uid, 'Byli nově zaznamenáni tito dlužníci, které sledujete:\n\n')
+        text += ' - {0}, sp. zn. {1} {2.senat:d} INS {2.bc:d}/{2.rocnik:d}\n'.format(
+                debtor.desc,
+                L2S[debtor.vec.idOsobyPuvodce],
+                debtor.vec)
+        text += '   {}\n\n'.format(debtor.vec.link)
+        notices[uid] = text
+        users[uid] = debtor.uid
+    if notices:
+        Discovered.objects.filter(id__in=[x.id for x in debtors]).delete()
+    for uid in notices:
         LOGGER.info(
-            'Non-empty notice prepared for user "{}" ({:d})'.format(User.objects.get(pk=uid).username, uid))
-    Debtor.objects.filter(uid=uid).update(notify=False)
-    return text
+            'Non-empty notice prepared for user "{}" ({:d})'.format(users[uid].username, uid))
+    watched.update(notify=False)
+    return notices
+
+
+def dir_notice(uid):
+
+    return dir_notices((uid,)).get(uid, '')
 
 
-def dir_check(osoba, vec):
+def dir_check(items):
 
-    for debtor in Debtor.objects.all():
-        date_birth = osoba.datumNarozeni
-        if date_birth:
-            date_birth = date_birth.date()
-        if ((not debtor.court or debtor.court == osoba.idOsobyPuvodce)
-           and text_opt(debtor.name, osoba.nazevOsoby, debtor.name_opt)
-           and text_opt(debtor.first_name, osoba.jmeno, debtor.first_name_opt)
-           and (not debtor.genid or debtor.genid == osoba.ic)
-           and (not debtor.taxid or icmp(debtor.taxid, osoba.dic))
-           and (not debtor.birthid or debtor.birthid == osoba.rc)
-           and (not debtor.date_birth or debtor.date_birth == date_birth)
-           and (not debtor.year_birth_from or debtor.year_birth_from <= date_birth.year)
-           and (not debtor.year_birth_to or debtor.year_birth_to >= date_birth.year)):
+    items = list(items)
+    found = DEBTOR_INDEX.match([x[0] for x in items])
+    if not found:
+        return
+    vecs = {id(osoba): vec for osoba, vec in items}
+    for debtor in Debtor.objects.filter(id__in=found).select_related('uid'):
+        for osoba in found[debtor.id]:
+            if not debtor_match({x: getattr(debtor, x) for x in DEBTOR_FIELDS}, osoba):
+                continue
             if Discovered.objects.update_or_create(
                     uid_id=debtor.uid_id,
                     desc=debtor.desc,
-                    vec=vec)[1]:
+                    vec=vecs[id(osoba)])[1]:
                 if debtor.uid.email:
                     Debtor.objects.filter(id=debtor.id).update(notify=True)
                 LOGGER.info(
                     'New debtor "{}" detected for user "{}" ({:d})'.format(
                         debtor.desc,
-                        User.objects.get(pk=debtor.uid_id).username,
+                        debtor.uid.username,
                         debtor.uid_id))
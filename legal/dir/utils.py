@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# dir/utils.py
+#
+# Copyright (C) 2011-19 Tomáš Pecina <tomas@pecina.cz>
+#
+# This file is part of legal.pecina.cz, a web-based toolbox for lawyers.
+#
+# This application is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This application is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+from datetime import datetime
+
+from legal.common.utils import ModelIndex, TextIndex, text_opt, icmp
+from legal.dir.models import Debtor
+
+
+DEBTOR_FIELDS = (
+    'court', 'name', 'name_opt', 'first_name', 'first_name_opt', 'genid', 'taxid', 'birthid', 'date_birth',
+    'year_birth_from', 'year_birth_to')
+
+
+def date_birth(osoba):
+
+    dat = osoba.datumNarozeni
+    return dat.date() if isinstance(dat, datetime) else dat
+
+
+def debtor_match(debtor, osoba):
+    """
+    Check if debtor, as a dict of DEBTOR_FIELDS, matches Osoba.
+    """
+
+    dat = date_birth(osoba)
+    return ((not debtor['court'] or debtor['court'] == osoba.idOsobyPuvodce)
+            and text_opt(debtor['name'], osoba.nazevOsoby, debtor['name_opt'])
+            and text_opt(debtor['first_name'], osoba.jmeno, debtor['first_name_opt'])
+            and (not debtor['genid'] or debtor['genid'] == osoba.ic)
+            and (not debtor['taxid'] or icmp(debtor['taxid'], osoba.dic))
+            and (not debtor['birthid'] or debtor['birthid'] == osoba.rc)
+            and (not debtor['date_birth'] or debtor['date_birth'] == dat)
+            and (not debtor['year_birth_from'] or (dat and debtor['year_birth_from'] <= dat.year))
+            and (not debtor['year_birth_to'] or (dat and debtor['year_birth_to'] >= dat.year)))
+
+
+def build_debtor_index(rows):
+
+    genids = {}
+    birthids = {}
+    dates = {}
+    names = []
+    rest = []
+    for did, row in rows.items():
+        if row['genid']:
+            genids.setdefault(row['genid'], []).append(did)
+        elif row['birthid']:
+            birthids.setdefault(row['birthid'], []).append(did)
+        elif row['date_birth']:
+            dates.setdefault(row['date_birth'], []).append(did)
+        elif row['name']:
+            names.append((row['name'], row['name_opt'], did))
+        else:
+            rest.append(did)
+    return rows, genids, birthids, dates, TextIndex(names), rest
+
+
+class DebtorIndex(ModelIndex):
+    """
+    In-memory index of watched debtors, keyed by the most selective criterion
+    of each: IČO, RČ, birth date or name, in this order.
+    """
+
+    def __init__(self):
+        super().__init__(Debtor, DEBTOR_FIELDS, build_debtor_index)
+
+    def match(self, osoby):
+        """
+        Match Osoba objects against watched debtors, return {debtor_id: [osoby]}.
+        """
+
+        rows, genids, birthids, dates, names, rest = self.refresh()
+        res = {}
+        for osoba in osoby:
+            dids = names.find(osoba.nazevOsoby)
+            dids.update(rest)
+            dids.update(genids.get(osoba.ic, ()))
+            dids.update(birthids.get(osoba.rc, ()))
+            dids.update(dates.get(date_birth(osoba), ()))
+            for did in dids:
+                if debtor_match(rows[did], osoba):
+                    res.setdefault(did, []).append(osoba)
+        return res
+
+
+DEBTOR_INDEX = DebtorIndex()
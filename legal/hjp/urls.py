@@ -23,7 +23,7 @@
 from django.conf.urls import url
 
 from legal.common.views import genrender
-from legal.hjp.views import mainpage, transform, transdel
+from legal.hjp.views import mainpage, transform, transdel, api
 
 
 urlpatterns = [
@@ -37,4 +37,5 @@ urlpatterns = [
             'template': 'hjp_transdeleted.xhtml',
             'page_title': 'Smazání transakce'},
         name='transdeleted'),
+    url(r'^api/$', api, name='api'),
 ]
@@ -33,6 +33,8 @@ from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.colors import black
 from django.shortcuts import redirect, HttpResponse, Http404
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.apps import apps
@@ -40,7 +42,8 @@ from django.apps import apps
 from legal.common.glob import YDCONVS, MDCONVS, LIM, INERR, LOCAL_SUBDOMAIN, LOCAL_URL, ASSET_EXP
 from legal.common.utils import (
     getbutton, yfactor, mfactor, ODP, famt, dispcurr, xml_decorate, xml_escape, xml_unescape, normfl, LocalFloat,
-    get_xml, new_xml, iso2date, register_fonts, make_pdf, LOGGER, render, getasset, setasset)
+    get_xml, new_xml, iso2date, register_fonts, make_pdf, LOGGER, render, getasset, setasset, chain_hash,
+    get_checkpoints, put_checkpoints)
 from legal.common.views import error
 from legal.cnb.utils import get_mpi_rate
 from legal.hjp.forms import MainForm, TransForm
@@ -230,10 +233,6 @@ def getrows(debt):
     trs.sort(key=lambda x: x.transaction_type, reverse=True)
     trs.sort(key=lambda x: x.date)
 
-    rows = []
-    principal = interest = 0
-    cud = None
-    err = False
     for trn in trs:
         if trn.transaction_type == 'debit':
             default_date = trn.date + ODP
@@ -242,7 +241,24 @@ def getrows(debt):
         default_date = None
     debt.default_date = default_date
 
+    ckey = hsh = chain_hash(
+        APP, (sorted(vars(debt.interest).items()), debt.rounding, debt.currency, default_date))
+    hashes = []
     for trn in trs:
+        hsh = chain_hash(hsh, sorted(vars(trn).items()))
+        hashes.append(hsh)
+    states = get_checkpoints(ckey, hashes)
+    if states:
+        principal, interest, cud, err, rates, (rows, num) = states[-1]
+        rows = rows[:num]
+        debt.rates.update(rates)
+    else:
+        rows = []
+        principal = interest = 0
+        cud = None
+        err = False
+
+    for trn in trs[len(states):]:
         row = {}
         amt = round(trn.amount, debt.rounding) if hasattr(trn, 'amount') else 0
         row['id'] = trn.id
@@ -306,8 +322,11 @@ def getrows(debt):
 
         row['err'] = err
         rows.append(row)
+        if not err:
+            states.append((principal, interest, cud, err, dict(debt.rates), (rows, len(rows))))
 
-    return rows
+    put_checkpoints(ckey, hashes, states)
+    return [dict(row) for row in rows]
 
 
 def getrows4(debt):
@@ -333,13 +352,25 @@ def getrows4(debt):
         default_date = None
     debt.default_date = default_date
 
-    rows = []
+    ckey = hsh = chain_hash(APP, ('cust4', debt.rounding, debt.currency, default_date))
+    hashes = []
+    for idx, trn in enumerate(trs):
+        hsh = chain_hash(hsh, sorted(vars(trn).items()))
+        if idx + 1 == len(trs) or trs[idx + 1].date != trn.date:
+            hashes.append(hsh)
+    states = get_checkpoints(ckey, hashes)
     err = ''
-    principal = interest = 0
-    currd = default_date
-    normi = lasti = 0
-    dat = trs[0].date
-    idx = 0
+    if states:
+        idx, dat, principal, interest, currd, normi, lasti, (rows, num) = states[-1]
+        rows = rows[:num]
+        dat += ODP
+    else:
+        rows = []
+        principal = interest = 0
+        currd = default_date
+        normi = lasti = 0
+        dat = trs[0].date
+        idx = 0
     while dat <= trs[-1].date:
         if dat == currd:
             lasti = 0
@@ -414,9 +445,464 @@ def getrows4(debt):
             rows.append(row)
             idx += 1
 
+        if idx and trs[idx - 1].date == dat:
+            states.append((idx, dat, principal, interest, currd, normi, lasti, (rows, len(rows))))
         dat += ODP
 
-    return rows
+    put_checkpoints(ckey, hashes, states)
+    return [dict(row) for row in rows]
+
+
+def to_csv(rows, outfile):
+
+    writer = csv.writer(outfile)
+    writer.writerow(
+        ('Datum',
+         'Popis',
+         'Přednost',
+         'Pohyb',
+         'Předchozí zůstatek/jistina',
+         'Předchozí zůstatek/úrok',
+         'Předchozí zůstatek/celkem',
+         'Započteno/jistina',
+         'Započteno/úrok',
+         'Nový zůstatek/jistina',
+         'Nový zůstatek/úrok',
+         'Nový zůstatek/celkem'))
+    for row in rows:
+        writer.writerow(
+            (row['date'].isoformat(),
+             row['description'],
+             row.get('rep', ''),
+             '{:.2f}'.format(normfl(row['change'])),
+             '{:.2f}'.format(normfl(row['pre_principal'])),
+             '{:.2f}'.format(normfl(row['pre_interest'])),
+             '{:.2f}'.format(normfl(row['pre_total'])),
+             '{:.2f}'.format(normfl(row['change_principal'])),
+             '{:.2f}'.format(normfl(row['change_interest'])),
+             '{:.2f}'.format(normfl(row['post_principal'])),
+             '{:.2f}'.format(normfl(row['post_interest'])),
+             '{:.2f}'.format(normfl(row['post_total']))))
+
+
+EL = ['']
+
+
+def to_pdf(debt, rows, outfile):
+
+    def lfamt(amt):
+        return '{} {}'.format(
+            famt(round(amt, debt.rounding) if debt.rounding
+            else int(round(amt))).replace('-', '−'), dispcurr(debt.currency))
+
+    register_fonts()
+
+    style1 = ParagraphStyle(
+        name='STYLE1',
+        fontName='Bookman',
+        fontSize=8,
+        leading=9,
+        alignment=TA_RIGHT,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style2 = ParagraphStyle(
+        name='STYLE2',
+        fontName='BookmanB',
+        fontSize=10,
+        leading=11,
+        alignment=TA_RIGHT,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style4 = ParagraphStyle(
+        name='STYLE4',
+        fontName='BookmanB',
+        fontSize=8,
+        leading=10,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style12 = ParagraphStyle(
+        name='STYLE12',
+        fontName='BookmanI',
+        fontSize=8,
+        leading=9,
+        spaceBefore=4,
+        spaceAfter=5,
+        leftIndent=8,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style13 = ParagraphStyle(
+        name='STYLE13',
+        fontName='Bookman',
+        fontSize=8,
+        leading=12,
+        alignment=TA_CENTER,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style14 = ParagraphStyle(
+        name='STYLE14',
+        fontName='BookmanB',
+        fontSize=8,
+        leading=12,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style15 = ParagraphStyle(
+        name='STYLE15',
+        fontName='BookmanB',
+        fontSize=8,
+        leading=10,
+        alignment=TA_CENTER,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style16 = ParagraphStyle(
+        name='STYLE16',
+        fontName='Bookman',
+        fontSize=8,
+        leading=10,
+        alignment=TA_CENTER,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style17 = ParagraphStyle(
+        name='STYLE17',
+        fontName='BookmanB',
+        fontSize=8,
+        leading=10,
+        alignment=TA_RIGHT,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style18 = ParagraphStyle(
+        name='STYLE18',
+        fontName='Bookman',
+        fontSize=8,
+        leading=10,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style19 = ParagraphStyle(
+        name='STYLE19',
+        fontName='Bookman',
+        fontSize=8,
+        leading=10,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style20 = ParagraphStyle(
+        name='STYLE20',
+        fontName='Bookman',
+        fontSize=8,
+        leading=10,
+        leftIndent=8,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style21 = ParagraphStyle(
+        name='STYLE21',
+        fontName='Bookman',
+        fontSize=8,
+        leading=10,
+        leftIndent=16,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style22 = ParagraphStyle(
+        name='STYLE22',
+        fontName='BookmanI',
+        fontSize=8,
+        leading=10,
+        alignment=TA_CENTER,
+        allowWidows=False,
+        allowOrphans=False)
+
+    doc1 = (([Paragraph('Historie peněžité pohledávky'.upper(), style1)],),)
+    if debt.title:
+        doc1[0][0].append(Paragraph(escape(debt.title), style2))
+    table1 = Table(doc1, colWidths=(483.3,))
+    table1.setStyle(
+        TableStyle((
+            ('LINEABOVE', (0, 0), (0, -1), 1.0, black),
+            ('TOPPADDING', (0, 0), (0, -1), 2),
+            ('LINEBELOW', (-1, 0), (-1, -1), 1.0, black),
+            ('BOTTOMPADDING', (-1, 0), (-1, -1), 3),
+            ('LEFTPADDING', (0, 0), (-1, -1), 2),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+        )))
+    flow = [table1, Spacer(0, 36)]
+
+    wid = 483.3
+    widl = 8
+    widr = 8
+    widg = 12
+    widf = widc = (wid - widl - widr - (widg * 2)) / 6
+    cwid = (
+        (widl,) + ((widc / 5,) * 5) + ((widf / 5,) * 5) + (widg,) + ((widc / 5,) * 5)
+        + ((widf / 5,) * 5) + (widg,) + ((widc / 5,) * 5) + ((widf / 5,) * 5) + (widr,))
+
+    thickness = .5
+
+    res = [Paragraph(('<b>Měna:</b> {}'.format(debt.currency)),
+        style19)]
+    if hasattr(debt, 'default_date') and debt.default_date:
+        res.append(Paragraph('<b>První den prodlení:</b> {:%d.%m.%Y}'.format(debt.default_date), style19))
+    interest2 = None
+    interest3 = []
+    if debt.interest.model == 'none':
+        interest1 = 'bez úroku'
+    elif debt.interest.model == 'fixed':
+        interest1 = 'pevnou částkou {}'.format(lfamt(debt.interest.fixed_amount))
+    elif debt.interest.model == 'per_annum':
+        interest1 = (
+            'pevnou sazbou {0.rate:n} % <i>p. a.</i>, konvence pro počítání dnů: {0.day_count_convention}'
+            .format(debt.interest))
+    elif debt.interest.model == 'per_mensem':
+        interest1 = (
+            'pevnou sazbou {0.rate:n} % <i>p. m.</i>, konvence pro počítání dnů: {0.day_count_convention}'
+            .format(debt.interest))
+    elif debt.interest.model == 'per_diem':
+        interest1 = 'pevnou sazbou {:n} ‰ <i>p. d.</i>'.format(debt.interest.rate)
+    elif debt.interest.model == 'cust1':
+        interest1 = 'úrok z prodlení podle nařízení č. 142/1994 Sb. (účinnost do 27.04.2005)'
+        if debt.rates:
+            rate = debt.rates.popitem()
+            interest2 = (
+                'Diskontní sazba ČNB ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
+                .format(rate[0], LocalFloat(rate[1])))
+    elif debt.interest.model == 'cust2':
+        interest1 = 'úrok z prodlení podle nařízení č. 142/1994 Sb. (účinnost od 28.04.2005 do 30.06.2010)'
+        if len(debt.rates) == 1:
+            rate = debt.rates.popitem()
+            interest2 = (
+                'Použita 2T repo sazba ČNB ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
+                .format(rate[0], LocalFloat(rate[1])))
+        elif len(debt.rates) > 1:
+            interest2 = 'Použity následující 2T repo sazby ČNB:'
+            for dat in sorted(debt.rates.keys()):
+                interest3.append(
+                    '– ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'.format(dat, LocalFloat(debt.rates[dat])))
+    elif debt.interest.model == 'cust3':
+        interest1 = 'úrok z prodlení podle nařízení č. 142/1994 Sb. (účinnost od 01.07.2010 do 30.06.2013)'
+        if debt.rates:
+            rate = debt.rates.popitem()
+            interest2 = (
+                '2T repo sazba ČNB ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
+                .format(rate[0], LocalFloat(rate[1])))
+    elif debt.interest.model == 'cust5':
+        interest1 = 'úrok z prodlení podle nařízení č. 142/1994 Sb. (účinnost od 01.07.2013 do 31.12.2013)'
+        if debt.rates:
+            rate = debt.rates.popitem()
+            interest2 = (
+                '2T repo sazba ČNB ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
+                .format(rate[0], LocalFloat(rate[1])))
+    elif debt.interest.model == 'cust6':
+        interest1 = 'úrok z prodlení podle nařízení č. 351/2013 Sb.'
+        if debt.rates:
+            rate = debt.rates.popitem()
+            interest2 = (
+                '2T repo sazba ČNB ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
+                .format(rate[0], LocalFloat(rate[1])))
+    else:
+        interest1 = 'poplatek z prodlení podle nařízení č. 142/1994 Sb.'
+        if debt.currency != 'CZK':
+            interest2 = (
+                '<i>(minimální sazba 25 Kč za každý započatý měsíc prodlení není pro jinou měnu než CZK '
+                'podporována)</i>')
+
+    res.append(Paragraph('<b>Úročení:</b> {}'.format(interest1), style19))
+    if interest2:
+        res.append(Paragraph(interest2, style20))
+    for key in interest3:
+        res.append(Paragraph(key, style21))
+    res.append(Spacer(0, 50))
+    flow.extend(res)
+
+    bst = (
+        ('SPAN', (0, 0), (4, 0)),
+        ('SPAN', (5, 0), (33, 0)),
+        ('SPAN', (1, 1), (10, 1)),
+        ('SPAN', (12, 1), (21, 1)),
+        ('SPAN', (23, 1), (32, 1)),
+        ('SPAN', (1, 2), (3, 2)),
+        ('SPAN', (4, 2), (10, 2)),
+        ('SPAN', (12, 2), (14, 2)),
+        ('SPAN', (15, 2), (21, 2)),
+        ('SPAN', (23, 2), (25, 2)),
+        ('SPAN', (26, 2), (32, 2)),
+        ('SPAN', (1, 3), (3, 3)),
+        ('SPAN', (4, 3), (10, 3)),
+        ('SPAN', (12, 3), (14, 3)),
+        ('SPAN', (15, 3), (21, 3)),
+        ('SPAN', (23, 3), (25, 3)),
+        ('SPAN', (26, 3), (32, 3)),
+        ('SPAN', (1, 4), (3, 4)),
+        ('SPAN', (4, 4), (10, 4)),
+        ('SPAN', (12, 4), (14, 4)),
+        ('SPAN', (15, 4), (21, 4)),
+        ('SPAN', (23, 4), (25, 4)),
+        ('SPAN', (26, 4), (32, 4)),
+        ('LINEABOVE', (0, 0), (-1, 0), 1, black),
+        ('LINEBELOW', (0, 0), (-1, 0), 1, black),
+        ('LINEBEFORE', (0, 0), (0, -1), 1, black),
+        ('LINEAFTER', (-1, 0), (-1, -1), 1, black),
+        ('LINEBELOW', (0, -1), (-1, -1), 1, black),
+        ('BACKGROUND', (0, 0), (-1, 0), '#e8e8e8'),
+        ('VALIGN', (0, 0), (-1, 0), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, 0), 0),
+        ('LEFTPADDING', (0, 1), (-1, -1), 3),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 3),
+        ('RIGHTPADDING', (4, 2), (10, 4), 0),
+        ('RIGHTPADDING', (15, 2), (21, 4), 0),
+        ('RIGHTPADDING', (26, 2), (32, 4), 0),
+        ('TOPPADDING', (0, 0), (-1, 0), 2.5),
+        ('TOPPADDING', (0, 1), (-1, 1), 10),
+        ('TOPPADDING', (0, 2), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), .5),
+        ('BOTTOMPADDING', (0, 1), (-1, 1), 1.5),
+        ('BOTTOMPADDING', (0, 2), (-1, 4), 0),
+        ('BOTTOMPADDING', (0, -1), (-1, -1), 18),
+    )
+
+    ast = {
+        'debit': (
+            ('LINEBELOW', (1, 1), (10, 1), thickness, black),
+            ('LINEAFTER', (3, 2), (3, 2), thickness, black),
+            ('LINEBELOW', (12, 1), (21, 1), thickness, black),
+            ('LINEAFTER', (14, 2), (14, 4), thickness, black),
+            ('LINEBELOW', (23, 1), (32, 1), thickness, black),
+            ('LINEAFTER', (25, 2), (25, 4), thickness, black)),
+        'credit': (
+            ('LINEBELOW', (1, 1), (10, 1), thickness, black),
+            ('LINEAFTER', (3, 2), (3, 4), thickness, black),
+            ('LINEBELOW', (12, 1), (21, 1), thickness, black),
+            ('LINEAFTER', (14, 2), (14, 4), thickness, black),
+            ('LINEBELOW', (23, 1), (32, 1), thickness, black),
+            ('LINEAFTER', (25, 2), (25, 4), thickness, black)),
+        'balance': (
+            ('LINEBELOW', (23, 1), (32, 1), thickness, black),
+            ('LINEAFTER', (25, 2), (25, 4), thickness, black))
+    }
+
+    for row in rows:
+        if row['err']:
+            flow.extend(
+                [Spacer(0, 20),
+                 Paragraph(
+                     '(pro další transakce nejsou k disposici'
+                     ' data, při výpočtu došlo k chybě)', style22)])
+            break
+        trt = row['trt']
+        doc3 = []
+        temp1 = [Paragraph('{:%d.%m.%Y}'.format(row['date']), style13)] + (EL * 4)
+        temp2 = [Paragraph(escape(row['description']).upper(), style14)] + (EL * 28)
+        doc3.extend([temp1 + temp2])
+
+        if trt == 'debit':
+            temp = (
+                EL + [Paragraph('Závazek', style15)] + (EL * 10)
+                + [Paragraph('Předchozí zůstatek', style15)] + (EL * 10)
+                + [Paragraph('Nový zůstatek', style15), ''])
+        elif trt == 'credit':
+            temp = (
+                EL + [Paragraph('<b>Splátka</b> (přednost {}'.format(row['rep']), style16)] + (EL * 10)
+                + [Paragraph('Předchozí zůstatek', style15)] + (EL * 10)
+                + [Paragraph('Nový zůstatek', style15), ''])
+        else:
+            temp = (EL * 23) + [Paragraph('Zůstatek', style15), '']
+        doc3.extend([temp])
+
+        if trt != 'balance':
+            temp = (
+                EL + [Paragraph('Částka', style17)] + (EL * 2)
+                + [Paragraph(lfamt((row['change'] if (trt == 'debit') else (-row['change']))), style18)]
+                + (EL * 7) + [Paragraph('Jistina', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['pre_principal']), style18)] + (EL * 7)
+                + [Paragraph('Jistina', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['post_principal']), style18)] + (EL * 7))
+        else:
+            temp = (
+                (EL * 23) + [Paragraph('Jistina', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['post_principal']), style18)] + (EL * 7))
+        doc3.extend([temp])
+
+        if trt == 'debit':
+            temp = (
+                (EL * 12) + [Paragraph('Úrok', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['pre_interest']), style18)] + (EL * 7)
+                + [Paragraph('Úrok', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['post_interest']), style18)] + (EL * 7))
+        elif trt == 'credit':
+            temp = (
+                EL + [Paragraph('Jistina', style17)] + (EL * 2)
+                + [Paragraph(lfamt(-row['change_principal']), style18)] + (EL * 7)
+                + [Paragraph('Úrok', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['pre_interest']), style18)] + (EL * 7)
+                + [Paragraph('Úrok', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['post_interest']), style18)] + (EL * 7))
+        else:
+            temp = (
+                (EL * 23) + [Paragraph('Úrok', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['post_interest']), style18)] + (EL * 7))
+        doc3.extend([temp])
+
+        if trt == 'debit':
+            temp = (
+                (EL * 12) + [Paragraph('Celkem', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['pre_total']), style18)] + (EL * 7)
+                + [Paragraph('Celkem', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['post_total']), style18)] + (EL * 7))
+        elif trt == 'credit':
+            temp = (
+                EL + [Paragraph('Úrok', style17)] + (EL * 2)
+                + [Paragraph(lfamt(-row['change_interest']), style18)] + (EL * 7)
+                + [Paragraph('Celkem', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['pre_total']), style18)] + (EL * 7)
+                + [Paragraph('Celkem', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['post_total']), style18)] + (EL * 7))
+        else:
+            temp = (
+                (EL * 23) + [Paragraph('Celkem', style17)] + (EL * 2)
+                + [Paragraph(lfamt(row['post_total']), style18)] + (EL * 7))
+        doc3.extend([temp])
+
+        temp = EL * 34
+        doc3.extend([temp])
+
+        table3 = Table(doc3, colWidths=cwid)
+        table3.setStyle(TableStyle(bst + ast[trt]))
+        flow.append(KeepTogether(table3))
+
+    if debt.note:
+        flow.append(Spacer(0, 24))
+        temp = [Paragraph('Poznámka:'.upper(), style4)]
+        for line in filter(bool, debt.note.strip().split('\n')):
+            temp.append(Paragraph(escape(line), style12))
+        flow.append(KeepTogether(temp[:2]))
+        if len(temp) > 2:
+            flow.extend(temp[2:])
+    temp = BytesIO()
+    auth = '{} V{}'.format(APP.upper(), APPVERSION)
+    doc = SimpleDocTemplate(
+        temp,
+        pagesize=A4,
+        title='Historie peněžité pohledávky',
+        author=auth,
+        leftMargin=64,
+        rightMargin=48,
+        topMargin=48,
+        bottomMargin=96,
+        )
+    make_pdf(
+        doc,
+        flow,
+        string=auth,
+        xml=to_xml(debt))
+    outfile.write(temp.getvalue())
 
 
 def to_xml(debt):
@@ -537,9 +1023,6 @@ def from_xml(dat):
     return debt, None
 
 
-EL = ['']
-
-
 @require_http_methods(('GET', 'POST'))
 @login_required
 def mainpage(request):
@@ -555,11 +1038,6 @@ def mainpage(request):
             return '<td class="cr{}">{}</td>'.format(suf, famt(amt))
         return '<td class="dr{}">{}</td>'.format(suf, famt(-amt))
 
-    def lfamt(amt):
-        return '{} {}'.format(
-            famt(round(amt, debt.rounding) if debt.rounding
-            else int(round(amt))).replace('-', '−'), dispcurr(debt.currency))
-
     err_message = ''
     rows_err = False
 
@@ -667,448 +1145,13 @@ def mainpage(request):
             if button == 'csv' and not rows_err:
                 response = HttpResponse(content_type='text/csv; charset=utf-8')
                 response['Content-Disposition'] = 'attachment; filename=Pohledavka.csv'
-                writer = csv.writer(response)
-                writer.writerow(
-                    ('Datum',
-                     'Popis',
-                     'Přednost',
-                     'Pohyb',
-                     'Předchozí zůstatek/jistina',
-                     'Předchozí zůstatek/úrok',
-                     'Předchozí zůstatek/celkem',
-                     'Započteno/jistina',
-                     'Započteno/úrok',
-                     'Nový zůstatek/jistina',
-                     'Nový zůstatek/úrok',
-                     'Nový zůstatek/celkem'))
-                for row in rows:
-                    writer.writerow(
-                        (row['date'].isoformat(),
-                         row['description'],
-                         row.get('rep', ''),
-                         '{:.2f}'.format(normfl(row['change'])),
-                         '{:.2f}'.format(normfl(row['pre_principal'])),
-                         '{:.2f}'.format(normfl(row['pre_interest'])),
-                         '{:.2f}'.format(normfl(row['pre_total'])),
-                         '{:.2f}'.format(normfl(row['change_principal'])),
-                         '{:.2f}'.format(normfl(row['change_interest'])),
-                         '{:.2f}'.format(normfl(row['post_principal'])),
-                         '{:.2f}'.format(normfl(row['post_interest'])),
-                         '{:.2f}'.format(normfl(row['post_total']))))
+                to_csv(rows, response)
                 return response
 
             if button == 'pdf':
-
-                register_fonts()
-
-                style1 = ParagraphStyle(
-                    name='STYLE1',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=9,
-                    alignment=TA_RIGHT,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style2 = ParagraphStyle(
-                    name='STYLE2',
-                    fontName='BookmanB',
-                    fontSize=10,
-                    leading=11,
-                    alignment=TA_RIGHT,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style4 = ParagraphStyle(
-                    name='STYLE4',
-                    fontName='BookmanB',
-                    fontSize=8,
-                    leading=10,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style12 = ParagraphStyle(
-                    name='STYLE12',
-                    fontName='BookmanI',
-                    fontSize=8,
-                    leading=9,
-                    spaceBefore=4,
-                    spaceAfter=5,
-                    leftIndent=8,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style13 = ParagraphStyle(
-                    name='STYLE13',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=12,
-                    alignment=TA_CENTER,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style14 = ParagraphStyle(
-                    name='STYLE14',
-                    fontName='BookmanB',
-                    fontSize=8,
-                    leading=12,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style15 = ParagraphStyle(
-                    name='STYLE15',
-                    fontName='BookmanB',
-                    fontSize=8,
-                    leading=10,
-                    alignment=TA_CENTER,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style16 = ParagraphStyle(
-                    name='STYLE16',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=10,
-                    alignment=TA_CENTER,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style17 = ParagraphStyle(
-                    name='STYLE17',
-                    fontName='BookmanB',
-                    fontSize=8,
-                    leading=10,
-                    alignment=TA_RIGHT,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style18 = ParagraphStyle(
-                    name='STYLE18',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=10,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style19 = ParagraphStyle(
-                    name='STYLE19',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=10,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style20 = ParagraphStyle(
-                    name='STYLE20',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=10,
-                    leftIndent=8,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style21 = ParagraphStyle(
-                    name='STYLE21',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=10,
-                    leftIndent=16,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style22 = ParagraphStyle(
-                    name='STYLE22',
-                    fontName='BookmanI',
-                    fontSize=8,
-                    leading=10,
-                    alignment=TA_CENTER,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                doc1 = (([Paragraph('Historie peněžité pohledávky'.upper(), style1)],),)
-                if debt.title:
-                    doc1[0][0].append(Paragraph(escape(debt.title), style2))
-                table1 = Table(doc1, colWidths=(483.3,))
-                table1.setStyle(
-                    TableStyle((
-                        ('LINEABOVE', (0, 0), (0, -1), 1.0, black),
-                        ('TOPPADDING', (0, 0), (0, -1), 2),
-                        ('LINEBELOW', (-1, 0), (-1, -1), 1.0, black),
-                        ('BOTTOMPADDING', (-1, 0), (-1, -1), 3),
-                        ('LEFTPADDING', (0, 0), (-1, -1), 2),
-                        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
-                    )))
-                flow = [table1, Spacer(0, 36)]
-
-                wid = 483.3
-                widl = 8
-                widr = 8
-                widg = 12
-                widf = widc = (wid - widl - widr - (widg * 2)) / 6
-                cwid = (
-                    (widl,) + ((widc / 5,) * 5) + ((widf / 5,) * 5) + (widg,) + ((widc / 5,) * 5)
-                    + ((widf / 5,) * 5) + (widg,) + ((widc / 5,) * 5) + ((widf / 5,) * 5) + (widr,))
-
-                thickness = .5
-
-                res = [Paragraph(('<b>Měna:</b> {}'.format(debt.currency)),
-                    style19)]
-                if hasattr(debt, 'default_date') and debt.default_date:
-                    res.append(Paragraph('<b>První den prodlení:</b> {:%d.%m.%Y}'.format(debt.default_date), style19))
-                interest2 = None
-                interest3 = []
-                if debt.interest.model == 'none':
-                    interest1 = 'bez úroku'
-                elif debt.interest.model == 'fixed':
-                    interest1 = 'pevnou částkou {}'.format(lfamt(debt.interest.fixed_amount))
-                elif debt.interest.model == 'per_annum':
-                    interest1 = (
-                        'pevnou sazbou {0.rate:n} % <i>p. a.</i>, konvence pro počítání dnů: {0.day_count_convention}'
-                        .format(debt.interest))
-                elif debt.interest.model == 'per_mensem':
-                    interest1 = (
-                        'pevnou sazbou {0.rate:n} % <i>p. m.</i>, konvence pro počítání dnů: {0.day_count_convention}'
-                        .format(debt.interest))
-                elif debt.interest.model == 'per_diem':
-                    interest1 = 'pevnou sazbou {:n} ‰ <i>p. d.</i>'.format(debt.interest.rate)
-                elif debt.interest.model == 'cust1':
-                    interest1 = 'úrok z prodlení podle nařízení č. 142/1994 Sb. (účinnost do 27.04.2005)'
-                    if debt.rates:
-                        rate = debt.rates.popitem()
-                        interest2 = (
-                            'Diskontní sazba ČNB ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
-                            .format(rate[0], LocalFloat(rate[1])))
-                elif debt.interest.model == 'cust2':
-                    interest1 = 'úrok z prodlení podle nařízení č. 142/1994 Sb. (účinnost od 28.04.2005 do 30.06.2010)'
-                    if len(debt.rates) == 1:
-                        rate = debt.rates.popitem()
-                        interest2 = (
-                            'Použita 2T repo sazba ČNB ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
-                            .format(rate[0], LocalFloat(rate[1])))
-                    elif len(debt.rates) > 1:
-                        interest2 = 'Použity následující 2T repo sazby ČNB:'
-                        for dat in sorted(debt.rates.keys()):
-                            interest3.append(
-                                '– ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'.format(dat, LocalFloat(debt.rates[dat])))
-                elif debt.interest.model == 'cust3':
-                    interest1 = 'úrok z prodlení podle nařízení č. 142/1994 Sb. (účinnost od 01.07.2010 do 30.06.2013)'
-                    if debt.rates:
-                        rate = debt.rates.popitem()
-                        interest2 = (
-                            '2T repo sazba ČNB ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
-                            .format(rate[0], LocalFloat(rate[1])))
-                elif debt.interest.model == 'cust5':
-                    interest1 = 'úrok z prodlení podle nařízení č. 142/1994 Sb. (účinnost od 01.07.2013 do 31.12.2013)'
-                    if debt.rates:
-                        rate = debt.rates.popitem()
-                        interest2 = (
-                            '2T repo sazba ČNB ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
-                            .format(rate[0], LocalFloat(rate[1])))
-                elif debt.interest.model == 'cust6':
-                    interest1 = 'úrok z prodlení podle nařízení č. 351/2013 Sb.'
-                    if debt.rates:
-                        rate = debt.rates.popitem()
-                        interest2 = (
-                            '2T repo sazba ČNB ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
-                            .format(rate[0], LocalFloat(rate[1])))
-                else:
-                    interest1 = 'poplatek z prodlení podle nařízení č. 142/1994 Sb.'
-                    if debt.currency != 'CZK':
-                        interest2 = (
-                            '<i>(minimální sazba 25 Kč za každý započatý měsíc prodlení není pro jinou měnu než CZK '
-                            'podporována)</i>')
-
-                res.append(Paragraph('<b>Úročení:</b> {}'.format(interest1), style19))
-                if interest2:
-                    res.append(Paragraph(interest2, style20))
-                for key in interest3:
-                    res.append(Paragraph(key, style21))
-                res.append(Spacer(0, 50))
-                flow.extend(res)
-
-                bst = (
-                    ('SPAN', (0, 0), (4, 0)),
-                    ('SPAN', (5, 0), (33, 0)),
-                    ('SPAN', (1, 1), (10, 1)),
-                    ('SPAN', (12, 1), (21, 1)),
-                    ('SPAN', (23, 1), (32, 1)),
-                    ('SPAN', (1, 2), (3, 2)),
-                    ('SPAN', (4, 2), (10, 2)),
-                    ('SPAN', (12, 2), (14, 2)),
-                    ('SPAN', (15, 2), (21, 2)),
-                    ('SPAN', (23, 2), (25, 2)),
-                    ('SPAN', (26, 2), (32, 2)),
-                    ('SPAN', (1, 3), (3, 3)),
-                    ('SPAN', (4, 3), (10, 3)),
-                    ('SPAN', (12, 3), (14, 3)),
-                    ('SPAN', (15, 3), (21, 3)),
-                    ('SPAN', (23, 3), (25, 3)),
-                    ('SPAN', (26, 3), (32, 3)),
-                    ('SPAN', (1, 4), (3, 4)),
-                    ('SPAN', (4, 4), (10, 4)),
-                    ('SPAN', (12, 4), (14, 4)),
-                    ('SPAN', (15, 4), (21, 4)),
-                    ('SPAN', (23, 4), (25, 4)),
-                    ('SPAN', (26, 4), (32, 4)),
-                    ('LINEABOVE', (0, 0), (-1, 0), 1, black),
-                    ('LINEBELOW', (0, 0), (-1, 0), 1, black),
-                    ('LINEBEFORE', (0, 0), (0, -1), 1, black),
-                    ('LINEAFTER', (-1, 0), (-1, -1), 1, black),
-                    ('LINEBELOW', (0, -1), (-1, -1), 1, black),
-                    ('BACKGROUND', (0, 0), (-1, 0), '#e8e8e8'),
-                    ('VALIGN', (0, 0), (-1, 0), 'TOP'),
-                    ('LEFTPADDING', (0, 0), (-1, 0), 0),
-                    ('LEFTPADDING', (0, 1), (-1, -1), 3),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 3),
-                    ('RIGHTPADDING', (4, 2), (10, 4), 0),
-                    ('RIGHTPADDING', (15, 2), (21, 4), 0),
-                    ('RIGHTPADDING', (26, 2), (32, 4), 0),
-                    ('TOPPADDING', (0, 0), (-1, 0), 2.5),
-                    ('TOPPADDING', (0, 1), (-1, 1), 10),
-                    ('TOPPADDING', (0, 2), (-1, -1), 0),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), .5),
-                    ('BOTTOMPADDING', (0, 1), (-1, 1), 1.5),
-                    ('BOTTOMPADDING', (0, 2), (-1, 4), 0),
-                    ('BOTTOMPADDING', (0, -1), (-1, -1), 18),
-                )
-
-                ast = {
-                    'debit': (
-                        ('LINEBELOW', (1, 1), (10, 1), thickness, black),
-                        ('LINEAFTER', (3, 2), (3, 2), thickness, black),
-                        ('LINEBELOW', (12, 1), (21, 1), thickness, black),
-                        ('LINEAFTER', (14, 2), (14, 4), thickness, black),
-                        ('LINEBELOW', (23, 1), (32, 1), thickness, black),
-                        ('LINEAFTER', (25, 2), (25, 4), thickness, black)),
-                    'credit': (
-                        ('LINEBELOW', (1, 1), (10, 1), thickness, black),
-                        ('LINEAFTER', (3, 2), (3, 4), thickness, black),
-                        ('LINEBELOW', (12, 1), (21, 1), thickness, black),
-                        ('LINEAFTER', (14, 2), (14, 4), thickness, black),
-                        ('LINEBELOW', (23, 1), (32, 1), thickness, black),
-                        ('LINEAFTER', (25, 2), (25, 4), thickness, black)),
-                    'balance': (
-                        ('LINEBELOW', (23, 1), (32, 1), thickness, black),
-                        ('LINEAFTER', (25, 2), (25, 4), thickness, black))
-                }
-
-                for row in rows:
-                    if row['err']:
-                        flow.extend(
-                            [Spacer(0, 20),
-                             Paragraph(
-                                 '(pro další transakce nejsou k disposici'
-                                 ' data, při výpočtu došlo k chybě)', style22)])
-                        break
-                    trt = row['trt']
-                    doc3 = []
-                    temp1 = [Paragraph('{:%d.%m.%Y}'.format(row['date']), style13)] + (EL * 4)
-                    temp2 = [Paragraph(escape(row['description']).upper(), style14)] + (EL * 28)
-                    doc3.extend([temp1 + temp2])
-
-                    if trt == 'debit':
-                        temp = (
-                            EL + [Paragraph('Závazek', style15)] + (EL * 10)
-                            + [Paragraph('Předchozí zůstatek', style15)] + (EL * 10)
-                            + [Paragraph('Nový zůstatek', style15), ''])
-                    elif trt == 'credit':
-                        temp = (
-                            EL + [Paragraph('<b>Splátka</b> (přednost {}'.format(row['rep']), style16)] + (EL * 10)
-                            + [Paragraph('Předchozí zůstatek', style15)] + (EL * 10)
-                            + [Paragraph('Nový zůstatek', style15), ''])
-                    else:
-                        temp = (EL * 23) + [Paragraph('Zůstatek', style15), '']
-                    doc3.extend([temp])
-
-                    if trt != 'balance':
-                        temp = (
-                            EL + [Paragraph('Částka', style17)] + (EL * 2)
-                            + [Paragraph(lfamt((row['change'] if (trt == 'debit') else (-row['change']))), style18)]
-                            + (EL * 7) + [Paragraph('Jistina', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['pre_principal']), style18)] + (EL * 7)
-                            + [Paragraph('Jistina', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['post_principal']), style18)] + (EL * 7))
-                    else:
-                        temp = (
-                            (EL * 23) + [Paragraph('Jistina', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['post_principal']), style18)] + (EL * 7))
-                    doc3.extend([temp])
-
-                    if trt == 'debit':
-                        temp = (
-                            (EL * 12) + [Paragraph('Úrok', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['pre_interest']), style18)] + (EL * 7)
-                            + [Paragraph('Úrok', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['post_interest']), style18)] + (EL * 7))
-                    elif trt == 'credit':
-                        temp = (
-                            EL + [Paragraph('Jistina', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(-row['change_principal']), style18)] + (EL * 7)
-                            + [Paragraph('Úrok', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['pre_interest']), style18)] + (EL * 7)
-                            + [Paragraph('Úrok', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['post_interest']), style18)] + (EL * 7))
-                    else:
-                        temp = (
-                            (EL * 23) + [Paragraph('Úrok', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['post_interest']), style18)] + (EL * 7))
-                    doc3.extend([temp])
-
-                    if trt == 'debit':
-                        temp = (
-                            (EL * 12) + [Paragraph('Celkem', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['pre_total']), style18)] + (EL * 7)
-                            + [Paragraph('Celkem', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['post_total']), style18)] + (EL * 7))
-                    elif trt == 'credit':
-                        temp = (
-                            EL + [Paragraph('Úrok', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(-row['change_interest']), style18)] + (EL * 7)
-                            + [Paragraph('Celkem', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['pre_total']), style18)] + (EL * 7)
-                            + [Paragraph('Celkem', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['post_total']), style18)] + (EL * 7))
-                    else:
-                        temp = (
-                            (EL * 23) + [Paragraph('Celkem', style17)] + (EL * 2)
-                            + [Paragraph(lfamt(row['post_total']), style18)] + (EL * 7))
-                    doc3.extend([temp])
-
-                    temp = EL * 34
-                    doc3.extend([temp])
-
-                    table3 = Table(doc3, colWidths=cwid)
-                    table3.setStyle(TableStyle(bst + ast[trt]))
-                    flow.append(KeepTogether(table3))
-
-                if debt.note:
-                    flow.append(Spacer(0, 24))
-                    temp = [Paragraph('Poznámka:'.upper(), style4)]
-                    for line in filter(bool, debt.note.strip().split('\n')):
-                        temp.append(Paragraph(escape(line), style12))
-                    flow.append(KeepTogether(temp[:2]))
-                    if len(temp) > 2:
-                        flow.extend(temp[2:])
-                temp = BytesIO()
                 response = HttpResponse(content_type='application/pdf')
                 response['Content-Disposition'] = 'attachment; filename=Pohledavka.pdf'
-                auth = '{} V{}'.format(APP.upper(), APPVERSION)
-                doc = SimpleDocTemplate(
-                    temp,
-                    pagesize=A4,
-                    title='Historie peněžité pohledávky',
-                    author=auth,
-                    leftMargin=64,
-                    rightMargin=48,
-                    topMargin=48,
-                    bottomMargin=96,
-                    )
-                make_pdf(
-                    doc,
-                    flow,
-                    string=auth,
-                    xml=to_xml(debt))
-                response.write(temp.getvalue())
+                to_pdf(debt, rows, response)
                 return response
 
         else:
@@ -1244,3 +1287,37 @@ def transdel(request, idx=0):
                 return error(request)
             return redirect('hjp:transdeleted')
         return redirect('hjp:mainpage')
+
+
+@csrf_exempt
+@require_http_methods(('POST',))
+@login_required
+def api(request):
+
+    LOGGER.debug('API accessed', request)
+    try:
+        debt, msg = from_xml(request.body)
+    except:
+        debt, msg = None, 'Chybný formát souboru'
+    if msg:
+        return JsonResponse({'error': msg}, status=400, json_dumps_params={'ensure_ascii': False})
+    debt.rates = {}
+    rows = []
+    for row in getrows(debt):
+        if 'msg' in row:
+            return JsonResponse({'error': row['msg']}, status=400, json_dumps_params={'ensure_ascii': False})
+        dct = {key: row[key] for key in (
+            'id', 'date', 'description', 'change', 'pre_principal', 'pre_interest', 'pre_total', 'change_principal',
+            'change_interest', 'post_principal', 'post_interest', 'post_total')}
+        dct['type'] = row['trt']
+        rows.append(dct)
+    last = rows[-1] if rows else {}
+    return JsonResponse(
+        {'title': debt.title,
+         'currency': debt.currency,
+         'rows': rows,
+         'principal': last.get('post_principal', 0),
+         'interest': last.get('post_interest', 0),
+         'total': last.get('post_total', 0),
+         'rates': [{'date': dat, 'rate': debt.rates[dat]} for dat in sorted(debt.rates)]},
+        json_dumps_params={'ensure_ascii': False})
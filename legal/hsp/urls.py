@@ -24,7 +24,7 @@ from django.conf.urls import url
 
 from legal.common.views import genrender
 from legal.hsp.views import (
-    mainpage, debitform, debitdel, creditform, creditdel, balanceform, balancedel, fxrateform, fxratedel)
+    mainpage, debitform, debitdel, creditform, creditdel, balanceform, balancedel, fxrateform, fxratedel, api)
 
 
 urlpatterns = [
@@ -65,4 +65,5 @@ urlpatterns = [
             'template': 'hsp_fxratedeleted.xhtml',
             'page_title': 'Smazání kursu'},
         name='fxratedeleted'),
+    url(r'^api/$', api, name='api'),
 ]
@@ -33,6 +33,8 @@ from reportlab.lib.enums import TA_CENTER, TA_RIGHT
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.colors import black
 from django.shortcuts import redirect, HttpResponse, Http404
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.apps import apps
@@ -40,10 +42,10 @@ from django.apps import apps
 from legal.common.glob import YDCONVS, ODP, MDCONVS, LIM, INERR, LOCAL_SUBDOMAIN, LOCAL_URL, ASSET_EXP
 from legal.common.utils import (
     getbutton, yfactor, mfactor, famt, xml_decorate, xml_escape, xml_unescape, LocalFloat, get_xml, new_xml, iso2date,
-    register_fonts, make_pdf, LOGGER, render, getasset, setasset)
+    register_fonts, make_pdf, LOGGER, render, getasset, setasset, chain_hash, get_checkpoints, put_checkpoints)
 from legal.common import fields
 from legal.common.views import error
-from legal.cnb.utils import get_mpi_rate, get_fx_rate
+from legal.cnb.utils import get_mpi_rate, get_fx_rate, prefetch_mpi_rates, prefetch_fx_tables
 from legal.hsp.forms import MainForm, DebitForm, CreditForm, BalanceForm, FXform
 
 
@@ -112,7 +114,7 @@ class FXrate:
 
 class Result:
 
-    pass
+    fxtables = mpirates = None
 
 
 AID = '{} {}'.format(APP.upper(), APPVERSION)
@@ -188,7 +190,7 @@ def calcint(interest, pastdate, presdate, debt, res):
         return principal * (presdate - pastdate).days * interest.rate / 1000, None
 
     if interest.model == 'cust1':
-        rate = get_mpi_rate('DISC', interest.default_date, log=res.mpi)
+        rate = get_mpi_rate('DISC', interest.default_date, log=res.mpi, prefetched=res.mpirates)
         if rate[1]:
             return None, rate[1]
         return (principal * yfactor(pastdate, presdate, 'ACT/ACT') * rate[0] / 50), None
@@ -202,7 +204,7 @@ def calcint(interest, pastdate, presdate, debt, res):
             month1 = dat.month
             day1 = 1
             month1 = 7 if month1 > 6 else 1
-            rate = get_mpi_rate('REPO', date(year1, month1, day1), log=res.mpi)
+            rate = get_mpi_rate('REPO', date(year1, month1, day1), log=res.mpi, prefetched=res.mpirates)
             if rate[1]:
                 return None, rate[1]
             year2 = year1
@@ -234,7 +236,7 @@ def calcint(interest, pastdate, presdate, debt, res):
             month = 12
             day = 31
             year -= 1
-        rate = get_mpi_rate('REPO', date(year, month, day), log=res.mpi)
+        rate = get_mpi_rate('REPO', date(year, month, day), log=res.mpi, prefetched=res.mpirates)
         if rate[1]:
             return None, rate[1]
         return principal * yfactor(pastdate, presdate, 'ACT/ACT') * (rate[0] + 7) / 100, None
@@ -250,7 +252,7 @@ def calcint(interest, pastdate, presdate, debt, res):
             month = 12
             day = 31
             year -= 1
-        rate = get_mpi_rate('REPO', date(year, month, day), log=res.mpi)
+        rate = get_mpi_rate('REPO', date(year, month, day), log=res.mpi, prefetched=res.mpirates)
         if rate[1]:
             return None, rate[1]
         return principal * yfactor(pastdate, presdate, 'ACT/ACT') * (rate[0] + 8) / 100, None
@@ -259,7 +261,7 @@ def calcint(interest, pastdate, presdate, debt, res):
         year = interest.default_date.year
         month = interest.default_date.month
         month = 7 if month > 6 else 1
-        rate = get_mpi_rate('REPO', date(year, month, 1), log=res.mpi)
+        rate = get_mpi_rate('REPO', date(year, month, 1), log=res.mpi, prefetched=res.mpirates)
         if rate[1]:
             return None, rate[1]
         return principal * yfactor(pastdate, presdate, 'ACT/ACT') * (rate[0] + 8) / 100, None
@@ -295,7 +297,8 @@ def distr(debt, dat, credit, amt, disarr, res):
                             dat,
                             log=res.fxinfo,
                             use_fixed=True,
-                            log_fixed=res.fix)
+                            log_fixed=res.fix,
+                            tables=res.fxtables)
                         if msg:
                             return .0, msg
                         rcl = rate / qty
@@ -307,7 +310,8 @@ def distr(debt, dat, credit, amt, disarr, res):
                             dat,
                             log=res.fxinfo,
                             use_fixed=True,
-                            log_fixed=res.fix)
+                            log_fixed=res.fix,
+                            tables=res.fxtables)
                         if msg:
                             return 0, msg
                         rld = rate / qty
@@ -324,7 +328,47 @@ def distr(debt, dat, credit, amt, disarr, res):
     return amt, None
 
 
-def calc(debt, pram=lambda x: x):
+def accrue(itr, dat, debt):
+
+    if dat >= itr.default_date and (not itr.date_to or dat <= itr.date_to):
+        if dat == itr.mb:
+            itr.li = 0
+            itr.ui = itr.mm
+        iitr = debt.debits[itr.principal_debit - 1].balance if itr.principal_debit else itr.principal_amount
+        iitr /= 400
+        iitr = max(iitr, 0)
+        itr.li += iitr
+        if itr.li > itr.ui:
+            ditr = itr.li - itr.ui
+            itr.ui = itr.li
+        else:
+            ditr = 0.0
+        if dat == itr.mb:
+            ditr += itr.mm
+            day = itr.default_date.day
+            month = dat.month + 1
+            year = dat.year
+            if month > 12:
+                month = 1
+                year += 1
+            day = min(day, monthrange(year, month)[1])
+            itr.mb = date(year, month, day)
+        itr.balance += ditr
+
+
+def contents(obj):
+
+    return tuple(getattr(obj, name, None) for name in vars(type(obj)()))
+
+
+def sps_text(sps, res, pram=str):
+
+    return ', '.join(
+        '{} {}'.format(pram(spa['total']), spa['curr'] if res.multicurrency or spa['curr'] != 'CZK' else 'Kč')
+        for spa in sps)
+
+
+def rawcalc(debt):
 
     res = Result()
 
@@ -449,38 +493,73 @@ def calc(debt, pram=lambda x: x):
     if not tra:
         return res
 
-    dat = tra[0]['date']
-    for itr in irs:
-        dat = min(dat, itr.default_date)
-    dat -= ODP
-    eps = 0
-    cud = None
-    while dat <= tra[-1]['date']:
+    key = hsh = chain_hash(
+        APP,
+        (debt.rounding, [contents(debit) for debit in debt.debits], [contents(fxrate) for fxrate in debt.fxrates]))
+    hashes = []
+    items = []
+    for idx, trn in enumerate(tra):
+        items.append((trn['type'], trn['id'], contents(trn['object'])))
+        if idx + 1 == len(tra) or tra[idx + 1]['date'] != trn['date']:
+            hsh = chain_hash(hsh, items)
+            hashes.append(hsh)
+            items = []
+    states = get_checkpoints(key, hashes)
+    if states:
+        eps, dat, cud, balances, cust4s, sps, logs = states[-1]
+        for debit, balance in zip(debt.debits, balances):
+            debit.balance = balance
+        for itr, state in zip(cust4, cust4s):
+            itr.li, itr.ui, itr.mb = state
+        for credit, spa in zip(debt.credits, sps):
+            credit.sp = spa
+        res.rows, res.fxinfo, res.fix, res.mpi = (lst[:num] for lst, num in logs)
+    else:
+        dat = tra[0]['date']
+        for itr in irs:
+            dat = min(dat, itr.default_date)
+        dat -= ODP
+        eps = 0
+        cud = None
+
+    pairs = {(credit.currency, debt.debits[idx].currency) for credit in debt.credits for idx in credit.debits}
+    pairs = [pair for pair in pairs if pair[0] != pair[1]]
+    fxdates = set()
+    if pairs:
+        first = min(credit.date for credit in debt.credits)
+        for trn in tra[eps:]:
+            if trn['date'] >= first and trn['date'] > dat and not all(
+                any(fxrate.currency_from == pair[0] and fxrate.currency_to == pair[1]
+                    and (not fxrate.date_from or fxrate.date_from <= trn['date'])
+                    and (not fxrate.date_to or trn['date'] <= fxrate.date_to) for fxrate in debt.fxrates)
+                for pair in pairs):
+                fxdates.add(trn['date'])
+    res.fxtables = prefetch_fx_tables(fxdates)
+
+    spans = {}
+    end = min(tra[-1]['date'], date.today())
+    for debit in ncust4:
+        if debit.model in ('cust1', 'cust2', 'cust3', 'cust5', 'cust6'):
+            typ = 'DISC' if debit.model == 'cust1' else 'REPO'
+            beg = debit.default_date if typ == 'DISC' else date(debit.default_date.year - 1, 12, 31)
+            if beg <= end:
+                spans[typ] = min(beg, spans.get(typ, (beg,))[0]), end
+    res.mpirates = prefetch_mpi_rates(spans)
+
+    while eps < len(tra):
+        dat += ODP
+        if cust4:
+            end = tra[eps]['date']
+            if all(itr.date_to for itr in cust4):
+                end = min(end, max(itr.date_to for itr in cust4) + ODP)
+            dat = max(dat, min(itr.default_date for itr in cust4))
+            while dat < end:
+                for itr in cust4:
+                    accrue(itr, dat, debt)
+                dat += ODP
+        dat = tra[eps]['date']
         for itr in cust4:
-            if dat >= itr.default_date and (not itr.date_to or dat <= itr.date_to):
-                if dat == itr.mb:
-                    itr.li = 0
-                    itr.ui = itr.mm
-                iitr = debt.debits[itr.principal_debit - 1].balance if itr.principal_debit else itr.principal_amount
-                iitr /= 400
-                iitr = max(iitr, 0)
-                itr.li += iitr
-                if itr.li > itr.ui:
-                    ditr = itr.li - itr.ui
-                    itr.ui = itr.li
-                else:
-                    ditr = 0.0
-                if dat == itr.mb:
-                    ditr += itr.mm
-                    day = itr.default_date.day
-                    month = dat.month + 1
-                    year = dat.year
-                    if month > 12:
-                        month = 1
-                        year += 1
-                    day = min(day, monthrange(year, month)[1])
-                    itr.mb = date(year, month, day)
-                itr.balance += ditr
+            accrue(itr, dat, debt)
 
         while eps < len(tra) and tra[eps]['date'] == dat:
             trn = tra[eps]
@@ -496,7 +575,7 @@ def calc(debt, pram=lambda x: x):
                 'object': obj,
                 'date': dat,
                 'description': obj.description,
-                'amount': pram(0.0),
+                'amount': 0.0,
                 'pre': [],
                 'change': [],
                 'post': [],
@@ -512,13 +591,13 @@ def calc(debt, pram=lambda x: x):
             for debit in debt.debits:
                 debit.ob = debit.newb = round(debit.newb, debt.rounding)
                 if typ == BAL:
-                    row['pre'].append(pram(0))
+                    row['pre'].append(0)
                 else:
-                    row['pre'].append(pram(debit.newb))
+                    row['pre'].append(debit.newb)
                     row['pre_total'] += debit.newb
             if typ == DR:
                 row['id'] = obj.id
-                row['amount'] = pram(obj.fixed_amount)
+                row['amount'] = obj.fixed_amount
                 obj.newb += obj.fixed_amount
                 obj.newb = round(obj.newb, debt.rounding)
             for credit in debt.credits:
@@ -526,26 +605,26 @@ def calc(debt, pram=lambda x: x):
                 if res.msg:
                     return res
             if typ == CR:
-                row['amount'] = pram(-obj.amount)
+                row['amount'] = -obj.amount
                 row['debits'] = obj.debits
                 spa, res.msg = distr(debt, dat, obj, obj.amount, row['cr_distr'], res)
                 if res.msg:
                     return res
                 obj.nsp += spa
             for debit in debt.debits:
-                row['post'].append(pram(debit.newb))
+                row['post'].append(debit.newb)
                 if not res.multicurrency_debit:
                     row['post_total'] += debit.newb
                 if typ == BAL:
-                    row['change'].append(pram(0))
+                    row['change'].append(0)
                 else:
-                    row['change'].append(pram(debit.newb - debit.ob))
+                    row['change'].append(debit.newb - debit.ob)
             if typ == DR and obj.model == 'fixed':
                 row['disp_currency'] = obj.fixed_currency
             elif typ == CR:
                 row['disp_currency'] = obj.currency
             if not res.multicurrency_debit:
-                row['post_total'] = pram(round(row['post_total'], debt.rounding))
+                row['post_total'] = round(row['post_total'], debt.rounding)
 
             for credit in debt.credits:
                 if credit.nsp > LIM:
@@ -560,12 +639,7 @@ def calc(debt, pram=lambda x: x):
                         })
             row['sps'].sort(key=lambda x: x['curr'])
 
-            lst = []
-            for spa in row['sps']:
-                lst.append('{} {}'.format(
-                    pram(spa['total']),
-                    spa['curr'] if res.multicurrency or spa['curr'] != 'CZK' else 'Kč'))
-            row['sps_text'] = ', '.join(lst)
+            row['sps_text'] = sps_text(row['sps'], res)
 
             if typ != BAL:
                 for debit in debt.debits:
@@ -577,11 +651,551 @@ def calc(debt, pram=lambda x: x):
             res.rows.append(row)
             eps += 1
 
-        dat += ODP
+        states.append((
+            eps,
+            dat,
+            cud,
+            tuple(debit.balance for debit in debt.debits),
+            tuple((itr.li, itr.ui, itr.mb) for itr in cust4),
+            tuple(credit.sp for credit in debt.credits),
+            tuple((lst, len(lst)) for lst in (res.rows, res.fxinfo, res.fix, res.mpi))))
+
+    put_checkpoints(key, hashes, states)
+    res.rows, res.fxinfo, res.fix, res.mpi = (lst[:] for lst in (res.rows, res.fxinfo, res.fix, res.mpi))
+    return res
+
 
+def calc(debt, pram=None):
+
+    res = rawcalc(debt)
+    if pram:
+        rows = []
+        for row in res.rows:
+            row = dict(row)
+            row['amount'] = pram(row['amount'])
+            for col in ('pre', 'change', 'post'):
+                row[col] = list(map(pram, row[col]))
+            if not res.multicurrency_debit:
+                row['post_total'] = pram(row['post_total'])
+            row['sps_text'] = sps_text(row['sps'], res, pram)
+            rows.append(row)
+        res.rows = rows
     return res
 
 
+def to_csv(debt, outfile):
+
+    res = calc(debt)
+    writer = csv.writer(outfile)
+    hdr = ['Datum', 'Popis', 'Částka', 'Měna']
+    for debit in debt.debits:
+        hdr.append('Předchozí zůstatek {0.id} ({0.currency})'.format(debit))
+    for debit in debt.debits:
+        hdr.append('Změna {0.id} ({0.currency})'.format(debit))
+    for debit in debt.debits:
+        hdr.append('Nový zůstatek {0.id} ({0.currency})'.format(debit))
+    writer.writerow(hdr)
+    for row in res.rows:
+        dat = [
+            row['date'].isoformat(),
+            row['description'],
+            '{:.2f}'.format(row['amount']),
+            row['disp_currency']
+        ]
+        dat.extend(['{:.2f}'.format(t) for t in row['pre']])
+        dat.extend(['{:.2f}'.format(t) for t in row['change']])
+        dat.extend(['{:.2f}'.format(t) for t in row['post']])
+        writer.writerow(dat)
+
+
+EL = ['']
+
+
+def to_pdf(debt, outfile):
+
+    def lfamt(amt, curr):
+        if not amt or abs(amt) < LIM:
+            return ''
+        temp = famt(round(amt, debt.rounding)
+            if debt.rounding else int(round(amt))).replace('-', '−')
+        if res.multicurrency or curr != 'CZK':
+            return '{} {}'.format(temp, curr)
+        return '{} Kč'.format(temp)
+
+    register_fonts()
+
+    style1 = ParagraphStyle(
+        name='STYLE1',
+        fontName='Bookman',
+        fontSize=8,
+        leading=9,
+        alignment=TA_RIGHT,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style2 = ParagraphStyle(
+        name='STYLE2',
+        fontName='BookmanB',
+        fontSize=10,
+        leading=11,
+        alignment=TA_RIGHT,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style4 = ParagraphStyle(
+        name='STYLE4',
+        fontName='BookmanB',
+        fontSize=8,
+        leading=10,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style12 = ParagraphStyle(
+        name='STYLE12',
+        fontName='BookmanI',
+        fontSize=8,
+        leading=9,
+        spaceBefore=4,
+        spaceAfter=5,
+        leftIndent=8,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style13 = ParagraphStyle(
+        name='STYLE13',
+        fontName='Bookman',
+        fontSize=8,
+        leading=12,
+        alignment=TA_CENTER,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style14 = ParagraphStyle(
+        name='STYLE14',
+        fontName='BookmanB',
+        fontSize=8,
+        leading=12,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style15 = ParagraphStyle(
+        name='STYLE15',
+        fontName='BookmanB',
+        fontSize=8,
+        leading=10,
+        alignment=TA_CENTER,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style17 = ParagraphStyle(
+        name='STYLE17',
+        fontName='Bookman',
+        fontSize=8,
+        leading=10,
+        alignment=TA_CENTER,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style18 = ParagraphStyle(
+        name='STYLE18',
+        fontName='Bookman',
+        fontSize=8,
+        leading=10,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style20 = ParagraphStyle(
+        name='STYLE20',
+        fontName='Bookman',
+        fontSize=8,
+        leading=10,
+        spaceBefore=4,
+        allowWidows=False,
+        allowOrphans=False,
+        bulletFontName='Bookman',
+        bulletFontSize=8,
+        bulletIndent=8,
+        leftIndent=16)
+
+    style22 = ParagraphStyle(
+        name='STYLE22',
+        fontName='BookmanI',
+        fontSize=8,
+        leading=10,
+        alignment=TA_CENTER,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style23 = ParagraphStyle(
+        name='STYLE23',
+        fontName='BookmanB',
+        fontSize=8,
+        leading=10,
+        spaceBefore=15,
+        spaceAfter=4,
+        allowWidows=False,
+        allowOrphans=False,
+        keepWithNext=True)
+
+    style24 = ParagraphStyle(
+        name='STYLE24',
+        fontName='Bookman',
+        fontSize=8,
+        leading=10,
+        spaceBefore=4,
+        allowWidows=False,
+        allowOrphans=False,
+        bulletFontName='BookmanB',
+        bulletFontSize=8,
+        bulletIndent=8,
+        leftIndent=24,
+        keepWithNext=True)
+
+    style25 = ParagraphStyle(
+        name='STYLE25',
+        fontName='Bookman',
+        fontSize=8,
+        leading=10,
+        leftIndent=24,
+        allowWidows=False,
+        allowOrphans=False)
+
+    style26 = ParagraphStyle(
+        name='STYLE26',
+        fontName='Bookman',
+        fontSize=6,
+        leading=9,
+        spaceBefore=-2,
+        allowWidows=False,
+        allowOrphans=False)
+
+    doc1 = (([Paragraph('Historie peněžité pohledávky'.upper(), style1)],),)
+    if debt.title:
+        doc1[0][0].append(Paragraph(escape(debt.title), style2))
+    table1 = Table(doc1, colWidths=(483.3,))
+    table1.setStyle(
+        TableStyle((
+            ('LINEABOVE', (0, 0), (0, -1), 1.0, black),
+            ('TOPPADDING', (0, 0), (0, -1), 2),
+            ('LINEBELOW', (-1, 0), (-1, -1), 1.0, black),
+            ('BOTTOMPADDING', (-1, 0), (-1, -1), 3),
+            ('LEFTPADDING', (0, 0), (-1, -1), 2),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+        )))
+    flow = [table1, Spacer(0, 36)]
+
+    bst = [
+        ('SPAN', (0, 0), (4, 0)),
+        ('SPAN', (5, 0), (33, 0)),
+        ('SPAN', (1, 1), (10, 1)),
+        ('SPAN', (12, 1), (21, 1)),
+        ('SPAN', (23, 1), (32, 1)),
+        ('LINEABOVE', (0, 0), (-1, 0), 1, black),
+        ('LINEBELOW', (0, 0), (-1, 0), 1, black),
+        ('LINEBEFORE', (0, 0), (0, -1), 1, black),
+        ('LINEAFTER', (-1, 0), (-1, -1), 1, black),
+        ('LINEBELOW', (0, -1), (-1, -1), 1, black),
+        ('BACKGROUND', (0, 0), (-1, 0), '#e8e8e8'),
+        ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
+        ('LEFTPADDING', (0, 0), (-1, 0), 0),
+        ('LEFTPADDING', (0, 1), (-1, -1), 3),
+        ('LEFTPADDING', (2, 2), (2, -1), 5),
+        ('LEFTPADDING', (13, 2), (13, -1), 5),
+        ('LEFTPADDING', (24, 2), (24, -1), 5),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 3),
+        ('TOPPADDING', (0, 0), (-1, 0), 2.5),
+        ('TOPPADDING', (0, 1), (-1, 1), 10),
+        ('TOPPADDING', (0, 2), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), .5),
+        ('BOTTOMPADDING', (0, 1), (-1, 1), 1.5),
+        ('BOTTOMPADDING', (0, -1), (-1, -1), 18),
+    ]
+
+    cust2eff = {
+        'cust1': 'do 27.04.2005',
+        'cust2': 'od 28.04.2005 do 30.06.2010',
+        'cust3': 'od 01.07.2010',
+        'cust5': 'od 01.07.2013 do 31.12.2013',
+    }
+
+    mpitypes = {
+        'DISC': 'diskontní sazba',
+        'REPO': '2T repo sazba',
+    }
+
+    wid = 483.3
+    widl = 8
+    widr = 8
+    widg = 12
+    widf = widc = (wid - widl - widr - (widg * 2)) / 6
+    cwid = (
+        (widl,) + ((widc / 5,) * 5) + ((widf / 5,) * 5) + (widg,) + ((widc / 5,) * 5) + ((widf / 5,) * 5)
+        + (widg,) + ((widc / 5,) * 5) + ((widf / 5,) * 5) + (widr,))
+
+    res = calc(debt)
+    thickness = .5
+
+    info = []
+
+    if debt.debits:
+        info.append(Paragraph('Závazky:', style23))
+        for debit in debt.debits:
+            info.append(Paragraph(
+                '<b>{}</b>'.format(debit.description) if debit.description else '<i>(bez názvu)</i>',
+                style24,
+                bulletText=debit.id + '.'))
+            model = debit.model
+            if model == 'fixed':
+                txt = (
+                    'pevná částka {}, splatná {:%d.%m.%Y}'
+                    .format(lfamt(debit.fixed_amount, debit.fixed_currency), debit.fixed_date))
+            else:
+                if model == 'per_annum':
+                    txt = (
+                        'roční úrok {0.rate:n} % <i>p. a.</i> (konvence pro počítání dnů: '
+                        '{0.day_count_convention})'.format(debit))
+                elif model == 'per_mensem':
+                    txt = (
+                        'měsíční úrok {0.rate:n} % <i>p. m.</i> (konvence pro počítání dnů: '
+                        '{0.day_count_convention})'.format(debit))
+                elif model == 'per_diem':
+                    txt = 'denní úrok {:n} ‰ <i>p. d.</i>'.format(debit.rate)
+                elif model in {'cust1', 'cust2', 'cust3', 'cust5'}:
+                    txt = (
+                        'zákonný úrok z prodlení podle nařízení vlády č. 142/1994 Sb. ve znění účinném {}'
+                        .format(cust2eff[model]))
+                elif model == 'cust6':
+                    txt = 'zákonný úrok z prodlení podle nařízení vlády č. 351/2013 Sb.'
+                else:
+                    txt = 'zákonný poplatek z prodlení podle nařízení vlády č. 142/1994 Sb.'
+                if debit.principal_debit:
+                    txt += ' ze závazku {}'.format(n2l(debit.principal_debit - 1))
+                else:
+                    txt += (
+                        ' z částky {}'.format(lfamt(debit.principal_amount, debit.principal_currency)))
+                if debit.date_from:
+                    txt += ' od {:%d.%m.%Y}'.format(debit.date_from)
+                elif debit.principal_debit:
+                    txt += ' od splatnosti'
+                if debit.date_to:
+                    txt += ' do {:%d.%m.%Y}'.format(debit.date_to)
+                elif debit.principal_debit:
+                    txt += ' do zaplacení'
+            info.append(Paragraph(txt, style25))
+
+    if debt.fxrates:
+        info.append(Paragraph(
+            'Pevně zadané směnné kursy:',
+            style23))
+        for fxrate in debt.fxrates:
+            txt = ''
+            if fxrate.date_from:
+                txt += ' od {:%d.%m.%Y}'.format(fxrate.date_from)
+            if fxrate.date_to:
+                txt += ' do {:%d.%m.%Y}'.format(fxrate.date_to)
+            if txt:
+                txt = ' ({})'.format(txt.strip())
+            info.append(Paragraph(
+                '{0.rate_from:n} {0.currency_from} = {0.rate_to:n} {0.currency_to}{1}'.format(fxrate, txt),
+                style20,
+                bulletText='–'))
+
+    if res.fxinfo:
+        res.fxinfo.sort(key=lambda x: x['date_required'])
+        res.fxinfo.sort(key=lambda x: x['currency'])
+        rmdsl(res.fxinfo)
+        info.append(Paragraph('Použité směnné kursy ČNB:', style23))
+        for fxr in res.fxinfo:
+            info.append(Paragraph(
+                '{0[quantity]:d} {0[currency]} = {1:.3f} CZK, platný ke dni {0[date_required]:%d.%m.%Y}'
+                .format(fxr, LocalFloat(fxr['rate'])),
+                style20,
+                bulletText='–'))
+
+    if res.fix:
+        res.fix.sort(key=lambda x: x['currency_to'])
+        res.fix.sort(key=lambda x: x['currency_from'])
+        rmdsl(res.fix)
+        info.append(Paragraph('Použité fixní směnné poměry:', style23))
+        for fix in res.fix:
+            info.append(Paragraph(
+                '{0} {1[currency_from]} = 1 {1[currency_to]}, platný od {1[date_from]:%d.%m.%Y}'
+                .format(famt(fix['rate']), fix),
+                style20,
+                bulletText='–'))
+
+    if res.mpi:
+        res.mpi.sort(key=(lambda x: x['date']))
+        res.mpi.sort(key=(lambda x: x['type']))
+        rmdsl(res.mpi)
+        info += [Paragraph(('Použité úrokové sazby ČNB:'), style23)]
+        for mpi in res.mpi:
+            info.append(Paragraph(
+                '{} ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
+                .format(mpitypes[mpi['type']], mpi['date'], LocalFloat(mpi['rate'])),
+                style20,
+                bulletText='–'))
+
+    info.append(Spacer(0, 50))
+    flow.extend(info)
+
+    for row in res.rows:
+
+        typ = row['type']
+        spf = bool(row['sps'])
+
+        hdr = EL * 3
+        lin = ([0] * 3)
+        cleft = [[], [], []]
+        cright = [[], [], []]
+
+        if typ == DR:
+            hdr[0] = 'Závazek'
+            lin[0] = 1
+            cleft[0].append(row['id'])
+            cright[0].append((row['amount'], row['disp_currency']))
+
+        if typ == CR:
+            hdr[0] = 'Splátka'
+            lin[0] = 1
+            cleft[0].append('∑')
+            cright[0].append((-row['amount'], row['disp_currency']))
+            for debit, amount in zip(debt.debits, row['cr_distr']):
+                if abs(amount) > LIM:
+                    lin[0] += 1
+                    cleft[0].append(debit.id)
+                    cright[0].append((amount, debit.currency))
+
+        if typ in {DR, CR}:
+            for itm in row['pre']:
+                if abs(itm) > LIM:
+                    hdr[1] = 'Předchozí zůstatek'
+                    for debit, amount in zip(debt.debits, row['pre']):
+                        if abs(amount) > LIM:
+                            lin[1] += 1
+                            cleft[1].append(debit.id)
+                            cright[1].append((amount, debit.currency))
+                    if not res.multicurrency_debit and lin[1] > 1:
+                        lin[1] += 1
+                        cleft[1].append('∑')
+                        cright[1].append((row['pre_total'], res.currency_debits))
+                    break
+
+        if spf:
+            hdr[2] = 'Přeplatek'
+            for spa in row['sps']:
+                lin[2] += 1
+                cleft[2].append('∑')
+                cright[2].append((spa['total'], spa['curr']))
+        else:
+            hdr[2] = 'Nový zůstatek' if hdr[1] else 'Zůstatek'
+            for debit, amount in zip(debt.debits, row['post']):
+                if abs(amount) > LIM:
+                    lin[2] += 1
+                    cleft[2].append(debit.id)
+                    cright[2].append((amount, debit.currency))
+            if not res.multicurrency_debit and lin[2] > 1:
+                lin[2] += 1
+                cleft[2].append('∑')
+                cright[2].append((row['post_total'], res.currency_debits))
+
+        lmax = max(lin)
+
+        for idx in range(3):
+            while len(cleft[idx]) < lmax:
+                cleft[idx].append('')
+            while len(cright[idx]) < lmax:
+                cright[idx].append((None, None))
+
+        ast = [
+            ('RIGHTPADDING', (2, 2), (10, 1 + lmax), 0),
+            ('RIGHTPADDING', (13, 2), (21, 1 + lmax), 0),
+            ('RIGHTPADDING', (24, 2), (32, 1 + lmax), 0),
+            ('BOTTOMPADDING', (0, 2), (-1, 1 + lmax), 0),
+        ]
+
+        for idx in range(lmax):
+            ast.extend([
+                ('SPAN', (2, 2 + idx), (10, 2 + idx)),
+                ('SPAN', (13, 2 + idx), (21, 2 + idx)),
+                ('SPAN', (24, 2 + idx), (32, 2 + idx)),
+            ])
+
+        for idx in range(3):
+            if hdr[idx]:
+                ast.append(('LINEBELOW', (1 + (11 * idx), 1), (10 + (11 * idx), 1), thickness, black))
+            if lin[idx]:
+                ast.append(
+                    ('LINEAFTER', (1 + (11 * idx), 2), (1 + (11 * idx), 1 + lin[idx]), thickness, black))
+
+        doc3 = []
+        temp1 = [Paragraph('{:%d.%m.%Y}'.format(row['date']), style13)] + (EL * 4)
+        temp2 = Paragraph(
+            escape(row['description']).upper() if row['description'] else '<i>(bez názvu)</i>',
+            style14)
+        if typ == CR:
+            if len(row['debits']) > 1:
+                temp2 = (
+                    temp2,
+                    Paragraph('Pořadí závazků: {}'.format(' – '.join(map(n2l, row['debits']))), style26))
+        temp2 = [temp2] + (EL * 28)
+        doc3.extend([temp1 + temp2])
+
+        temp = (
+            EL + [Paragraph(hdr[0], style15)] + (EL * 10) + [Paragraph(hdr[1], style15)] + (EL * 10)
+            + [Paragraph(hdr[2], style15), ''])
+        doc3.extend([temp])
+
+        for idx in range(lmax):
+            temp = (
+                EL + [Paragraph(cleft[0][idx], style17)] + [Paragraph(lfamt(*cright[0][idx]), style18)]
+                + (EL * 9) + [Paragraph(cleft[1][idx], style17)]
+                + [Paragraph(lfamt(*cright[1][idx]), style18)] + (EL * 9)
+                + [Paragraph(cleft[2][idx], style17)] + [Paragraph(lfamt(*cright[2][idx]), style18)]
+                + (EL * 9))
+            doc3.extend([temp])
+
+        temp = (EL * 34)
+        doc3.extend([temp])
+
+        table3 = Table(doc3, colWidths=cwid)
+        table3.setStyle(TableStyle(bst + ast))
+        flow.append(KeepTogether(table3))
+
+    if res.msg:
+        flow.extend(
+            [Spacer(0, 20),
+             Paragraph(
+                 '(pro další transakce nejsou k disposici data, při výpočtu došlo k chybě)', style22)])
+
+    if debt.note:
+        flow.append(Spacer(0, 24))
+        temp = [Paragraph('Poznámka:'.upper(), style4)]
+        for note in filter(bool, debt.note.strip().split('\n')):
+            temp.append(Paragraph(escape(note), style12))
+        flow.append(KeepTogether(temp[:2]))
+        if len(temp) > 2:
+            flow.extend(temp[2:])
+    temp = BytesIO()
+    auth = '{} V{}'.format(APP.upper(), APPVERSION)
+    doc = SimpleDocTemplate(
+        temp,
+        pagesize=A4,
+        title='Historie peněžité pohledávky',
+        author=auth,
+        leftMargin=64,
+        rightMargin=48,
+        topMargin=48,
+        bottomMargin=96,
+        )
+    make_pdf(
+        doc,
+        flow,
+        string=auth,
+        xml=to_xml(debt))
+    outfile.write(temp.getvalue())
+
+
 def to_xml(debt):
 
     dec = {
@@ -876,9 +1490,6 @@ def from_xml(dat):
     return debt, None
 
 
-EL = ['']
-
-
 @require_http_methods(('GET', 'POST'))
 @login_required
 def mainpage(request):
@@ -966,507 +1577,15 @@ def mainpage(request):
                 return response
 
             if button == 'csv':
-                res = calc(debt)
                 response = HttpResponse(content_type='text/csv; charset=utf-8')
                 response['Content-Disposition'] = 'attachment; filename=Pohledavka.csv'
-                writer = csv.writer(response)
-                hdr = ['Datum', 'Popis', 'Částka', 'Měna']
-                for debit in debt.debits:
-                    hdr.append('Předchozí zůstatek {0.id} ({0.currency})'.format(debit))
-                for debit in debt.debits:
-                    hdr.append('Změna {0.id} ({0.currency})'.format(debit))
-                for debit in debt.debits:
-                    hdr.append('Nový zůstatek {0.id} ({0.currency})'.format(debit))
-                writer.writerow(hdr)
-                for row in res.rows:
-                    dat = [
-                        row['date'].isoformat(),
-                        row['description'],
-                        '{:.2f}'.format(row['amount']),
-                        row['disp_currency']
-                    ]
-                    dat.extend(['{:.2f}'.format(t) for t in row['pre']])
-                    dat.extend(['{:.2f}'.format(t) for t in row['change']])
-                    dat.extend(['{:.2f}'.format(t) for t in row['post']])
-                    writer.writerow(dat)
+                to_csv(debt, response)
                 return response
 
             if button == 'pdf':
-
-                register_fonts()
-
-                style1 = ParagraphStyle(
-                    name='STYLE1',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=9,
-                    alignment=TA_RIGHT,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style2 = ParagraphStyle(
-                    name='STYLE2',
-                    fontName='BookmanB',
-                    fontSize=10,
-                    leading=11,
-                    alignment=TA_RIGHT,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style4 = ParagraphStyle(
-                    name='STYLE4',
-                    fontName='BookmanB',
-                    fontSize=8,
-                    leading=10,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style12 = ParagraphStyle(
-                    name='STYLE12',
-                    fontName='BookmanI',
-                    fontSize=8,
-                    leading=9,
-                    spaceBefore=4,
-                    spaceAfter=5,
-                    leftIndent=8,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style13 = ParagraphStyle(
-                    name='STYLE13',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=12,
-                    alignment=TA_CENTER,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style14 = ParagraphStyle(
-                    name='STYLE14',
-                    fontName='BookmanB',
-                    fontSize=8,
-                    leading=12,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style15 = ParagraphStyle(
-                    name='STYLE15',
-                    fontName='BookmanB',
-                    fontSize=8,
-                    leading=10,
-                    alignment=TA_CENTER,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style17 = ParagraphStyle(
-                    name='STYLE17',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=10,
-                    alignment=TA_CENTER,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style18 = ParagraphStyle(
-                    name='STYLE18',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=10,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style20 = ParagraphStyle(
-                    name='STYLE20',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=10,
-                    spaceBefore=4,
-                    allowWidows=False,
-                    allowOrphans=False,
-                    bulletFontName='Bookman',
-                    bulletFontSize=8,
-                    bulletIndent=8,
-                    leftIndent=16)
-
-                style22 = ParagraphStyle(
-                    name='STYLE22',
-                    fontName='BookmanI',
-                    fontSize=8,
-                    leading=10,
-                    alignment=TA_CENTER,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style23 = ParagraphStyle(
-                    name='STYLE23',
-                    fontName='BookmanB',
-                    fontSize=8,
-                    leading=10,
-                    spaceBefore=15,
-                    spaceAfter=4,
-                    allowWidows=False,
-                    allowOrphans=False,
-                    keepWithNext=True)
-
-                style24 = ParagraphStyle(
-                    name='STYLE24',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=10,
-                    spaceBefore=4,
-                    allowWidows=False,
-                    allowOrphans=False,
-                    bulletFontName='BookmanB',
-                    bulletFontSize=8,
-                    bulletIndent=8,
-                    leftIndent=24,
-                    keepWithNext=True)
-
-                style25 = ParagraphStyle(
-                    name='STYLE25',
-                    fontName='Bookman',
-                    fontSize=8,
-                    leading=10,
-                    leftIndent=24,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                style26 = ParagraphStyle(
-                    name='STYLE26',
-                    fontName='Bookman',
-                    fontSize=6,
-                    leading=9,
-                    spaceBefore=-2,
-                    allowWidows=False,
-                    allowOrphans=False)
-
-                doc1 = (([Paragraph('Historie peněžité pohledávky'.upper(), style1)],),)
-                if debt.title:
-                    doc1[0][0].append(Paragraph(escape(debt.title), style2))
-                table1 = Table(doc1, colWidths=(483.3,))
-                table1.setStyle(
-                    TableStyle((
-                        ('LINEABOVE', (0, 0), (0, -1), 1.0, black),
-                        ('TOPPADDING', (0, 0), (0, -1), 2),
-                        ('LINEBELOW', (-1, 0), (-1, -1), 1.0, black),
-                        ('BOTTOMPADDING', (-1, 0), (-1, -1), 3),
-                        ('LEFTPADDING', (0, 0), (-1, -1), 2),
-                        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
-                    )))
-                flow = [table1, Spacer(0, 36)]
-
-                bst = [
-                    ('SPAN', (0, 0), (4, 0)),
-                    ('SPAN', (5, 0), (33, 0)),
-                    ('SPAN', (1, 1), (10, 1)),
-                    ('SPAN', (12, 1), (21, 1)),
-                    ('SPAN', (23, 1), (32, 1)),
-                    ('LINEABOVE', (0, 0), (-1, 0), 1, black),
-                    ('LINEBELOW', (0, 0), (-1, 0), 1, black),
-                    ('LINEBEFORE', (0, 0), (0, -1), 1, black),
-                    ('LINEAFTER', (-1, 0), (-1, -1), 1, black),
-                    ('LINEBELOW', (0, -1), (-1, -1), 1, black),
-                    ('BACKGROUND', (0, 0), (-1, 0), '#e8e8e8'),
-                    ('VALIGN', (0, 0), (-1, 0), 'MIDDLE'),
-                    ('LEFTPADDING', (0, 0), (-1, 0), 0),
-                    ('LEFTPADDING', (0, 1), (-1, -1), 3),
-                    ('LEFTPADDING', (2, 2), (2, -1), 5),
-                    ('LEFTPADDING', (13, 2), (13, -1), 5),
-                    ('LEFTPADDING', (24, 2), (24, -1), 5),
-                    ('RIGHTPADDING', (0, 0), (-1, -1), 3),
-                    ('TOPPADDING', (0, 0), (-1, 0), 2.5),
-                    ('TOPPADDING', (0, 1), (-1, 1), 10),
-                    ('TOPPADDING', (0, 2), (-1, -1), 0),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), .5),
-                    ('BOTTOMPADDING', (0, 1), (-1, 1), 1.5),
-                    ('BOTTOMPADDING', (0, -1), (-1, -1), 18),
-                ]
-
-                cust2eff = {
-                    'cust1': 'do 27.04.2005',
-                    'cust2': 'od 28.04.2005 do 30.06.2010',
-                    'cust3': 'od 01.07.2010',
-                    'cust5': 'od 01.07.2013 do 31.12.2013',
-                }
-
-                mpitypes = {
-                    'DISC': 'diskontní sazba',
-                    'REPO': '2T repo sazba',
-                }
-
-                wid = 483.3
-                widl = 8
-                widr = 8
-                widg = 12
-                widf = widc = (wid - widl - widr - (widg * 2)) / 6
-                cwid = (
-                    (widl,) + ((widc / 5,) * 5) + ((widf / 5,) * 5) + (widg,) + ((widc / 5,) * 5) + ((widf / 5,) * 5)
-                    + (widg,) + ((widc / 5,) * 5) + ((widf / 5,) * 5) + (widr,))
-
-                res = calc(debt)
-                thickness = .5
-
-                info = []
-
-                if debt.debits:
-                    info.append(Paragraph('Závazky:', style23))
-                    for debit in debt.debits:
-                        info.append(Paragraph(
-                            '<b>{}</b>'.format(debit.description) if debit.description else '<i>(bez názvu)</i>',
-                            style24,
-                            bulletText=debit.id + '.'))
-                        model = debit.model
-                        if model == 'fixed':
-                            txt = (
-                                'pevná částka {}, splatná {:%d.%m.%Y}'
-                                .format(lfamt(debit.fixed_amount, debit.fixed_currency), debit.fixed_date))
-                        else:
-                            if model == 'per_annum':
-                                txt = (
-                                    'roční úrok {0.rate:n} % <i>p. a.</i> (konvence pro počítání dnů: '
-                                    '{0.day_count_convention})'.format(debit))
-                            elif model == 'per_mensem':
-                                txt = (
-                                    'měsíční úrok {0.rate:n} % <i>p. m.</i> (konvence pro počítání dnů: '
-                                    '{0.day_count_convention})'.format(debit))
-                            elif model == 'per_diem':
-                                txt = 'denní úrok {:n} ‰ <i>p. d.</i>'.format(debit.rate)
-                            elif model in {'cust1', 'cust2', 'cust3', 'cust5'}:
-                                txt = (
-                                    'zákonný úrok z prodlení podle nařízení vlády č. 142/1994 Sb. ve znění účinném {}'
-                                    .format(cust2eff[model]))
-                            elif model == 'cust6':
-                                txt = 'zákonný úrok z prodlení podle nařízení vlády č. 351/2013 Sb.'
-                            else:
-                                txt = 'zákonný poplatek z prodlení podle nařízení vlády č. 142/1994 Sb.'
-                            if debit.principal_debit:
-                                txt += ' ze závazku {}'.format(n2l(debit.principal_debit - 1))
-                            else:
-                                txt += (
-                                    ' z částky {}'.format(lfamt(debit.principal_amount, debit.principal_currency)))
-                            if debit.date_from:
-                                txt += ' od {:%d.%m.%Y}'.format(debit.date_from)
-                            elif debit.principal_debit:
-                                txt += ' od splatnosti'
-                            if debit.date_to:
-                                txt += ' do {:%d.%m.%Y}'.format(debit.date_to)
-                            elif debit.principal_debit:
-                                txt += ' do zaplacení'
-                        info.append(Paragraph(txt, style25))
-
-                if debt.fxrates:
-                    info.append(Paragraph(
-                        'Pevně zadané směnné kursy:',
-                        style23))
-                    for fxrate in debt.fxrates:
-                        txt = ''
-                        if fxrate.date_from:
-                            txt += ' od {:%d.%m.%Y}'.format(fxrate.date_from)
-                        if fxrate.date_to:
-                            txt += ' do {:%d.%m.%Y}'.format(fxrate.date_to)
-                        if txt:
-                            txt = ' ({})'.format(txt.strip())
-                        info.append(Paragraph(
-                            '{0.rate_from:n} {0.currency_from} = {0.rate_to:n} {0.currency_to}{1}'.format(fxrate, txt),
-                            style20,
-                            bulletText='–'))
-
-                if res.fxinfo:
-                    res.fxinfo.sort(key=lambda x: x['date_required'])
-                    res.fxinfo.sort(key=lambda x: x['currency'])
-                    rmdsl(res.fxinfo)
-                    info.append(Paragraph('Použité směnné kursy ČNB:', style23))
-                    for fxr in res.fxinfo:
-                        info.append(Paragraph(
-                            '{0[quantity]:d} {0[currency]} = {1:.3f} CZK, platný ke dni {0[date_required]:%d.%m.%Y}'
-                            .format(fxr, LocalFloat(fxr['rate'])),
-                            style20,
-                            bulletText='–'))
-
-                if res.fix:
-                    res.fix.sort(key=lambda x: x['currency_to'])
-                    res.fix.sort(key=lambda x: x['currency_from'])
-                    rmdsl(res.fix)
-                    info.append(Paragraph('Použité fixní směnné poměry:', style23))
-                    for fix in res.fix:
-                        info.append(Paragraph(
-                            '{0} {1[currency_from]} = 1 {1[currency_to]}, platný od {1[date_from]:%d.%m.%Y}'
-                            .format(famt(fix['rate']), fix),
-                            style20,
-                            bulletText='–'))
-
-                if res.mpi:
-                    res.mpi.sort(key=(lambda x: x['date']))
-                    res.mpi.sort(key=(lambda x: x['type']))
-                    rmdsl(res.mpi)
-                    info += [Paragraph(('Použité úrokové sazby ČNB:'), style23)]
-                    for mpi in res.mpi:
-                        info.append(Paragraph(
-                            '{} ke dni {:%d.%m.%Y}: {:.2f} % <i>p. a.</i>'
-                            .format(mpitypes[mpi['type']], mpi['date'], LocalFloat(mpi['rate'])),
-                            style20,
-                            bulletText='–'))
-
-                info.append(Spacer(0, 50))
-                flow.extend(info)
-
-                for row in res.rows:
-
-                    typ = row['type']
-                    spf = bool(row['sps'])
-
-                    hdr = EL * 3
-                    lin = ([0] * 3)
-                    cleft = [[], [], []]
-                    cright = [[], [], []]
-
-                    if typ == DR:
-                        hdr[0] = 'Závazek'
-                        lin[0] = 1
-                        cleft[0].append(row['id'])
-                        cright[0].append((row['amount'], row['disp_currency']))
-
-                    if typ == CR:
-                        hdr[0] = 'Splátka'
-                        lin[0] = 1
-                        cleft[0].append('∑')
-                        cright[0].append((-row['amount'], row['disp_currency']))
-                        for debit, amount in zip(debt.debits, row['cr_distr']):
-                            if abs(amount) > LIM:
-                                lin[0] += 1
-                                cleft[0].append(debit.id)
-                                cright[0].append((amount, debit.currency))
-
-                    if typ in {DR, CR}:
-                        for itm in row['pre']:
-                            if abs(itm) > LIM:
-                                hdr[1] = 'Předchozí zůstatek'
-                                for debit, amount in zip(debt.debits, row['pre']):
-                                    if abs(amount) > LIM:
-                                        lin[1] += 1
-                                        cleft[1].append(debit.id)
-                                        cright[1].append((amount, debit.currency))
-                                if not res.multicurrency_debit and lin[1] > 1:
-                                    lin[1] += 1
-                                    cleft[1].append('∑')
-                                    cright[1].append((row['pre_total'], res.currency_debits))
-                                break
-
-                    if spf:
-                        hdr[2] = 'Přeplatek'
-                        for spa in row['sps']:
-                            lin[2] += 1
-                            cleft[2].append('∑')
-                            cright[2].append((spa['total'], spa['curr']))
-                    else:
-                        hdr[2] = 'Nový zůstatek' if hdr[1] else 'Zůstatek'
-                        for debit, amount in zip(debt.debits, row['post']):
-                            if abs(amount) > LIM:
-                                lin[2] += 1
-                                cleft[2].append(debit.id)
-                                cright[2].append((amount, debit.currency))
-                        if not res.multicurrency_debit and lin[2] > 1:
-                            lin[2] += 1
-                            cleft[2].append('∑')
-                            cright[2].append((row['post_total'], res.currency_debits))
-
-                    lmax = max(lin)
-
-                    for idx in range(3):
-                        while len(cleft[idx]) < lmax:
-                            cleft[idx].append('')
-                        while len(cright[idx]) < lmax:
-                            cright[idx].append((None, None))
-
-                    ast = [
-                        ('RIGHTPADDING', (2, 2), (10, 1 + lmax), 0),
-                        ('RIGHTPADDING', (13, 2), (21, 1 + lmax), 0),
-                        ('RIGHTPADDING', (24, 2), (32, 1 + lmax), 0),
-                        ('BOTTOMPADDING', (0, 2), (-1, 1 + lmax), 0),
-                    ]
-
-                    for idx in range(lmax):
-                        ast.extend([
-                            ('SPAN', (2, 2 + idx), (10, 2 + idx)),
-                            ('SPAN', (13, 2 + idx), (21, 2 + idx)),
-                            ('SPAN', (24, 2 + idx), (32, 2 + idx)),
-                        ])
-
-                    for idx in range(3):
-                        if hdr[idx]:
-                            ast.append(('LINEBELOW', (1 + (11 * idx), 1), (10 + (11 * idx), 1), thickness, black))
-                        if lin[idx]:
-                            ast.append(
-                                ('LINEAFTER', (1 + (11 * idx), 2), (1 + (11 * idx), 1 + lin[idx]), thickness, black))
-
-                    doc3 = []
-                    temp1 = [Paragraph('{:%d.%m.%Y}'.format(row['date']), style13)] + (EL * 4)
-                    temp2 = Paragraph(
-                        escape(row['description']).upper() if row['description'] else '<i>(bez názvu)</i>',
-                        style14)
-                    if typ == CR:
-                        if len(row['debits']) > 1:
-                            temp2 = (
-                                temp2,
-                                Paragraph('Pořadí závazků: {}'.format(' – '.join(map(n2l, row['debits']))), style26))
-                    temp2 = [temp2] + (EL * 28)
-                    doc3.extend([temp1 + temp2])
-
-                    temp = (
-                        EL + [Paragraph(hdr[0], style15)] + (EL * 10) + [Paragraph(hdr[1], style15)] + (EL * 10)
-                        + [Paragraph(hdr[2], style15), ''])
-                    doc3.extend([temp])
-
-                    for idx in range(lmax):
-                        temp = (
-                            EL + [Paragraph(cleft[0][idx], style17)] + [Paragraph(lfamt(*cright[0][idx]), style18)]
-                            + (EL * 9) + [Paragraph(cleft[1][idx], style17)]
-                            + [Paragraph(lfamt(*cright[1][idx]), style18)] + (EL * 9)
-                            + [Paragraph(cleft[2][idx], style17)] + [Paragraph(lfamt(*cright[2][idx]), style18)]
-                            + (EL * 9))
-                        doc3.extend([temp])
-
-                    temp = (EL * 34)
-                    doc3.extend([temp])
-
-                    table3 = Table(doc3, colWidths=cwid)
-                    table3.setStyle(TableStyle(bst + ast))
-                    flow.append(KeepTogether(table3))
-
-                if res.msg:
-                    flow.extend(
-                        [Spacer(0, 20),
-                         Paragraph(
-                             '(pro další transakce nejsou k disposici data, při výpočtu došlo k chybě)', style22)])
-
-                if debt.note:
-                    flow.append(Spacer(0, 24))
-                    temp = [Paragraph('Poznámka:'.upper(), style4)]
-                    for note in filter(bool, debt.note.strip().split('\n')):
-                        temp.append(Paragraph(escape(note), style12))
-                    flow.append(KeepTogether(temp[:2]))
-                    if len(temp) > 2:
-                        flow.extend(temp[2:])
-                temp = BytesIO()
                 response = HttpResponse(content_type='application/pdf')
                 response['Content-Disposition'] = 'attachment; filename=Pohledavka.pdf'
-                auth = '{} V{}'.format(APP.upper(), APPVERSION)
-                doc = SimpleDocTemplate(
-                    temp,
-                    pagesize=A4,
-                    title='Historie peněžité pohledávky',
-                    author=auth,
-                    leftMargin=64,
-                    rightMargin=48,
-                    topMargin=48,
-                    bottomMargin=96,
-                    )
-                make_pdf(
-                    doc,
-                    flow,
-                    string=auth,
-                    xml=to_xml(debt))
-                response.write(temp.getvalue())
+                to_pdf(debt, response)
                 return response
 
     res = calc(debt, ftbl)
@@ -2040,3 +2159,53 @@ def fxratedel(request, idx=0):
                 return error(request)
             return redirect('hsp:fxratedeleted')
         return redirect('hsp:mainpage')
+
+
+@csrf_exempt
+@require_http_methods(('POST',))
+@login_required
+def api(request):
+
+    LOGGER.debug('API accessed', request)
+    try:
+        debt, msg = from_xml(request.body)
+    except:
+        debt, msg = None, 'Chybný formát souboru'
+    if msg:
+        return JsonResponse({'error': msg}, status=400, json_dumps_params={'ensure_ascii': False})
+    res = calc(debt)
+    if res.msg:
+        return JsonResponse({'error': res.msg}, status=400, json_dumps_params={'ensure_ascii': False})
+    rows = []
+    for row in res.rows:
+        dct = {
+            'date': row['date'],
+            'type': ('debit', 'credit', 'balance')[row['type']],
+            'description': row['description'],
+            'amount': row['amount'],
+            'currency': row['disp_currency'],
+            'pre': row['pre'],
+            'change': row['change'],
+            'post': row['post'],
+            'unassigned': row['sps'],
+        }
+        if row['type'] == DR:
+            dct['id'] = row['id']
+        elif row['type'] == CR:
+            dct['debits'] = row['debits']
+        if not res.multicurrency_debit:
+            dct['pre_total'] = row['pre_total']
+            dct['post_total'] = row['post_total']
+        rows.append(dct)
+    last = res.rows[-1]['post'] if res.rows else [0] * len(debt.debits)
+    return JsonResponse(
+        {'title': debt.title,
+         'debits': [
+             {'id': debit.id, 'description': debit.description, 'currency': debit.currency, 'balance': balance}
+             for debit, balance in zip(debt.debits, last)],
+         'rows': rows,
+         'total': None if res.multicurrency_debit else round(sum(last), debt.rounding),
+         'fx_rates': res.fxinfo,
+         'fixed_rates': res.fix,
+         'mpi_rates': res.mpi},
+        json_dumps_params={'ensure_ascii': False})
@@ -25,7 +25,7 @@ from django.conf.urls import url
 from legal.common.views import genrender
 from legal.knr.views import (
     mainpage, placeform, placelist, placedel, carform, carlist, cardel, formulaform, formulalist, formuladel, itemlist,
-    itemform, itemdel, itemmove, presets)
+    itemform, itemdel, itemmove, presets, api)
 
 
 urlpatterns = [
@@ -73,4 +73,5 @@ urlpatterns = [
             'page_title': 'Smazání položky'},
         name='itemdeleted'),
     url(r'^presets/$', presets, name='presets'),
+    url(r'^api/$', api, name='api'),
 ]
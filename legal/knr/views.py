@@ -31,10 +31,11 @@ from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.enums import TA_RIGHT
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.colors import black, gray
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_http_methods
+from django.views.decorators.csrf import csrf_exempt
 from django.forms.models import model_to_dict
 from django.apps import apps
 from django.db.models import Q
@@ -838,6 +839,18 @@ def from_xml(dat):
     return calc, None
 
 
+def totals(calc):
+
+    total_net = total_ex = 0
+    for itm in calc.items:
+        if itm.vat:
+            total_net += int(itm.amount)
+        else:
+            total_ex += int(itm.amount)
+    total_vat = int(round(float(total_net * calc.vat_rate) / 100))
+    return total_net, total_ex, total_vat, int(total_net + total_ex + total_vat)
+
+
 @require_http_methods(('GET', 'POST'))
 @login_required
 def mainpage(request):
@@ -1120,14 +1133,7 @@ def mainpage(request):
                                 ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
                             )))
                         flow.extend([tbl2, Spacer(0, 24)])
-                    total_net = total_ex = 0
-                    for itm in calc.items:
-                        if itm.vat:
-                            total_net += int(itm.amount)
-                        else:
-                            total_ex += int(itm.amount)
-                    total_vat = int(round(float(total_net * calc.vat_rate) / 100))
-                    total = int(total_net + total_ex + total_vat)
+                    total_net, total_ex, total_vat, total = totals(calc)
                     doc3 = []
                     if total_vat:
                         doc3.append(
@@ -1207,14 +1213,9 @@ def mainpage(request):
                     var['{}_error'.format(key)] = 'err' if form[key].errors else ''
         else:  # pragma: no cover
             i2d(FIELDS, calc, var)
-    var['total_net'] = var['total_ex'] = var['num_items'] = 0
-    for itm in calc.items:
-        var['total_net' if itm.vat else 'total_ex'] += int(itm.amount)
-        var['num_items'] += 1
-    var['total_vat'] = int(round(float(var['total_net'] * calc.vat_rate) / 100))
-    var['total'] = int(var['total_net'] + var['total_ex'] + var['total_vat'])
-    for key in ('total_net', 'total_ex', 'total_vat', 'total'):
-        var[key] = famt(var[key])
+    var['num_items'] = len(calc.items)
+    for key, val in zip(('total_net', 'total_ex', 'total_vat', 'total'), totals(calc)):
+        var[key] = famt(val)
     return render(request, 'knr_mainpage.xhtml', var)
 
 
@@ -2065,3 +2066,29 @@ def presets(request):
             Rate(formula_id=fid, fuel=rat[0], rate=rat[1]).save()
     LOGGER.info('Presets restored', request)
     return redirect('knr:mainpage')
+
+
+@csrf_exempt
+@require_http_methods(('POST',))
+@login_required
+def api(request):
+
+    LOGGER.debug('API accessed', request)
+    try:
+        calc, msg = from_xml(request.body)
+    except:
+        calc, msg = None, 'Chybný formát souboru'
+    if msg:
+        return JsonResponse({'error': msg}, status=400, json_dumps_params={'ensure_ascii': False})
+    total_net, total_ex, total_vat, total = totals(calc)
+    return JsonResponse(
+        {'title': calc.title,
+         'vat_rate': calc.vat_rate,
+         'items': [
+             {'type': item.type, 'description': item.description, 'amount': int(item.amount), 'vat': item.vat}
+             for item in calc.items],
+         'total_net': total_net,
+         'total_ex': total_ex,
+         'total_vat': total_vat,
+         'total': total},
+        json_dumps_params={'ensure_ascii': False})
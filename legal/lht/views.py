@@ -26,8 +26,8 @@ from calendar import monthrange
 from django.views.decorators.http import require_http_methods
 from django.apps import apps
 
-from legal.common.glob import WD_NAMES, INERR_SHORT, ODP, ODM, UNC_DATE
-from legal.common.utils import fdt, holiday, getbutton, LOGGER, between, render
+from legal.common.glob import WD_NAMES, INERR_SHORT, UNC_DATE
+from legal.common.utils import fdt, is_holiday, add_business_days, getbutton, LOGGER, between, render
 from legal.lht.glob import MIN_DATE, MAX_DATE, MIN_DUR, MAX_DUR
 from legal.lht.forms import MainForm
 
@@ -59,8 +59,6 @@ class Period:
             self.msg = 'Délka musí být mezi {:d} a {:d}'.format(MIN_DUR, MAX_DUR)
             return
 
-        offset = ODM if dur < 0 else ODP
-
         if unit == 'd':
             res = beg + timedelta(days=dur)
 
@@ -79,22 +77,15 @@ class Period:
             res = date(year, month, min(beg.day, monthrange(year, month)[1]))
 
         elif unit == 'b':
-            res = beg
-            for _ in range(abs(dur)):
-                res += offset
-                while holiday(res):
-                    res += offset
-            while holiday(res):  # only needed for dur == 0
-                res += offset
+            res = add_business_days(beg, dur)
 
         else:
             self.msg = 'Neznámá jednotka'
             return
 
         bus = res
-        if unit != 'b':
-            while holiday(bus):
-                bus += offset
+        if unit != 'b' and is_holiday(bus):
+            bus = add_business_days(bus, 0 if dur >= 0 else -1)
 
         if not between(MIN_DATE, bus, MAX_DATE):
             self.msg = out_msg()
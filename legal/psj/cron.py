@@ -27,7 +27,7 @@ from bs4 import BeautifulSoup
 from django.http import QueryDict
 
 from legal.common.glob import LOCAL_URL
-from legal.common.utils import get, decomposeref, normreg, sleep, LOGGER
+from legal.common.utils import get, fetch_all, decomposeref, normreg, LOGGER
 from legal.szr.models import Court
 from legal.szr.glob import SUPREME_COURT, SUPREME_ADMINISTRATIVE_COURT
 from legal.szr.cron import getauxid
@@ -41,10 +41,10 @@ HEARING_URL = LOCAL_URL + '/psj/list/?court={}&senate={:d}&register={}&number={:
 
 def cron_courtrooms():
 
-    for court in Court.objects.exclude(id=SUPREME_ADMINISTRATIVE_COURT):
+    courts = Court.objects.exclude(id=SUPREME_ADMINISTRATIVE_COURT)
+    for court, res in fetch_all((court, LIST_COURTROOMS.format(court.pk)) for court in courts):
         try:
-            sleep(1)
-            res = get(LIST_COURTROOMS.format(court.pk))
+            assert res
             soup = BeautifulSoup(res.text, 'xml')
             for room in soup.find_all('jednaciSin'):
                 croom, croomc = Courtroom.objects.get_or_create(
@@ -95,6 +95,7 @@ def cron_update():
         court2 = ''
     tdate = str(task.date)
     try:
+        items = []
         for croom in Courtroom.objects.filter(court=task.court):
             query = QueryDict(mutable=True)
             query['type'] = 'jednani'
@@ -105,9 +106,9 @@ def cron_update():
             query['datum'] = '{0.day:d}.{0.month:d}.{0.year:d}'.format(task.date)
             query['spamQuestion'] = '23'
             query['druhVec'] = ''
-            url = ROOT_URL + GET_HEARINGS + query.urlencode()
-            sleep(1)
-            res = get(url)
+            items.append((croom, ROOT_URL + GET_HEARINGS + query.urlencode()))
+        for croom, res in fetch_all(items):
+            assert res
             soup = BeautifulSoup(res.text, 'html.parser')
             sched = soup.select('table tr td + td table tr td table tr')[6]
             if sched.select('b'):
@@ -148,27 +149,29 @@ def cron_update():
                             'closed': closed,
                             'cancelled': cancelled})
                     if hearing[1]:
+                        names = []
                         for query in parties:
                             qts = query.text.strip()
                             if qts:
                                 party = Party.objects.get_or_create(name=query.text.strip())[0]
                                 hearing[0].parties.add(party)
-                                sur_check(
-                                    {'check_psj': True},
-                                    qts,
-                                    task.court,
-                                    senate,
-                                    register,
-                                    number,
-                                    year,
-                                    HEARING_URL.format(
-                                        task.court.id,
-                                        senate,
-                                        quote(register),
-                                        number,
-                                        year,
-                                        tdate,
-                                        tdate))
+                                names.append(qts)
+                        sur_check(
+                            {'check_psj': True},
+                            names,
+                            task.court,
+                            senate,
+                            register,
+                            number,
+                            year,
+                            HEARING_URL.format(
+                                task.court.id,
+                                senate,
+                                quote(register),
+                                number,
+                                year,
+                                tdate,
+                                tdate))
                 except:
                     pass
         task.delete()
@@ -231,22 +234,22 @@ def cron_update2():
                 if hearing[1]:
                     for party in parties:
                         hearing[0].parties.add(party)
-                        sur_check(
-                            {'check_psj': True},
-                            party.name,
-                            nss,
+                    sur_check(
+                        {'check_psj': True},
+                        [x.name for x in parties],
+                        nss,
+                        senate,
+                        register,
+                        number,
+                        year,
+                        HEARING_URL.format(
+                            nss.id,
                             senate,
-                            register,
+                            quote(register),
                             number,
                             year,
-                            HEARING_URL.format(
-                                nss.id,
-                                senate,
-                                quote(register),
-                                number,
-                                year,
-                                ttm.date(),
-                                ttm.date()))
+                            ttm.date(),
+                            ttm.date()))
             except:  # pragma: no cover
                 pass
     except:  # pragma: no cover
@@ -213,7 +213,7 @@ LOGGING = {
             'handlers':
                 ('error_mail', 'error_file', 'info_file')
                 + (('debug_file',) if DEBUG_LOG else []),
-            'level': 'DEBUG',
+            'level': 'DEBUG' if DEBUG_LOG else 'INFO',
         },
     },
     'filters': {
@@ -305,6 +305,12 @@ DATE_INPUT_FORMATS = ('%d.%m.%Y',)
 JQUERY_VERSION = '3.4.1'
 JQUERY_UI_VERSION = '1.12.1'
 
+CRON_WORKERS = {
+    'default': 4,
+    'sir': 1,
+    'uds': 1,
+}
+
 DEFAULT_CONTENT_TYPE = 'application/xhtml+xml'
 DEFAULT_CHARSET = 'utf-8'
 FULL_CONTENT_TYPE = '{}; charset={}'.format(DEFAULT_CONTENT_TYPE, DEFAULT_CHARSET)
@@ -20,25 +20,43 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
 from datetime import datetime, timedelta
+from io import BytesIO
+from multiprocessing import get_context
+from os import cpu_count
+from time import sleep
+from zlib import crc32
 
 from bs4 import BeautifulSoup
-from django.contrib.auth.models import User
-
-from legal.common.utils import normalize, post, LOGGER
+from lxml import etree
+from django.db import connections, OperationalError
+from django.db.models import Q
+from django.db.transaction import atomic
+
+from legal.settings import TEST
+from legal.common.utils import normalize, post, fetch_all, LOGGER, Lease
+from legal.common.worker import setup_worker
 from legal.dir.cron import dir_check
 from legal.dir.models import Discovered
 from legal.sir.glob import L2N, L2S, SELIST, BELIST
 from legal.sir.models import (
-    DruhStavRizeni, Vec, DruhRoleVRizeni, Osoba, Role, DruhAdresy, Adresa, Counter, Transaction, Insolvency, Tracked)
+    DruhStavRizeni, Vec, DruhRoleVRizeni, Osoba, Role, DruhAdresy, Adresa, Counter, Transaction, Progress, Insolvency,
+    Tracked)
 
 
 PREF = 20
 
+SHARDS = 64
+
 
-def convdt(string):
+def get_shard(spisovaZnacka):
+    """
+    Get shard of transaction, all transactions of one case share the same shard.
+    """
 
-    return datetime.strptime(string.string[:19], "%Y-%m-%dT%H:%M:%S")
+    return crc32(spisovaZnacka.split()[-1].encode()) % SHARDS
 
 
 def convd(string):
@@ -46,62 +64,94 @@ def convd(string):
     return datetime.strptime(string.string[:10], "%Y-%m-%d")
 
 
-def cron_gettr():
+GETTR_URL = 'https://isir.justice.cz:8443/isir_public_ws/IsirWsPublicService'
 
-    idx = Counter.objects.get(id='DL').number
-    while True:
-        soup = BeautifulSoup('', 'lxml')
-        soup.is_xml = True
-
-        envelope = soup.handle_starttag(
-            'Envelope', None,
-            'soapenv', {
-                'xmlns:soapenv': 'http://schemas.xmlsoap.org/soap/envelope/',
-                'xmlns:typ': 'http://isirpublicws.cca.cz/types/'})
-        header = soup.new_tag('Header', None, 'soapenv')
-        envelope.append(header)
-        body = soup.new_tag('Body', None, 'soapenv')
-        envelope.append(body)
-        req = soup.new_tag('getIsirWsPublicIdDataRequest', None, 'typ')
-        body.append(req)
-        idPodnetu = soup.new_tag('idPodnetu', None, None)
-        idPodnetu.append(str(idx))
-        req.append(idPodnetu)
-        url = 'https://isir.justice.cz:8443/isir_public_ws/IsirWsPublicService'
-
-        headers = {
-            'content-type': 'text/xml; charset=utf-8',
-            'SOAPAction': '"http://isirpublicws.cca.cz/types/"',
-        }
+GETTR_HEADERS = {
+    'content-type': 'text/xml; charset=utf-8',
+    'SOAPAction': '"http://isirpublicws.cca.cz/types/"',
+}
 
-        res = post(url, soup.renderContents(), headers=headers)
 
-        xml = res.content.decode('utf-8')
+def gettr_query(idx):
 
-        soup = BeautifulSoup(xml, 'lxml')
-        soup.is_xml = True
+    soup = BeautifulSoup('', 'lxml')
+    soup.is_xml = True
+
+    envelope = soup.handle_starttag(
+        'Envelope', None,
+        'soapenv', {
+            'xmlns:soapenv': 'http://schemas.xmlsoap.org/soap/envelope/',
+            'xmlns:typ': 'http://isirpublicws.cca.cz/types/'})
+    header = soup.new_tag('Header', None, 'soapenv')
+    envelope.append(header)
+    body = soup.new_tag('Body', None, 'soapenv')
+    envelope.append(body)
+    req = soup.new_tag('getIsirWsPublicIdDataRequest', None, 'typ')
+    body.append(req)
+    idPodnetu = soup.new_tag('idPodnetu', None, None)
+    idPodnetu.append(str(idx))
+    req.append(idPodnetu)
+
+    return soup.renderContents()
 
-        if not (soup.stav and soup.stav.string == 'OK' and soup.find('data')):
-            break
 
-        lst = []
-        for t_data in soup.find_all('data'):
-            idx = int(t_data.id.string)
-            lst.append(Transaction(
-                id=idx,
-                datumZalozeniUdalosti=convdt(t_data.datumzalozeniudalosti),
-                datumZverejneniUdalosti=convdt(t_data.datumzverejneniudalosti),
-                dokumentUrl=(t_data.dokumenturl.string.strip() if t_data.dokumenturl else None),
-                spisovaZnacka=t_data.spisovaznacka.string.strip(),
-                typUdalosti=t_data.typudalosti.string.strip(),
-                popisUdalosti=t_data.popisudalosti.string.strip(),
-                oddil=(t_data.oddil.string.strip() if t_data.oddil else None),
-                cisloVOddilu=(int(t_data.cislovoddilu.string) if t_data.cislovoddilu else None),
-                poznamkaText=(t_data.poznamka.string.strip() if t_data.poznamka else None),
-                error=False))
-
-        Transaction.objects.bulk_create(lst)
-        LOGGER.debug('Read {:d} transaction(s)'.format(len(lst)))
+def gettext(elem, tag):
+
+    text = elem.findtext(tag)
+    return text.strip() if text is not None else None
+
+
+def gettr_parse(content):
+    """
+    Parse response page incrementally, releasing processed elements,
+    return list of transactions, None if the page is not valid.
+    """
+
+    lst = []
+    stav = None
+    try:
+        for _, elem in etree.iterparse(BytesIO(content), tag=('data', 'stav')):
+            if elem.tag == 'stav':
+                stav = elem.text
+            else:
+                spisovaZnacka = gettext(elem, 'spisovaZnacka')
+                cisloVOddilu = elem.findtext('cisloVOddilu')
+                lst.append(Transaction(
+                    id=int(elem.findtext('id')),
+                    datumZalozeniUdalosti=datetime.strptime(
+                        elem.findtext('datumZalozeniUdalosti')[:19], '%Y-%m-%dT%H:%M:%S'),
+                    datumZverejneniUdalosti=datetime.strptime(
+                        elem.findtext('datumZverejneniUdalosti')[:19], '%Y-%m-%dT%H:%M:%S'),
+                    dokumentUrl=gettext(elem, 'dokumentUrl'),
+                    spisovaZnacka=spisovaZnacka,
+                    typUdalosti=gettext(elem, 'typUdalosti'),
+                    popisUdalosti=gettext(elem, 'popisUdalosti'),
+                    oddil=gettext(elem, 'oddil'),
+                    cisloVOddilu=(int(cisloVOddilu) if cisloVOddilu is not None else None),
+                    poznamkaText=gettext(elem, 'poznamka'),
+                    error=False,
+                    shard=get_shard(spisovaZnacka)))
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    except etree.XMLSyntaxError:
+        return None
+    return lst if stav == 'OK' else None
+
+
+def cron_gettr():
+
+    idx = Counter.objects.get(id='DL').number
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(post, GETTR_URL, gettr_query(idx), headers=GETTR_HEADERS)
+        while True:
+            Lease.check()
+            lst = gettr_parse(future.result().content)
+            if not lst:
+                break
+            future = executor.submit(post, GETTR_URL, gettr_query(lst[-1].id), headers=GETTR_HEADERS)
+            Transaction.objects.bulk_create(lst)
+            LOGGER.debug('Read {:d} transaction(s)'.format(len(lst)))
 
 
 def p2s(ins):
@@ -109,212 +159,398 @@ def p2s(ins):
     return 'INS {0.number:d}/{0.year:d}'.format(ins)
 
 
-def cron_proctr():
+PROCTR_CHUNK = 500
 
-    idx = Counter.objects.get(id='DL').number
-    debtor = DruhRoleVRizeni.objects.get_or_create(desc='DLUŽNÍK')[0]
-    for trans in Transaction.objects.filter(error=False).order_by('id'):
-        idx = trans.id
+PROCTR_WORKERS = 1 if TEST else cpu_count()
+
+PROCTR_RETRIES = 3
+
+ADRESA_FIELDS = ('mesto', 'ulice', 'cisloPopisne', 'okres', 'zeme', 'psc', 'telefon', 'fax', 'textAdresy')
+
+OSOBA_FIELDS = (
+    'nazevOsoby', 'nazevOsobyObchodni', 'jmeno', 'titulPred', 'titulZa', 'ic', 'dic', 'rc', 'datumNarozeni')
+
+
+def getstr(tag):
+
+    return normalize(tag.string) if tag else None
+
+
+def parse_trans(trans):
+    """
+    Parse transaction into a plain record, None if it is to be skipped.
+    """
+
+    bc, rocnik = map(int, trans.spisovaZnacka.split()[-1].split('/'))
+    if bc <= 0 or rocnik <= 0:
+        return None
+
+    subsoup = BeautifulSoup(trans.poznamkaText.strip(), 'lxml')
+    subsoup.is_xml = True
+
+    t_udalost = subsoup.find('ns2:udalost')
+    t_vec = t_udalost.vec
+    t_osoba = t_udalost.osoba
+
+    idOsobyPuvodce = t_udalost.idosobypuvodce.string.strip()
+    rec = {
+        'id': trans.id,
+        'vec': (idOsobyPuvodce, bc, rocnik),
+        'date': trans.datumZalozeniUdalosti.date(),
+        'druhStavRizeni': (
+            t_vec.druhstavrizeni.string.strip() if t_vec and t_vec.druhstavrizeni else None),
+        'datumVyskrtnuti': convd(t_udalost.datumvyskrtnuti) if t_udalost.datumvyskrtnuti else None,
+        'typUdalosti': int(trans.typUdalosti) if trans.oddil and trans.typUdalosti else None,
+        'osoba': None,
+    }
+
+    if t_osoba:
+        rc = t_osoba.rc.string.strip().replace('/', '') if t_osoba.rc else None
+        datumNarozeni = convd(t_osoba.datumnarozeni) if t_osoba.datumnarozeni else None
+        if not datumNarozeni and rc:
+            year = int(rc[:2]) + 2000
+            if year > rocnik:
+                year -= 100
+            datumNarozeni = datetime(year, int(rc[2:4]) % 50, int(rc[4:6]))
+        osoba = rec['osoba'] = {
+            'key': (idOsobyPuvodce, t_osoba.idosoby.string.strip()),
+            'druhRoleVRizeni': t_osoba.druhrolevrizeni.string.strip(),
+            'fields': {
+                'nazevOsoby': normalize(t_osoba.nazevosoby.string),
+                'nazevOsobyObchodni': getstr(t_osoba.nazevosobyobchodni),
+                'jmeno': getstr(t_osoba.jmeno),
+                'titulPred': getstr(t_osoba.titulpred),
+                'titulZa': getstr(t_osoba.titulza),
+                'ic': getstr(t_osoba.ic),
+                'dic': getstr(t_osoba.dic),
+                'rc': rc,
+                'datumNarozeni': datumNarozeni,
+            },
+            'zrusena': bool(t_osoba.datumosobavevecizrusena),
+            'adresa': None,
+        }
+
+        t_adresa = t_udalost.adresa
+        if not osoba['zrusena'] and t_adresa:
+            osoba['adresa'] = {
+                'druhAdresy': t_adresa.druhadresy.string.strip(),
+                'fields': (
+                    getstr(t_adresa.mesto),
+                    getstr(t_adresa.ulice),
+                    getstr(t_adresa.cislopopisne),
+                    getstr(t_adresa.okres),
+                    getstr(t_adresa.zeme),
+                    t_adresa.psc.string.replace(' ', '').replace('/', '')[:5] if t_adresa.psc else None,
+                    getstr(t_adresa.telefon),
+                    getstr(t_adresa.fax),
+                    getstr(t_adresa.textadresy)),
+                'pobytdo': bool(t_adresa.datumpobytdo),
+            }
+
+    return rec
+
+
+def get_descs(model, descs):
+
+    new = descs - set(model.objects.filter(desc__in=descs).values_list('desc', flat=True))
+    if new:
+        model.objects.bulk_create([model(desc=x) for x in sorted(new)], ignore_conflicts=True)
+    return {x.desc: x for x in model.objects.filter(desc__in=descs)}
+
+
+def get_adresy(keys):
+
+    res = {}
+    keys = list(keys)
+    for idx in range(0, len(keys), 100):
+        query = Q()
+        for key in keys[idx:idx + 100]:
+            query |= Q(druhAdresy_id=key[0], **dict(zip(ADRESA_FIELDS, key[1:])))
+        for adresa in Adresa.objects.filter(query).order_by('-id'):
+            res[(adresa.druhAdresy_id,) + tuple(getattr(adresa, x) for x in ADRESA_FIELDS)] = adresa
+    return res
+
+
+def apply_m2m(through, field1, field2, existing, current):
+
+    new = current - existing
+    through.objects.bulk_create([through(**{field1: x, field2: y}) for x, y in new], ignore_conflicts=True)
+    old = {}
+    for key1, key2 in existing - current:
+        old.setdefault(key1, []).append(key2)
+    for key1, keys2 in old.items():
+        through.objects.filter(**{field1: key1, field2 + '__in': keys2}).delete()
+
+
+@atomic
+def proctr_chunk(recs, debtor):
+    """
+    Apply parsed transactions of one chunk in id order using set-based queries.
+    """
+
+    now = datetime.now()
+
+    vkeys = {x['vec'] for x in recs}
+
+    def get_vecs():
+        return {
+            (x.idOsobyPuvodce, x.bc, x.rocnik): x
+            for x in Vec.objects.filter(bc__in={x[1] for x in vkeys}, rocnik__in={x[2] for x in vkeys})
+            if (x.idOsobyPuvodce, x.bc, x.rocnik) in vkeys}
+
+    vecs = get_vecs()
+    new = {}
+    for rec in recs:
+        if rec['vec'] not in vecs and rec['vec'] not in new:
+            new[rec['vec']] = Vec(
+                idOsobyPuvodce=rec['vec'][0],
+                bc=rec['vec'][1],
+                rocnik=rec['vec'][2],
+                firstAction=rec['date'],
+                lastAction=rec['date'])
+    if new:
+        Vec.objects.bulk_create(new.values())
+        vecs = get_vecs()
+
+    stavy = get_descs(DruhStavRizeni, {x['druhStavRizeni'] for x in recs if x['druhStavRizeni']})
+    osrecs = [x['osoba'] for x in recs if x['osoba']]
+    druhy = get_descs(DruhRoleVRizeni, {x['druhRoleVRizeni'] for x in osrecs})
+    druhyAdres = get_descs(DruhAdresy, {x['adresa']['druhAdresy'] for x in osrecs if x['adresa']})
+
+    okeys = {x['key'] for x in osrecs}
+
+    def get_osoby():
+        return {
+            (x.idOsobyPuvodce, x.idOsoby): x
+            for x in Osoba.objects.select_for_update().filter(idOsoby__in={x[1] for x in okeys}).order_by('id')
+            if (x.idOsobyPuvodce, x.idOsoby) in okeys}
+
+    osoby = get_osoby()
+    new = {}
+    for osrec in osrecs:
+        if osrec['key'] not in osoby and osrec['key'] not in new:
+            new[osrec['key']] = Osoba(
+                idOsobyPuvodce=osrec['key'][0], idOsoby=osrec['key'][1], **osrec['fields'])
+    if new:
+        Osoba.objects.bulk_create([new[x] for x in sorted(new)], ignore_conflicts=True)
+        osoby = get_osoby()
+    oids = [x.id for x in osoby.values()]
+
+    rkeys = {(osoby[x['key']].id, druhy[x['druhRoleVRizeni']].id) for x in osrecs}
+
+    def get_roles():
+        return {(x.osoba_id, x.druhRoleVRizeni_id): x for x in Role.objects.filter(osoba_id__in=oids)}
+
+    roles = get_roles()
+    new = [Role(osoba_id=x, druhRoleVRizeni_id=y) for x, y in rkeys if (x, y) not in roles]
+    if new:
+        Role.objects.bulk_create(new, ignore_conflicts=True)
+        roles = get_roles()
+
+    akeys = {
+        (druhyAdres[x['adresa']['druhAdresy']].id,) + x['adresa']['fields'] for x in osrecs if x['adresa']}
+    adresy = get_adresy(akeys)
+    new = [Adresa(druhAdresy_id=x[0], **dict(zip(ADRESA_FIELDS, x[1:]))) for x in akeys if x not in adresy]
+    if new:
+        Adresa.objects.bulk_create(new)
+        adresy = get_adresy(akeys)
+
+    vids = [x.id for x in vecs.values()]
+    VecRoles = Vec.roles.through
+    vec_roles = set(VecRoles.objects.filter(vec_id__in=vids).values_list('vec_id', 'role_id'))
+    curr_vec_roles = set(vec_roles)
+    OsobaAdresy = Osoba.adresy.through
+    osoba_adresy = set(OsobaAdresy.objects.filter(osoba_id__in=oids).values_list('osoba_id', 'adresa_id'))
+    curr_osoba_adresy = set(osoba_adresy)
+
+    ins_keys = {x['vec'][1:] for x in recs if x['typUdalosti'] is not None and x['typUdalosti'] not in SELIST}
+    insolvencies = {}
+    if ins_keys:
+        for ins in Insolvency.objects.filter(
+                number__in={x[0] for x in ins_keys}, year__in={x[1] for x in ins_keys}).select_related('uid'):
+            insolvencies.setdefault((ins.number, ins.year), []).append(ins)
+    tracked = set(Tracked.objects.filter(vec_id__in=vids).values_list('uid_id', 'desc', 'vec_id'))
+    new_tracked = []
+    notify = set()
+    checks = []
+
+    for rec in recs:
+        vec = vecs[rec['vec']]
+        if rec['druhStavRizeni']:
+            vec.druhStavRizeni = stavy[rec['druhStavRizeni']]
+        if rec['datumVyskrtnuti']:
+            vec.datumVyskrtnuti = rec['datumVyskrtnuti']
+        elif not vec.lastAction or rec['date'] > vec.lastAction:
+            vec.lastAction = rec['date']
+
+        if rec['typUdalosti'] is not None and rec['typUdalosti'] not in SELIST:
+            for ins in insolvencies.get(rec['vec'][1:], ()):
+                if ins.detailed or rec['typUdalosti'] in BELIST:
+                    key = (ins.uid_id, ins.desc, vec.id)
+                    if key not in tracked:
+                        tracked.add(key)
+                        new_tracked.append(Tracked(uid_id=ins.uid_id, desc=ins.desc, vec=vec))
+                        if ins.uid.email:
+                            notify.add(ins.id)
+                        LOGGER.info(
+                            'Change detected in proceedings "{}" ({}) for user "{}" ({:d})'
+                            .format(ins.desc, p2s(ins), ins.uid.username, ins.uid_id))
+
+        osrec = rec['osoba']
+        if osrec:
+            osoba = osoby[osrec['key']]
+            if rec['id'] > osoba.lastTransaction:
+                for key, val in osrec['fields'].items():
+                    setattr(osoba, key, val)
+                osoba.lastTransaction = rec['id']
+            druh = druhy[osrec['druhRoleVRizeni']]
+            key = (vec.id, roles[(osoba.id, druh.id)].id)
+            if druh == debtor and key not in curr_vec_roles:
+                checks.append((copy(osoba), vec))
+            curr_vec_roles.add(key)
+            if osrec['zrusena']:
+                curr_vec_roles.discard(key)
+            elif osrec['adresa']:
+                adresa = adresy[(druhyAdres[osrec['adresa']['druhAdresy']].id,) + osrec['adresa']['fields']]
+                key = (osoba.id, adresa.id)
+                curr_osoba_adresy.add(key)
+                if osrec['adresa']['pobytdo']:
+                    curr_osoba_adresy.discard(key)
+
+    for vec in vecs.values():
+        vec.timestamp_update = now
+    Vec.objects.bulk_update(
+        vecs.values(), ('druhStavRizeni', 'datumVyskrtnuti', 'lastAction', 'timestamp_update'))
+    for osoba in osoby.values():
+        osoba.timestamp_update = now
+    Osoba.objects.bulk_update(
+        sorted(osoby.values(), key=lambda x: x.id), OSOBA_FIELDS + ('lastTransaction', 'timestamp_update'))
+    apply_m2m(VecRoles, 'vec_id', 'role_id', vec_roles, curr_vec_roles)
+    apply_m2m(OsobaAdresy, 'osoba_id', 'adresa_id', osoba_adresy, curr_osoba_adresy)
+    Tracked.objects.bulk_create(new_tracked)
+    Insolvency.objects.filter(id__in=notify).update(notify=True)
+    if checks:
+        dir_check(checks)
+
+
+def proctr_retry(recs, debtor):
+    """
+    Apply records, retrying on transient database errors such as deadlocks
+    between workers, which are raised once the retries are exhausted.
+    """
+
+    for attempt in range(PROCTR_RETRIES):
+        try:
+            proctr_chunk(recs, debtor)
+            return
+        except OperationalError:
+            if attempt == PROCTR_RETRIES - 1:
+                raise
+            LOGGER.warning('Transient database error, retrying', exc_info=True)
+            sleep(attempt + 1)
+
+
+def proctr_batch(chunk, debtor):
+    """
+    Process chunk of transactions, fall back to single transactions on failure.
+    """
+
+    recs = []
+    errors = []
+    for trans in chunk:
         try:
-            bc, rocnik = map(int, trans.spisovaZnacka.split()[-1].split('/'))
-            if bc <= 0 or rocnik <= 0:
-                continue
-            datumZalozeniUdalosti = trans.datumZalozeniUdalosti
-
-            poznamkaText = trans.poznamkaText.strip()
-            subsoup = BeautifulSoup(poznamkaText, 'lxml')
-            subsoup.is_xml = True
-
-            t_udalost = subsoup.find('ns2:udalost')
-            t_vec = t_udalost.vec
-            t_osoba = t_udalost.osoba
-
-            idOsobyPuvodce = t_udalost.idosobypuvodce.string.strip()
-            druhStavRizeni = None
-            if t_vec:
-                if t_vec.druhstavrizeni:
-                    druhStavRizeni = DruhStavRizeni.objects.get_or_create(desc=t_vec.druhstavrizeni.string.strip())[0]
-
-            vec = Vec.objects.get_or_create(
-                idOsobyPuvodce=idOsobyPuvodce,
-                bc=bc,
-                rocnik=rocnik,
-                defaults={
-                    'firstAction': datumZalozeniUdalosti.date(),
-                    'lastAction': datumZalozeniUdalosti.date()})[0]
-
-            if druhStavRizeni:
-                vec.druhStavRizeni = druhStavRizeni
-
-            if t_udalost.datumvyskrtnuti:
-                vec.datumVyskrtnuti = convd(t_udalost.datumvyskrtnuti)
-            elif not vec.lastAction or datumZalozeniUdalosti.date() > vec.lastAction:
-                vec.lastAction = datumZalozeniUdalosti.date()
-
-            vec.save()
-
-            if trans.oddil and trans.typUdalosti:
-                typUdalosti = int(trans.typUdalosti)
-                if typUdalosti not in SELIST:
-                    for ins in Insolvency.objects.filter(number=bc, year=rocnik):
-                        if ins.detailed or typUdalosti in BELIST:
-                            if Tracked.objects.get_or_create(
-                                    uid_id=ins.uid_id,
-                                    desc=ins.desc,
-                                    vec=vec)[1]:
-                                if ins.uid.email:
-                                    Insolvency.objects.filter(id=ins.id).update(notify=True)
-                                LOGGER.info(
-                                    'Change detected in proceedings "{}" ({}) for user "{}" ({:d})'
-                                    .format(
-                                        ins.desc,
-                                        p2s(ins),
-                                        User.objects.get(pk=ins.uid_id).username,
-                                        ins.uid_id))
-
-            if t_osoba:
-                idOsoby = t_osoba.idosoby.string.strip()
-                druhRoleVRizeni = DruhRoleVRizeni.objects.get_or_create(desc=t_osoba.druhrolevrizeni.string.strip())[0]
-                nazevOsoby = normalize(t_osoba.nazevosoby.string)
-                osoba = Osoba.objects.get_or_create(
-                    idOsobyPuvodce=idOsobyPuvodce,
-                    idOsoby=idOsoby,
-                    defaults={
-                        'nazevOsoby': nazevOsoby})[0]
-                role = Role.objects.get_or_create(
-                    osoba=osoba,
-                    druhRoleVRizeni=druhRoleVRizeni)[0]
-                if t_osoba.nazevosobyobchodni:
-                    nazevOsobyObchodni = normalize(t_osoba.nazevosobyobchodni.string)
-                else:
-                    nazevOsobyObchodni = None
-                if t_osoba.jmeno:
-                    jmeno = normalize(t_osoba.jmeno.string)
-                else:
-                    jmeno = None
-                if t_osoba.titulpred:
-                    titulPred = normalize(t_osoba.titulpred.string)
-                else:
-                    titulPred = None
-                if t_osoba.titulza:
-                    titulZa = normalize(t_osoba.titulza.string)
-                else:
-                    titulZa = None
-                if t_osoba.ic:
-                    ic = normalize(t_osoba.ic.string)
-                else:
-                    ic = None
-                if t_osoba.dic:
-                    dic = normalize(t_osoba.dic.string)
-                else:
-                    dic = None
-                if t_osoba.datumnarozeni:
-                    datumNarozeni = convd(t_osoba.datumnarozeni)
-                else:
-                    datumNarozeni = None
-                if t_osoba.rc:
-                    rc = t_osoba.rc.string.strip().replace('/', '')
-                else:
-                    rc = None
-                if not datumNarozeni and rc:
-                    year = int(rc[:2]) + 2000
-                    if year > rocnik:
-                        year -= 100
-                    month = int(rc[2:4]) % 50
-                    day = int(rc[4:6])
-                    datumNarozeni = datetime(year, month, day)
-
-                osoba.nazevOsoby = nazevOsoby
-                osoba.nazevOsobyObchodni = nazevOsobyObchodni
-                osoba.jmeno = jmeno
-                osoba.titulPred = titulPred
-                osoba.titulZa = titulZa
-                osoba.ic = ic
-                osoba.dic = dic
-                osoba.rc = rc
-                osoba.datumNarozeni = datumNarozeni
-
-                osoba.save()
-                if druhRoleVRizeni == debtor and role not in vec.roles.all():
-                    dir_check(osoba, vec)
-                vec.roles.add(role)
-
-                if t_osoba.datumosobavevecizrusena:
-                    vec.roles.remove(role)
-                else:
-                    t_adresa = t_udalost.adresa
-
-                    if t_adresa:
-                        druhAdresy = DruhAdresy.objects.get_or_create(
-                            desc=t_adresa.druhadresy.string.strip())[0]
-                        if t_adresa.mesto:
-                            mesto = normalize(t_adresa.mesto.string)
-                        else:
-                            mesto = None
-                        if t_adresa.ulice:
-                            ulice = normalize(t_adresa.ulice.string)
-                        else:
-                            ulice = None
-                        if t_adresa.cislopopisne:
-                            cisloPopisne = normalize(t_adresa.cislopopisne.string)
-                        else:
-                            cisloPopisne = None
-                        if t_adresa.okres:
-                            okres = normalize(t_adresa.okres.string)
-                        else:
-                            okres = None
-                        if t_adresa.zeme:
-                            zeme = normalize(t_adresa.zeme.string)
-                        else:
-                            zeme = None
-                        if t_adresa.psc:
-                            psc = t_adresa.psc.string.replace(' ', '').replace('/', '')[:5]
-                        else:
-                            psc = None
-                        if t_adresa.telefon:
-                            telefon = normalize(t_adresa.telefon.string)
-                        else:
-                            telefon = None
-                        if t_adresa.fax:
-                            fax = normalize(t_adresa.fax.string)
-                        else:
-                            fax = None
-                        if t_adresa.textadresy:
-                            textAdresy = normalize(t_adresa.textadresy.string)
-                        else:
-                            textAdresy = None
-
-                        adresa = Adresa.objects.get_or_create(
-                            druhAdresy=druhAdresy,
-                            mesto=mesto,
-                            ulice=ulice,
-                            cisloPopisne=cisloPopisne,
-                            okres=okres,
-                            zeme=zeme,
-                            psc=psc,
-                            telefon=telefon,
-                            fax=fax,
-                            textAdresy=textAdresy)[0]
-
-                        osoba.adresy.add(adresa)
-
-                        if t_adresa.datumpobytdo:
-                            osoba.adresy.remove(adresa)
+            rec = parse_trans(trans)
+            if rec:
+                recs.append((trans, rec))
         except:
-            trans.error = True
-            trans.save()
+            errors.append(trans.id)
+    try:
+        proctr_retry([x[1] for x in recs], debtor)
+    except OperationalError:
+        raise
+    except:
+        LOGGER.warning('Batch of transactions {:d}-{:d} failed, falling back'.format(chunk[0].id, chunk[-1].id))
+        for trans, rec in recs:
+            try:
+                proctr_retry([rec], debtor)
+            except OperationalError:
+                raise
+            except:
+                errors.append(trans.id)
+    Transaction.objects.filter(id__in=errors).update(error=True)
+
+
+def proctr_worker(num, workers, debtor_id, lease=None):
+    """
+    Drain shards claimed with SKIP LOCKED, return the highest id processed;
+    lease is the (name, owner) of the parent's lock, if run in a worker process.
+    """
+
+    if lease:
+        Lease.set_current(Lease(*lease))
+    debtor = DruhRoleVRizeni.objects.get(id=debtor_id)
+    shards = list(range(SHARDS))
+    start = num * SHARDS // workers
+    shards = shards[start:] + shards[:start]
+    idx = None
+    busy = True
+    while busy:
+        busy = False
+        for shard in shards:
+            Lease.check()
+            with atomic():
+                progress = Progress.objects.select_for_update(skip_locked=True).filter(shard=shard).first()
+                if not progress:
+                    continue
+                chunk = list(
+                    Transaction.objects.filter(shard=shard, error=False, id__gt=progress.number)
+                    .order_by('id')[:PROCTR_CHUNK])
+                if not chunk:
+                    continue
+                proctr_batch(chunk, debtor)
+                progress.number = chunk[-1].id
+                progress.save()
+            idx = max(idx or 0, progress.number)
+            busy = True
+    return idx
 
-    Counter.objects.update_or_create(id='DL', defaults={'number': idx})
+
+def cron_proctr():
+
+    debtor = DruhRoleVRizeni.objects.get_or_create(desc='DLUŽNÍK')[0]
+    Progress.objects.bulk_create([Progress(shard=x) for x in range(SHARDS)], ignore_conflicts=True)
+    if PROCTR_WORKERS == 1:
+        res = [proctr_worker(0, 1, debtor.id)]
+    else:
+        lease = Lease.get_current()
+        lease = (lease.name, lease.owner) if lease else None
+        databases = {x: connections.databases[x]['NAME'] for x in connections}
+        with get_context('spawn').Pool(
+                processes=PROCTR_WORKERS, initializer=setup_worker, initargs=(databases,)) as pool:
+            res = pool.starmap(
+                proctr_worker, [(x, PROCTR_WORKERS, debtor.id, lease) for x in range(PROCTR_WORKERS)])
+    res = [x for x in res if x is not None]
+    if res:
+        Counter.objects.update_or_create(id='DL', defaults={'number': max(res)})
     LOGGER.debug('Transactions processed')
 
 
 def cron_deltr():
 
     Transaction.objects.filter(error=False).delete()
+    Progress.objects.all().delete()
     LOGGER.debug('Transactions deleted')
 
 
-def get_ws2(vec):
+WS2_URL = 'https://isir.justice.cz:8443/isir_cuzk_ws/IsirWsCuzkService'
+
+WS2_HEADERS = {
+    'content-type': 'text/xml; charset=utf-8',
+    'SOAPAction': '"http://isirws.cca.cz/types/"',
+}
+
+
+def ws2_query(vec):
 
     soup = BeautifulSoup('', 'lxml')
     soup.is_xml = True
@@ -337,23 +573,22 @@ def get_ws2(vec):
     rocnik.append(str(vec.rocnik))
     req.append(rocnik)
 
-    url = 'https://isir.justice.cz:8443/isir_cuzk_ws/IsirWsCuzkService'
+    return soup.renderContents()
 
-    headers = {
-        'content-type': 'text/xml; charset=utf-8',
-        'SOAPAction': '"http://isirws.cca.cz/types/"',
-    }
-
-    res = post(url, soup.renderContents(), headers=headers)
 
-    xml = res.content
+def ws2_parse(res):
 
-    subsoup = BeautifulSoup(xml, 'xml')
+    subsoup = BeautifulSoup(res.content, 'xml')
     subsoup.is_xml = True
 
     return subsoup
 
 
+def get_ws2(vec):
+
+    return ws2_parse(post(WS2_URL, ws2_query(vec), headers=WS2_HEADERS))
+
+
 def refresh_link(vec):
 
     try:
@@ -400,9 +635,16 @@ def cron_getws2():
 
     idx = Counter.objects.get(id='PR').number
 
-    for vec in Vec.objects.filter(id__gt=idx, link__isnull=True).order_by('id'):
+    vecs = list(Vec.objects.filter(id__gt=idx, link__isnull=True).order_by('id'))
+    stop = None
 
-        subsoup = get_ws2(vec)
+    for vec, res in fetch_all(((vec, WS2_URL, ws2_query(vec)) for vec in vecs), 'POST', headers=WS2_HEADERS):
+
+        if res is None:
+            stop = vec.id if stop is None else min(stop, vec.id)
+            continue
+
+        subsoup = ws2_parse(res)
 
         if (subsoup.pocetVysledku and subsoup.cisloSenatu and subsoup.urlDetailRizeni
             and (subsoup.nazevOrganizace.string.strip()[:PREF] == L2N[vec.idOsobyPuvodce][:PREF])):
@@ -410,6 +652,9 @@ def cron_getws2():
                 senat=int(subsoup.cisloSenatu.string),
                 link=subsoup.urlDetailRizeni.string.strip())
 
+    for vec in vecs:
+        if stop is not None and vec.id >= stop:
+            break
         idx = vec.id
 
     Counter.objects.update_or_create(id='PR', defaults={'number': idx})
@@ -433,19 +678,33 @@ def cron_update():
     LOGGER.info('Batch processed')
 
 
+def sir_notices(uids=None):
+
+    notices = {}
+    users = {}
+    res = Tracked.objects.filter(vec__link__isnull=False).select_related('uid', 'vec').order_by('uid', 'desc', 'id')
+    insolvencies = Insolvency.objects.filter(notify=True)
+    if uids is not None:
+        res = res.filter(uid__in=uids)
+        insolvencies = insolvencies.filter(uid__in=uids)
+    for ins in res:
+        uid = ins.uid_id
+        text = notices.get(uid, 'Došlo ke změně v těchto insolvenčních řízeních, která sledujete:\n\n')
+        text += (
+            ' - {0}sp. zn. {1} {2.senat:d} INS {2.bc:d}/{2.rocnik:d}\n'
+            .format('{}, '.format(ins.desc) if ins.desc else '', L2S[ins.vec.idOsobyPuvodce], ins.vec))
+        text += '   {}\n\n'.format(ins.vec.link)
+        notices[uid] = text
+        users[uid] = ins.uid
+    if notices:
+        Vec.objects.filter(id__in={x.vec_id for x in res}).update(refreshed=None)
+        Tracked.objects.filter(id__in=[x.id for x in res]).delete()
+    for uid in notices:
+        LOGGER.info('Non-empty notice prepared for user "{}" ({:d})'.format(users[uid].username, uid))
+    insolvencies.update(notify=False)
+    return notices
+
+
 def sir_notice(uid):
 
-    text = ''
-    res = Tracked.objects.filter(uid=uid, vec__link__isnull=False).order_by('desc', 'id').distinct()
-    if res:
-        text = 'Došlo ke změně v těchto insolvenčních řízeních, která sledujete:\n\n'
-        for ins in res:
-            refresh_link(ins.vec)
-            text += (
-                ' - {0}sp. zn. {1} {2.senat:d} INS {2.bc:d}/{2.rocnik:d}\n'
-                .format('{}, '.format(ins.desc) if ins.desc else '', L2S[ins.vec.idOsobyPuvodce], ins.vec))
-            text += '   {}\n\n'.format(ins.vec.link)
-        Tracked.objects.filter(uid=uid, vec__link__isnull=False).delete()
-        LOGGER.info('Non-empty notice prepared for user "{}" ({:d})'.format(User.objects.get(pk=uid).username, uid))
-    Insolvency.objects.filter(uid=uid).update(notify=False)
-    return text
+    return sir_notices((uid,)).get(uid, '')
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 22:44
+
+from zlib import crc32
+
+from django.db import migrations, models
+
+
+def assign_shards(apps, schema_editor):
+
+    Transaction = apps.get_model('sir', 'Transaction')
+    for trans in Transaction.objects.filter(error=False).only('id', 'spisovaZnacka'):
+        shard = crc32(trans.spisovaZnacka.split()[-1].encode()) % 64
+        Transaction.objects.filter(id=trans.id).update(shard=shard)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sir', '0032_insolvency_notify'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Progress',
+            fields=[
+                ('shard', models.SmallIntegerField(primary_key=True, serialize=False)),
+                ('number', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='shard',
+            field=models.SmallIntegerField(default=0),
+        ),
+        migrations.AlterIndexTogether(
+            name='transaction',
+            index_together={('shard', 'id')},
+        ),
+        migrations.RunPython(assign_shards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 2.2.28 on 2026-10-18 23:58
+
+from django.db import migrations, models
+
+
+def get_duplicates(model):
+
+    first = {}
+    res = {}
+    for obj in model.objects.order_by('id'):
+        if obj.desc in first:
+            res[obj.id] = first[obj.desc]
+        else:
+            first[obj.desc] = obj.id
+    return res
+
+
+def merge_descs(apps, schema_editor):
+
+    DruhStavRizeni = apps.get_model('sir', 'DruhStavRizeni')
+    Vec = apps.get_model('sir', 'Vec')
+    for old, new in get_duplicates(DruhStavRizeni).items():
+        Vec.objects.filter(druhStavRizeni_id=old).update(druhStavRizeni_id=new)
+        DruhStavRizeni.objects.filter(id=old).delete()
+
+    DruhAdresy = apps.get_model('sir', 'DruhAdresy')
+    Adresa = apps.get_model('sir', 'Adresa')
+    for old, new in get_duplicates(DruhAdresy).items():
+        Adresa.objects.filter(druhAdresy_id=old).update(druhAdresy_id=new)
+        DruhAdresy.objects.filter(id=old).delete()
+
+    DruhRoleVRizeni = apps.get_model('sir', 'DruhRoleVRizeni')
+    Role = apps.get_model('sir', 'Role')
+    VecRoles = apps.get_model('sir', 'Vec').roles.through
+    for old, new in get_duplicates(DruhRoleVRizeni).items():
+        for role in Role.objects.filter(druhRoleVRizeni_id=old):
+            target = Role.objects.filter(osoba_id=role.osoba_id, druhRoleVRizeni_id=new).first()
+            if target:
+                vids = set(VecRoles.objects.filter(role_id=target.id).values_list('vec_id', flat=True))
+                for vec_role in VecRoles.objects.filter(role_id=role.id):
+                    if vec_role.vec_id not in vids:
+                        VecRoles.objects.create(vec_id=vec_role.vec_id, role_id=target.id)
+                role.delete()
+            else:
+                role.druhRoleVRizeni_id = new
+                role.save()
+        DruhRoleVRizeni.objects.filter(id=old).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sir', '0033_transaction_shard'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_descs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='druhadresy',
+            name='desc',
+            field=models.CharField(max_length=10, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='druhrolevrizeni',
+            name='desc',
+            field=models.CharField(max_length=10, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='druhstavrizeni',
+            name='desc',
+            field=models.CharField(max_length=10, unique=True),
+        ),
+    ]
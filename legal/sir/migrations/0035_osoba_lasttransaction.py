@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sir', '0034_unique_desc'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='osoba',
+            name='lastTransaction',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -31,7 +31,8 @@ from legal.common.utils import composeref
 class DruhAdresy(models.Model):
 
     desc = models.CharField(
-        max_length=10)
+        max_length=10,
+        unique=True)
 
     def __str__(self):
         return self.desc
@@ -96,7 +97,8 @@ class Adresa(models.Model):
 class DruhRoleVRizeni(models.Model):
 
     desc = models.CharField(
-        max_length=10)
+        max_length=10,
+        unique=True)
 
     def __str__(self):
         return self.desc
@@ -155,6 +157,9 @@ class Osoba(models.Model):
     adresy = models.ManyToManyField(
         Adresa)
 
+    lastTransaction = models.IntegerField(
+        default=0)
+
     timestamp_add = models.DateTimeField(
         auto_now_add=True,
         db_index=True)
@@ -196,7 +201,8 @@ class Role(models.Model):
 class DruhStavRizeni(models.Model):
 
     desc = models.CharField(
-        max_length=10)
+        max_length=10,
+        unique=True)
 
     def __str__(self):
         return self.desc
@@ -309,13 +315,31 @@ class Transaction(models.Model):
     error = models.BooleanField(
         default=False)
 
+    shard = models.SmallIntegerField(
+        default=0)
+
     timestamp_add = models.DateTimeField(
         auto_now_add=True)
 
+    class Meta:
+        index_together = ('shard', 'id')
+
     def __str__(self):
         return '{}, {}'.format(str(self.id), self.spisovaZnacka)
 
 
+class Progress(models.Model):
+
+    shard = models.SmallIntegerField(
+        primary_key=True)
+
+    number = models.IntegerField(
+        default=0)
+
+    def __str__(self):
+        return '{0.shard:d}: {0.number:d}'.format(self)
+
+
 class Insolvency(models.Model):
 
     uid = models.ForeignKey(
@@ -20,43 +20,60 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from django.contrib.auth.models import User
-
 from legal.common.utils import text_opt, composeref, LOGGER
 from legal.sur.models import Party, Found
+from legal.sur.utils import PARTY_INDEX
+
+
+def sur_notices(uids=None):
+
+    notices = {}
+    users = {}
+    res = Found.objects.select_related('uid').order_by('uid', 'name', 'id')
+    parties = Party.objects.filter(notify=True)
+    if uids is not None:
+        res = res.filter(uid__in=uids)
+        parties = parties.filter(uid__in=uids)
+    for item in res:
+        uid = item.uid_id
+        text = notices.get(uid, 'Byli nově zaznamenáni tito účastníci řízení, které sledujete:\n\n')
+        text += ' - {0.name}, {0.court}, sp. zn. {1}\n'.format(
+            item, composeref(item.senate, item.register, item.number, item.year))
+        text += '   {}\n\n'.format(item.url)
+        notices[uid] = text
+        users[uid] = item.uid
+    if notices:
+        Found.objects.filter(id__in=[x.id for x in res]).delete()
+    for uid in notices:
+        LOGGER.info('Non-empty notice prepared for user "{}" ({:d})'.format(users[uid].username, uid))
+    parties.update(notify=False)
+    return notices
 
 
 def sur_notice(uid):
 
-    text = ''
-    res = Found.objects.filter(uid=uid).order_by('name', 'id').distinct()
-    if res:
-        text = 'Byli nově zaznamenáni tito účastníci řízení, které sledujete:\n\n'
-        for item in res:
-            text += ' - {0.name}, {0.court}, sp. zn. {1}\n'.format(
-                item, composeref(item.senate, item.register, item.number, item.year))
-            text += '   {}\n\n'.format(item.url)
-        Found.objects.filter(uid=uid).delete()
-        LOGGER.info('Non-empty notice prepared for user "{}" ({:d})'.format(User.objects.get(pk=uid).username, uid))
-    Party.objects.filter(uid=uid).update(notify=False)
-    return text
-
-
-def sur_check(par, name, court, senate, register, number, year, url):
-
-    for party in Party.objects.filter(**par):
-        if text_opt(party.party, name, party.party_opt):
-            if Found.objects.update_or_create(
-                    uid_id=party.uid_id,
-                    name=name,
-                    court=court,
-                    senate=senate,
-                    register=register,
-                    number=number,
-                    year=year,
-                    url=url)[1]:
-                if party.uid.email:
-                    Party.objects.filter(id=party.id).update(notify=True)
-                LOGGER.info(
-                    'New party "{}" detected for user "{}" ({:d})'
-                    .format(name, User.objects.get(pk=party.uid_id).username, party.uid_id))
+    return sur_notices((uid,)).get(uid, '')
+
+
+def sur_check(par, names, court, senate, register, number, year, url):
+
+    found = PARTY_INDEX.match(names, par)
+    if not found:
+        return
+    for party in Party.objects.filter(id__in=found, **par).select_related('uid'):
+        for name in found[party.id]:
+            if text_opt(party.party, name, party.party_opt):
+                if Found.objects.update_or_create(
+                        uid_id=party.uid_id,
+                        name=name,
+                        court=court,
+                        senate=senate,
+                        register=register,
+                        number=number,
+                        year=year,
+                        url=url)[1]:
+                    if party.uid.email:
+                        Party.objects.filter(id=party.id).update(notify=True)
+                    LOGGER.info(
+                        'New party "{}" detected for user "{}" ({:d})'
+                        .format(name, party.uid.username, party.uid_id))
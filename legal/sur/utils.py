@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# sur/utils.py
+#
+# Copyright (C) 2011-19 Tomáš Pecina <tomas@pecina.cz>
+#
+# This file is part of legal.pecina.cz, a web-based toolbox for lawyers.
+#
+# This application is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This application is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+from legal.common.utils import ModelIndex, TextIndex, text_opt
+from legal.sur.models import Party
+
+
+PARTY_FLAGS = ('check_psj', 'check_uds', 'check_udn')
+
+
+def build_party_index(rows):
+
+    return rows, TextIndex((x['party'], x['party_opt'], y) for y, x in rows.items())
+
+
+class PartyIndex(ModelIndex):
+    """
+    In-memory index of watched parties.
+    """
+
+    def __init__(self):
+        super().__init__(Party, ('party', 'party_opt') + PARTY_FLAGS, build_party_index)
+
+    def match(self, names, par=None):
+        """
+        Match names against watched parties, return {party_id: [names]}.
+        """
+
+        rows, index = self.refresh()
+        res = {}
+        for name in names:
+            for pid in index.find(name):
+                row = rows[pid]
+                if ((not par or all(row[x] == y for x, y in par.items()))
+                        and text_opt(row['party'], name, row['party_opt'])):
+                    res.setdefault(pid, []).append(name)
+        return res
+
+
+PARTY_INDEX = PartyIndex()
@@ -28,7 +28,7 @@ from bs4 import BeautifulSoup
 from django.contrib.auth.models import User
 from django.db.models import Q
 
-from legal.common.utils import get, post, sleep, composeref, LOGGER
+from legal.common.utils import get, post, fetch_all, composeref, LOGGER
 from legal.szr.models import Court, Proceedings
 from legal.szr.glob import SUPREME_COURT, SUPREME_ADMINISTRATIVE_COURT
 
@@ -95,16 +95,15 @@ def cron_courts():
     except:  # pragma: no cover
         LOGGER.warning('Error importing courts')
     Court.objects.all().update(reports=None)
-    for court in Court.objects.all():
-        if isreg(court):
-            try:
-                sleep(1)
-                res = get(ROOT_URL + LIST_REPORTS.format(court.pk))
-                soup = BeautifulSoup(res.text, 'xml')
-                for item in soup.find_all('okresniSoud'):
-                    Court.objects.filter(pk=item.id.string).update(reports=court)
-            except:  # pragma: no cover
-                LOGGER.warning('Error setting hierarchy for {}'.format(court.id))
+    courts = [court for court in Court.objects.all() if isreg(court)]
+    for court, res in fetch_all((court, ROOT_URL + LIST_REPORTS.format(court.pk)) for court in courts):
+        try:
+            assert res
+            soup = BeautifulSoup(res.text, 'xml')
+            for item in soup.find_all('okresniSoud'):
+                Court.objects.filter(pk=item.id.string).update(reports=court)
+        except:  # pragma: no cover
+            LOGGER.warning('Error setting hierarchy for {}'.format(court.id))
     LOGGER.info('Courts imported')
 
 
@@ -189,30 +188,41 @@ def cron_update():
             proc.save()
 
 
+def szr_notices(uids=None):
+
+    notices = {}
+    users = {}
+    res = Proceedings.objects.filter(notify=True).select_related('uid', 'court').order_by('uid', 'desc', 'id')
+    if uids is not None:
+        res = res.filter(uid__in=uids)
+    for proc in res:
+        uid = proc.uid_id
+        text = notices.get(uid, 'V těchto soudních řízeních, která sledujete, došlo ke změně:\n\n')
+        desc = ' ({})'.format(proc.desc) if proc.desc else ''
+        text += ' - {}, sp. zn. {}{}\n'.format(
+            proc.court, composeref(proc.senate, proc.register, proc.number, proc.year), desc)
+        if proc.court_id != SUPREME_ADMINISTRATIVE_COURT:
+            court_type = 'ns' if proc.court_id == SUPREME_COURT else 'os'
+            text += '   {}\n\n'.format(ROOT_URL + GET_PROC.format(
+                proc.court.id,
+                proc.court.reports_id if proc.court.reports_id
+                else proc.court.id,
+                proc.senate,
+                quote(proc.register.upper()),
+                proc.number,
+                proc.year,
+                court_type))
+        elif proc.auxid:
+            text += '   {}\n\n'.format(NSS_GET_PROC.format(proc.auxid))
+        notices[uid] = text
+        users[uid] = proc.uid
+    if notices:
+        Proceedings.objects.filter(id__in=[x.id for x in res]).update(notify=False, timestamp_update=datetime.now())
+    for uid in notices:
+        LOGGER.info('Non-empty notice prepared for user "{}" ({:d})'.format(users[uid].username, uid))
+    return notices
+
+
 def szr_notice(uid):
 
-    text = ''
-    res = Proceedings.objects.filter(uid=uid, notify=True).order_by('desc', 'id')
-    if res:
-        text = 'V těchto soudních řízeních, která sledujete, došlo ke změně:\n\n'
-        for proc in res:
-            desc = ' ({})'.format(proc.desc) if proc.desc else ''
-            text += ' - {}, sp. zn. {}{}\n'.format(
-                proc.court, composeref(proc.senate, proc.register, proc.number, proc.year), desc)
-            if proc.court_id != SUPREME_ADMINISTRATIVE_COURT:
-                court_type = 'ns' if proc.court_id == SUPREME_COURT else 'os'
-                text += '   {}\n\n'.format(ROOT_URL + GET_PROC.format(
-                    proc.court.id,
-                    proc.court.reports.id if proc.court.reports
-                    else proc.court.id,
-                    proc.senate,
-                    quote(proc.register.upper()),
-                    proc.number,
-                    proc.year,
-                    court_type))
-            elif proc.auxid:
-                text += '   {}\n\n'.format(NSS_GET_PROC.format(proc.auxid))
-            proc.notify = False
-            proc.save()
-        LOGGER.info('Non-empty notice prepared for user "{}" ({:d})'.format(User.objects.get(pk=uid).username, uid))
-    return text
+    return szr_notices((uid,)).get(uid, '')
@@ -105,20 +105,22 @@ def cron_update():
                         date=dat,
                         filename=filename)
                     dec.save()
+                    names = []
                     for query in ttr[1].td:
                         if 'strip' in dir(query):
                             qstrip = query.strip()
                             party = Party.objects.get_or_create(name=qstrip)[0]
                             dec.parties.add(party)
-                            sur_check(
-                                {'check_udn': True},
-                                qstrip,
-                                nss,
-                                senate,
-                                register,
-                                number,
-                                year,
-                                DEC_URL.format(senate, quote(register), number, year, page))
+                            names.append(qstrip)
+                    sur_check(
+                        {'check_udn': True},
+                        names,
+                        nss,
+                        senate,
+                        register,
+                        number,
+                        year,
+                        DEC_URL.format(senate, quote(register), number, year, page))
                 except:  # pragma: no cover
                     pass
             pagers = soup.select('div#PagingBox2')[0]
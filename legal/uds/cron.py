@@ -31,7 +31,7 @@ from django.contrib.auth.models import User
 
 from legal.settings import BASE_DIR, TEST, TEST_TEMP_DIR
 from legal.common.glob import ODP, LOCAL_URL
-from legal.common.utils import get, sleep, LOGGER, between, adddoc
+from legal.common.utils import get, fetch_all, sleep, LOGGER, between, adddoc, Lease
 from legal.sur.models import Party
 from legal.uds.glob import TYPES
 from legal.uds.models import Publisher, Agenda, Document, DocumentIndex, File, Retrieved
@@ -203,11 +203,11 @@ def cron_update(*args):
         flt = {'subsidiary_region': False, 'subsidiary_county': False}
         if not args:
             flt['updated__lt'] = datetime.now() - UPDATE_INTERVAL
-        for publisher in Publisher.objects.filter(**flt).order_by('id'):
+        publishers = Publisher.objects.filter(**flt).order_by('id')
+        for publisher, res in fetch_all((publisher, LIST_URL.format(publisher.pubid)) for publisher in publishers):
+            Lease.check()
             try:
-                sleep(1)
-                res = get(LIST_URL.format(publisher.pubid))
-                assert res.ok
+                assert res and res.ok
                 soup = BeautifulSoup(res.text, 'html.parser')
                 rows = soup.find_all('tr')
                 if not rows:
@@ -270,12 +270,14 @@ def cron_update(*args):
                             agenda=agenda,
                             posted=posted,
                         )[0]
+                        items = []
                         for fileid, filename in files:
                             if File.objects.filter(fileid=fileid).exists():
                                 File.objects.filter(fileid=fileid).update(document=doc)
-                                continue
-                            infile = get(FILE_URL.format(fileid))
-                            assert infile.ok
+                            else:
+                                items.append(((fileid, filename), FILE_URL.format(fileid)))
+                        for (fileid, filename), infile in fetch_all(items):
+                            assert infile and infile.ok
                             content = infile.content
                             dirname = join(REPO_PREF, str(fileid))
                             makedirs(dirname, exist_ok=True)
@@ -361,20 +363,34 @@ def cron_remove_orphans():
         LOGGER.debug('No orphans removed')
 
 
+def uds_notices(uids=None):
+
+    notices = {}
+    users = {}
+    docs = Retrieved.objects.select_related('uid', 'party', 'document', 'document__publisher').order_by('uid', 'id')
+    parties = Party.objects.filter(notify=True)
+    if uids is not None:
+        docs = docs.filter(uid__in=uids)
+        parties = parties.filter(uid__in=uids)
+    for doc in docs:
+        uid = doc.uid_id
+        text = notices.get(uid, 'Na úředních deskách byly nově zaznamenány tyto osoby, které sledujete:\n\n')
+        lst = [doc.party.party, doc.document.publisher.name, doc.document.desc]
+        if doc.document.ref:
+            lst.append('sp. zn. {}'.format(doc.document.ref))
+        text += ' - {}\n'.format(', '.join(filter(bool, lst)))
+        text += '   {}\n\n'.format(DOCUMENT_URL.format(doc.document_id))
+        notices[uid] = text
+        users[uid] = doc.uid
+    if notices:
+        Retrieved.objects.filter(id__in=[x.id for x in docs]).delete()
+    for uid in notices:
+        LOGGER.info(
+            'Non-empty notice prepared for user "{}" ({:d})'.format(users[uid].username, uid))
+    parties.update(notify=False)
+    return notices
+
+
 def uds_notice(uid):
 
-    text = ''
-    docs = Retrieved.objects.filter(uid=uid).order_by('id').distinct()
-    if docs:
-        text = 'Na úředních deskách byly nově zaznamenány tyto osoby, které sledujete:\n\n'
-        for doc in docs:
-            lst = [doc.party.party, doc.document.publisher.name, doc.document.desc]
-            if doc.document.ref:
-                lst.append('sp. zn. {}'.format(doc.document.ref))
-            text += ' - {}\n'.format(', '.join(filter(bool, lst)))
-            text += '   {}\n\n'.format(DOCUMENT_URL.format(doc.document.id))
-        Retrieved.objects.filter(uid=uid).delete()
-        LOGGER.info(
-            'Non-empty notice prepared for user "{}" ({:d})'.format(User.objects.get(pk=uid).username, uid))
-    Party.objects.filter(uid=uid).update(notify=False)
-    return text
+    return uds_notices((uid,)).get(uid, '')
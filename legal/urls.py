@@ -26,7 +26,7 @@ from django.contrib import admin
 
 from legal.settings import APPS
 from legal.common.views import (
-    home, robots, pwchange, userinfo, useradd, lostpw, resetpw, about, gdpr, stat, doc, genrender)
+    home, robots, pwchange, userinfo, useradd, lostpw, resetpw, about, gdpr, stat, jobstat, doc, genrender)
 
 
 admin.autodiscover()
@@ -77,6 +77,7 @@ urlpatterns = [
     url(r'^about/$', about, name='about'),
     url(r'^gdpr/$', gdpr, name='gdpr'),
     url(r'^stat/$', stat, name='stat'),
+    url(r'^stat/jobs/$', jobstat, name='jobstat'),
     url(r'^doc/(.+)$', doc, name='doc'),
     url(r'^admin/', include((admin.site.urls[0], 'admin')))
 ] + [url('^{}/'.format(a), include(('legal.{}.urls'.format(a), a), namespace=a)) for a in APPS]
@@ -22,13 +22,15 @@
 
 from http import HTTPStatus
 from datetime import date, timedelta
+from os.path import join
 
 from bs4 import BeautifulSoup
 from django.test import SimpleTestCase, TestCase
 
-from legal.settings import FULL_CONTENT_TYPE
+from legal.settings import FULL_CONTENT_TYPE, TEST_DATA_DIR
 from legal.common.models import Cache
-from legal.cnb import models, utils
+from legal.common.utils import setcache, cache_text
+from legal.cnb import cron, models, utils
 
 from tests.utils import check_html
 
@@ -43,6 +45,11 @@ class TestModels(SimpleTestCase):
                 text='test')),
             '2000-05-14')
 
+        self.assertEqual(
+            str(models.FXyear(
+                year=2016)),
+            '2016')
+
         self.assertEqual(
             str(models.MPIrate(
                 type='LOMB',
@@ -55,6 +62,12 @@ class TestModels(SimpleTestCase):
                 type='LOMB')),
             'LOMB')
 
+        self.assertEqual(
+            str(models.FXvalue(
+                date=date(2000, 5, 14),
+                currency='USD')),
+            'USD')
+
 
 class TestUtils(TestCase):
 
@@ -134,6 +147,25 @@ class TestUtils(TestCase):
         self.assertAlmostEqual(res[0], 16.383)
         self.assertEqual(res[1:], (1, date(2001, 5, 11), None))
 
+        rat = models.FXrate.objects.get(date=date(2001, 5, 13))
+        self.assertEqual(rat.valid, date(2001, 5, 11))
+        self.assertEqual(rat.text, '')
+        val = models.FXvalue.objects.get(date=date(2001, 5, 11), currency='AUD')
+        self.assertEqual((val.quantity, val.rate), (1, 16.383))
+        self.assertIsNone(models.FXvalue.objects.get(date=date(2015, 7, 1), currency='EUR').rate)
+
+    def test_get_fx_rates(self):
+
+        dates = (date(2016, 7, 1), date(2001, 5, 13), date(2016, 4, 2), date(1990, 1, 1), date(2016, 7, 1))
+        res = utils.get_fx_rates('USD', dates)
+        self.assertEqual(res, [utils.get_fx_rate('USD', dat) for dat in dates])
+        self.assertAlmostEqual(res[0][0], 34.335)
+        self.assertEqual(res[2], (None, None, None, 'Chyba spojení se serverem ČNB'))
+
+        self.assertEqual(
+            utils.get_fx_rates('VAL', (date(1999, 1, 1),), use_fixed=True),
+            [utils.get_fx_rate('VAL', date(1999, 1, 1), use_fixed=True)])
+
     def test_get_mpi_rate(self):
 
         self.assertEqual(
@@ -188,20 +220,111 @@ class TestUtils(TestCase):
 
         models.MPIstat.objects.all().delete()
 
-        Cache.objects.filter(
-            url='https://www.cnb.cz/cs/faq/vyvoj_lombard_historie.txt').update(text='XXX')
+        setcache('https://www.cnb.cz/cs/faq/vyvoj_lombard_historie.txt', 'XXX', None)
         self.assertEqual(
             utils.get_mpi_rate('LOMB', date(1997, 5, 16)),
             (None, 'Chyba tabulky sazeb (1)'))
 
-        cache = Cache.objects.filter(
-            url='https://www.cnb.cz/cs/faq/vyvoj_diskontni_historie.txt')
-        cache.update(text=cache[0].text.replace(',', 'x'))
+        url = 'https://www.cnb.cz/cs/faq/vyvoj_diskontni_historie.txt'
+        setcache(url, cache_text(Cache.objects.get(url=url)).replace(',', 'x'), None)
         self.assertEqual(
             utils.get_mpi_rate('DISC', date(2014, 11, 19)),
             (None, 'Chyba tabulky sazeb (2)'))
 
 
+class TestCron(TestCase):
+
+    def test_backfill_fx(self):
+
+        filename = join(TEST_DATA_DIR, 'cnb_fx_2016.txt')
+        self.assertEqual(cron.cron_backfill_fx(filename), 7)
+        self.assertEqual(models.FXvalue.objects.count(), 17)
+        self.assertEqual(models.FXrate.objects.count(), 7)
+        self.assertFalse(models.FXyear.objects.exists())
+
+        res = utils.get_fx_rate('EUR', date(2016, 1, 5))
+        self.assertAlmostEqual(res[0], 27.021)
+        self.assertEqual(res[1:], (1, date(2016, 1, 5), None))
+
+        res = utils.get_fx_rate('JPY', date(2016, 1, 6))
+        self.assertAlmostEqual(res[0], 21.154)
+        self.assertEqual(res[1:], (100, date(2016, 1, 6), None))
+
+        res = utils.get_fx_rate('EUR', date(2016, 1, 10))
+        self.assertAlmostEqual(res[0], 27.023)
+        self.assertEqual(res[1:], (1, date(2016, 1, 8), None))
+
+        self.assertEqual(
+            utils.get_fx_rate('JPY', date(2016, 1, 5)),
+            (None, None, date(2016, 1, 5), 'Chyba řádku kursové tabulky'))
+
+        self.assertEqual(
+            utils.get_fx_rate('XDR', date(2016, 1, 6)),
+            (None, None, date(2016, 1, 6), 'Kurs není v kursové tabulce'))
+
+        self.assertEqual(cron.cron_backfill_fx(filename), 0)
+        self.assertEqual(models.FXvalue.objects.count(), 17)
+        self.assertEqual(models.FXrate.objects.count(), 7)
+
+        self.assertEqual(cron.cron_backfill_fx('2015'), 0)
+
+        models.FXrate(date=date(2015, 12, 31), valid=date(2015, 12, 31)).save()
+        urls = []
+        download = cron.download
+        cron.download = lambda url: urls.append(url) or '''Datum|1 EUR
+30.12.2015|27,025
+31.12.2015|27,025
+'''
+        try:
+            self.assertEqual(cron.cron_backfill_fx('2015'), 1)
+            self.assertTrue(models.FXyear.objects.filter(year=2015).exists())
+            self.assertEqual(cron.cron_backfill_fx('2015'), 0)
+        finally:
+            cron.download = download
+        self.assertEqual(urls, [cron.FX_YEAR_URL.format(2015)])
+
+    def test_backfill_mpi(self):
+
+        filename = join(TEST_DATA_DIR, 'cnb_mpi_repo.txt')
+        self.assertEqual(cron.cron_backfill_mpi(filename), 3)
+        self.assertEqual(cron.cron_backfill_mpi(filename), 0)
+        self.assertTrue(models.MPIstat.objects.filter(type='REPO').exists())
+        self.assertEqual(utils.get_mpi_rate('REPO', date(2012, 10, 1)), (.25, None))
+        self.assertEqual(cron.cron_backfill_mpi('XXXX'), 0)
+
+        self.assertGreater(cron.cron_backfill_mpi('DISC'), 0)
+        self.assertEqual(cron.cron_backfill_mpi('DISC'), 0)
+
+    def test_get_mpi_rates(self):
+
+        cron.cron_backfill_mpi(join(TEST_DATA_DIR, 'cnb_mpi_repo.txt'))
+        self.assertEqual(
+            utils.get_mpi_rates('REPO', date(2012, 7, 15), date(2012, 11, 30)),
+            ([(date(2012, 7, 15), .5), (date(2012, 9, 28), .25), (date(2012, 11, 2), .05)], None))
+        self.assertEqual(
+            utils.get_mpi_rates('REPO', date(2012, 9, 28), date(2012, 10, 31)),
+            ([(date(2012, 9, 28), .25)], None))
+        self.assertEqual(
+            utils.get_mpi_rates('REPO', date(2012, 1, 1), date(2012, 10, 31)),
+            (None, 'Sazba není k disposici'))
+        self.assertEqual(
+            utils.get_mpi_rates('XXXX', date(2012, 1, 1), date(2012, 10, 31)),
+            (None, 'Chybný druh sazby'))
+
+    def test_prefetch_mpi_rates(self):
+
+        cron.cron_backfill_mpi(join(TEST_DATA_DIR, 'cnb_mpi_repo.txt'))
+        spans = {'REPO': (date(2012, 7, 15), date(2012, 11, 30)), 'XXXX': (date(2012, 1, 1), date(2012, 10, 31))}
+        res = utils.prefetch_mpi_rates(spans)
+        self.assertEqual(list(res), ['REPO'])
+        for dat in (date(2012, 7, 15), date(2012, 9, 28), date(2012, 11, 30), date(2012, 12, 31)):
+            log1, log2 = [], []
+            self.assertEqual(
+                utils.get_mpi_rate('REPO', dat, log=log1, prefetched=res),
+                utils.get_mpi_rate('REPO', dat, log=log2))
+            self.assertEqual(log1, log2)
+
+
 class TestViews(TestCase):
 
     def test_main(self):
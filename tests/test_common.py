@@ -21,23 +21,34 @@
 #
 
 from datetime import date, datetime, timedelta
-from calendar import monthrange
+from calendar import monthrange, isleap
 from decimal import Decimal
 from copy import copy
 from http import HTTPStatus
+from io import StringIO
+from json import loads
+from os import getpid, kill, rmdir, unlink
+from os.path import exists, join
+from random import Random
 from re import compile
+from signal import getsignal, signal, SIGHUP, SIGINT, SIGTERM
+from threading import Timer
+from zipfile import ZipFile
 
-from django.test import SimpleTestCase, TestCase
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
 from django.contrib.auth.models import User
 from django.core import mail
+from django.core.management import call_command
 from django.http import QueryDict
 
-from legal.settings import FULL_CONTENT_TYPE
+from legal.settings import FULL_CONTENT_TYPE, TEST_DATA_DIR, TEST_TEMP_DIR
 from legal.szr.cron import cron_update
 from legal.szr.models import Proceedings
-from legal.common import cron, glob, fields, forms, models, utils, validators, views
+from legal.common import batch, cron, glob, fields, forms, models, utils, validators, views
+from legal.common.management.commands import crond
 
-from tests.utils import DummyRequest, setdl, setpr, TEST_OBJ, check_html
+from tests.glob import TEST_STRING
+from tests.utils import DummyRequest, DummyResponse, setdl, setpr, TEST_OBJ, check_html
 
 
 class TestCron(TestCase):
@@ -98,6 +109,21 @@ Server {} ({})
 
         cron.run('testfunc', '5 2')
         self.assertEqual(TEST_OBJ.testresult, 3)
+        self.assertEqual(models.JobRun.objects.filter(name='testfunc', outcome='ok').count(), 3)
+        jobrun = models.JobRun.objects.latest('start')
+        self.assertEqual(jobrun.args, '5 2')
+        self.assertGreaterEqual(jobrun.duration, 0)
+        self.assertIsNotNone(jobrun.end)
+
+        with self.assertRaises(ValueError):
+            cron.run('testfunc', 'x')
+        jobrun = models.JobRun.objects.latest('start')
+        self.assertEqual(jobrun.outcome, 'failed')
+        self.assertIn('ValueError', jobrun.exception)
+
+        cron.run_lane(None, [('testfunc', 'x', None), ('testfunc', '4', None)])
+        self.assertEqual(TEST_OBJ.testresult, 8)
+        self.assertEqual(models.JobRun.objects.filter(outcome='failed').count(), 2)
 
     def test_cron_run(self):
 
@@ -217,7 +243,8 @@ Server {} ({})
         self.assertFalse(models.Pending.objects.exists())
 
         models.Lock(name='test').save()
-        models.Lock.objects.filter(name='test').update(timestamp_add=(datetime.now() - cron.EXPIRE - timedelta(1)))
+        models.Lock.objects.filter(name='test').update(
+            timestamp_update=(datetime.now() - utils.LOCK_LEASE - timedelta(1)))
         self.assertEqual(models.Lock.objects.count(), 2)
 
         cron.SCHED = ()
@@ -235,6 +262,94 @@ Server {} ({})
         cron.cron_unlock()
         self.assertFalse(models.Lock.objects.exists())
 
+    def test_cron_unlock_expired(self):
+
+        models.Lock(name='test1').save()
+        models.Lock(name='test2').save()
+        models.Lock.objects.filter(name='test1').update(
+            timestamp_update=(datetime.now() - utils.LOCK_LEASE - timedelta(1)))
+
+        cron.cron_unlock_expired()
+        self.assertEqual(list(models.Lock.objects.values_list('name', flat=True)), ['test2'])
+
+    def test_lease(self):
+
+        lease1 = utils.Lease('test')
+        lease2 = utils.Lease('test')
+        self.assertTrue(lease1.acquire())
+        self.assertFalse(lease2.acquire())
+        self.assertTrue(lease1.renew())
+        self.assertFalse(lease2.renew())
+        self.assertFalse(lease2.release())
+        self.assertTrue(models.Lock.objects.filter(name='test').exists())
+
+        models.Lock.objects.filter(name='test').update(
+            timestamp_update=(datetime.now() - utils.LOCK_LEASE - timedelta(1)))
+        self.assertTrue(lease2.acquire())
+        self.assertFalse(lease1.renew())
+        self.assertFalse(lease1.release())
+        self.assertEqual(models.Lock.objects.get(name='test').owner, lease2.owner)
+        self.assertTrue(lease2.release())
+        self.assertFalse(models.Lock.objects.exists())
+
+        lease1 = utils.Lease('test')
+        lease2 = utils.Lease('test')
+        self.assertTrue(lease1.acquire())
+        utils.Lease._held.add(lease1)
+        utils.Lease.renew_held()
+        self.assertFalse(lease1.lost)
+        models.Lock.objects.filter(name='test').update(
+            timestamp_update=(datetime.now() - utils.LOCK_LEASE - timedelta(1)))
+        self.assertTrue(lease2.acquire())
+        utils.Lease.renew_held()
+        self.assertTrue(lease1.lost)
+        self.assertNotIn(lease1, utils.Lease._held)
+
+        utils.Lease.set_current(lease1)
+        with self.assertRaises(utils.LeaseLost):
+            utils.Lease.check()
+        utils.Lease.set_current(lease2)
+        utils.Lease.check()
+        attached = utils.Lease(lease2.name, lease2.owner)
+        self.assertTrue(attached.held())
+        utils.Lease.set_current(attached)
+        self.assertIs(utils.Lease.get_current(), attached)
+        utils.Lease.check()
+        models.Lock.objects.filter(name='test').update(owner='other')
+        with self.assertRaises(utils.LeaseLost):
+            utils.Lease.check()
+        self.assertTrue(attached.lost)
+        models.Lock.objects.filter(name='test').update(owner=lease2.owner)
+        utils.Lease.set_current(None)
+        self.assertIsNone(utils.Lease.get_current())
+
+        TEST_OBJ.testresult = 0
+        cron.run_lane(lease1, [('testfunc', '', None)])
+        self.assertEqual(TEST_OBJ.testresult, 0)
+        with self.assertRaises(utils.LeaseLost):
+            cron.run('testfunc', '2', 'test', lease=lease1)
+        self.assertEqual(TEST_OBJ.testresult, 4)
+        self.assertEqual(models.JobRun.objects.get().outcome, 'failed')
+        cron.run('testfunc', '3', 'test', lease=lease2)
+        self.assertEqual(TEST_OBJ.testresult, 6)
+        self.assertTrue(lease2.release())
+
+    def test_cron_sweep(self):
+
+        utils.setcache('test1', 'ok', timedelta(1))
+        utils.setcache('test2', 'ok', timedelta(1))
+        utils.setcache('test3', 'ok', None)
+        models.Cache.objects.filter(url='test1').update(
+            expire=(datetime.now() - utils.CACHE_KEEP - timedelta(1)))
+        models.Cache.objects.filter(url='test2').update(expire=(datetime.now() - timedelta(1)))
+        utils.setasset(DummyRequest('test_session'), 'test_asset1', b'test_data', timedelta(-1))
+        utils.setasset(DummyRequest('test_session'), 'test_asset2', b'test_data', timedelta(1))
+        cron.cron_sweep()
+        self.assertEqual(
+            list(models.Cache.objects.order_by('url').values_list('url', flat=True)),
+            ['test2', 'test3'])
+        self.assertEqual(list(models.Asset.objects.values_list('assetid', flat=True)), ['test_asset2'])
+
     def test_cron_clean(self):
 
         models.Lock(name='test').save()
@@ -247,6 +362,102 @@ Server {} ({})
         self.assertFalse(models.Pending.objects.exists())
 
 
+class TestCrond(TransactionTestCase):
+
+    def test_once(self):
+
+        models.Lock(name='held').save()
+        cron.SCHED = (
+            {'name': 'testfunc',
+             'args': '3',
+             'when': lambda t: True,
+             'lock': 'test',
+             'blocking': False,
+            },
+            {'name': 'testfunc',
+             'args': '5',
+             'when': lambda t: True,
+             'lock': 'held',
+             'blocking': True,
+            },
+            {'name': 'testfunc',
+             'args': '7',
+             'when': lambda t: False,
+            },
+        )
+        TEST_OBJ.testresult = 0
+        call_command('crond', once=True)
+        self.assertEqual(TEST_OBJ.testresult, 6)
+        self.assertEqual({x.name for x in TEST_OBJ.testlock}, {'held', 'test'})
+        self.assertEqual(list(models.Lock.objects.values_list('name', flat=True)), ['held'])
+        pend = models.Pending.objects.get()
+        self.assertEqual((pend.name, pend.args, pend.lock), ('testfunc', '5', 'held'))
+        self.assertEqual(models.JobRun.objects.get().args, '3')
+
+        models.Lock.objects.all().delete()
+        cron.SCHED = ()
+        TEST_OBJ.testresult = 0
+        call_command('crond', once=True)
+        self.assertEqual(TEST_OBJ.testresult, 10)
+        self.assertFalse(models.Lock.objects.exists())
+        self.assertFalse(models.Pending.objects.exists())
+
+    def test_signals(self):
+
+        reloads = []
+        handlers = {x: getsignal(x) for x in (SIGHUP, SIGINT, SIGTERM)}
+        tick, reload_jobs = crond.TICK, crond.reload_jobs
+        crond.TICK = timedelta(days=1)
+        crond.reload_jobs = lambda: reloads.append(True)
+        timers = [Timer(.2, kill, (getpid(), SIGHUP)), Timer(.5, kill, (getpid(), SIGTERM))]
+        try:
+            for timer in timers:
+                timer.start()
+            call_command('crond')
+        finally:
+            for timer in timers:
+                timer.cancel()
+            crond.TICK, crond.reload_jobs = tick, reload_jobs
+            for sig, handler in handlers.items():
+                signal(sig, handler)
+        self.assertEqual(reloads, [True])
+        self.assertFalse(models.JobRun.objects.exists())
+
+
+class TestBatch(TestCase):
+
+    fixtures = ('hsp_test.json',)
+
+    def test_recalc(self):
+
+        names = ('hsp_debt1.xml', 'hsp_debt12.xml', 'hjp_debt1.xml', 'hjp_debt8.xml', 'knr_calc1.xml')
+        archive = join(TEST_TEMP_DIR, 'batch.zip')
+        with ZipFile(archive, 'w') as outfile:
+            for name in names:
+                outfile.write(join(TEST_DATA_DIR, name), name)
+            outfile.write(join(TEST_DATA_DIR, 'hsp_debt12.xml'), 'a/hsp_debt1.xml')
+        progress = []
+        outfile = StringIO()
+        try:
+            self.assertEqual(
+                batch.recalc(archive, outfile, pdfdir=TEST_TEMP_DIR, progress=lambda *x: progress.append(x)),
+                (6, 1))
+        finally:
+            unlink(archive)
+        self.assertEqual(progress[-1], (6, 6, 'knr_calc1.xml'))
+        rows = outfile.getvalue().splitlines()
+        self.assertEqual(rows[0], ','.join(batch.BATCH_HEADER))
+        self.assertIn('hsp_debt1.xml,hsp,{},2016-01-06,B Úrok,CZK,4680.00,'.format(TEST_STRING), rows)
+        self.assertIn('hjp_debt8.xml,hjp,{},2006-01-06,celkem,CZK,41965.00,'.format(TEST_STRING), rows)
+        self.assertEqual(rows[-1], 'knr_calc1.xml,,,,,,,Nepodporovaný formát souboru')
+        self.assertIn('a/hsp_debt1.xml,hsp,{},2006-01-06,B Úrok,CZK,51769.00,'.format(TEST_STRING), rows)
+        for name in names[:4] + ('a/hsp_debt1.xml',):
+            filename = join(TEST_TEMP_DIR, name.replace('.xml', '.pdf'))
+            self.assertTrue(exists(filename))
+            unlink(filename)
+        rmdir(join(TEST_TEMP_DIR, 'a'))
+
+
 class TestFields(SimpleTestCase):
 
     def test_proc_num(self):
@@ -1465,6 +1676,49 @@ class TestUtils1(SimpleTestCase):
                         utils.holiday(dat),
                         (day in cal[year][month - 1]))
 
+        dat = date(1900, 1, 1)
+        while dat.year < 2100:
+            self.assertEqual(utils.is_holiday(dat), utils.calc_holiday(dat))
+            dat += timedelta(days=1)
+
+    def test_count_business_days(self):
+
+        self.assertEqual(utils.count_business_days(date(2016, 12, 30), date(2017, 1, 2)), 1)
+        self.assertEqual(utils.count_business_days(date(2017, 1, 2), date(2016, 12, 30)), -1)
+        self.assertEqual(utils.count_business_days(date(2016, 1, 1), date(2016, 1, 1)), 0)
+        self.assertEqual(utils.count_business_days(date(2016, 1, 1), date(2016, 12, 31)), 252)
+
+        beg = date(1995, 6, 17)
+        num = 0
+        dat = beg
+        while dat.year < 2025:
+            self.assertEqual(utils.count_business_days(beg, dat), num)
+            dat += timedelta(days=1)
+            if not utils.calc_holiday(dat):
+                num += 1
+
+    def test_add_business_days(self):
+
+        self.assertEqual(utils.add_business_days(date(2016, 12, 23), 1), date(2016, 12, 27))
+        self.assertEqual(utils.add_business_days(date(2016, 12, 24), 0), date(2016, 12, 27))
+        self.assertEqual(utils.add_business_days(date(2016, 12, 27), 0), date(2016, 12, 27))
+        self.assertEqual(utils.add_business_days(date(2016, 12, 27), -1), date(2016, 12, 23))
+        self.assertEqual(utils.add_business_days(date(2016, 12, 30), 1), date(2017, 1, 2))
+        self.assertEqual(utils.add_business_days(date(2017, 1, 2), -1), date(2016, 12, 30))
+        self.assertEqual(utils.add_business_days(date(2017, 1, 1), -1), date(2016, 12, 30))
+
+        for beg in (date(1968, 10, 1), date(2000, 1, 1), date(2016, 12, 31), date(2017, 1, 2)):
+            for num in range(-800, 801, 7):
+                res = beg
+                offset = timedelta(days=(-1 if num < 0 else 1))
+                for _ in range(abs(num)):
+                    res += offset
+                    while utils.calc_holiday(res):
+                        res += offset
+                while utils.calc_holiday(res):
+                    res += offset
+                self.assertEqual(utils.add_business_days(beg, num), res)
+
     def test_ply(self):
 
         self.assertEqual(utils.ply(date(2016, 7, 5), 1), date(2017, 7, 5))
@@ -1627,6 +1881,71 @@ class TestUtils1(SimpleTestCase):
                 date(2016, 7, 5),
                 'XXX'))
 
+        self.assertEqual(utils.mfactor(date(2015, 12, 31), date(2015, 12, 31), 'ACT'), 0)
+
+    def test_daycount_equivalence(self):
+
+        def yfactor_actact(beg, end):
+            beg += timedelta(days=1)
+            end += timedelta(days=1)
+            leap = nleap = 0
+            year = beg.year
+            while year < end.year:
+                num = (date(year + 1, 1, 1) - beg).days
+                if isleap(year):
+                    leap += num
+                else:
+                    nleap += num
+                beg = date(year + 1, 1, 1)
+                year += 1
+            num = (end - beg).days
+            if isleap(year):
+                leap += num
+            else:
+                nleap += num
+            return (nleap / 365) + (leap / 366)
+
+        def mfactor_act(beg, end):
+            beg += timedelta(days=1)
+            year = beg.year
+            month = beg.month
+            day = beg.day
+            res = .0
+            while year < end.year or month != end.month:
+                if day == 1:
+                    res += 1
+                else:
+                    dim = monthrange(year, month)[1]
+                    res += float(dim - day + 1) / dim
+                month += 1
+                if month > 12:
+                    month = 1
+                    year += 1
+                day = 1
+            res += float(end.day - day + 1) / monthrange(year, month)[1]
+            return res
+
+        rnd = Random(7)
+        begs = []
+        ends = []
+        for _ in range(5000):
+            beg = date(1800, 1, 1) + timedelta(days=rnd.randrange(100000))
+            end = beg + timedelta(
+                days=rnd.choice((rnd.randrange(1, 40), rnd.randrange(1, 800), rnd.randrange(1, 20000))))
+            self.assertEqual(utils.yfactor(beg, end, 'ACT/ACT'), yfactor_actact(beg, end))
+            self.assertEqual(utils.mfactor(beg, end, 'ACT'), mfactor_act(beg, end))
+            begs.append(beg)
+            ends.append(end)
+
+        for dconv in utils.YDCONVS:
+            self.assertEqual(
+                utils.yfactors(begs, ends, dconv),
+                [utils.yfactor(beg, end, dconv) for beg, end in zip(begs, ends)])
+        for dconv in utils.MDCONVS:
+            self.assertEqual(
+                utils.mfactors(begs, ends, dconv),
+                [utils.mfactor(beg, end, dconv) for beg, end in zip(begs, ends)])
+
     def test_grammar(self):
 
         test = ('koruna', 'koruny', 'korun')
@@ -1930,6 +2249,136 @@ class TestUtils1(SimpleTestCase):
         self.assertFalse(utils.icmp('a', ''))
         self.assertFalse(utils.icmp('', 'a'))
 
+    def test_fold(self):
+
+        self.assertEqual(utils.fold(''), '')
+        self.assertEqual(utils.fold('Příliš ŽLUŤOUČKÝ kůň'), 'prilis zlutoucky kun')
+        self.assertEqual(utils.fold('ÁČĎĚ'), 'acde')
+
+    def test_automaton(self):
+
+        aut = utils.Automaton(())
+        self.assertEqual(aut.find('abc'), set())
+        aut = utils.Automaton((('he', 1), ('she', 2), ('his', 3), ('hers', 4), ('e', 5), ('he', 6)))
+        self.assertEqual(aut.find(''), set())
+        self.assertEqual(aut.find('ushers'), {1, 2, 4, 5, 6})
+        self.assertEqual(aut.find('this'), {3})
+        self.assertEqual(aut.find('xyz'), set())
+        aut = utils.Automaton((('aab', 1), ('ab', 2), ('b', 3), ('aaa', 4)))
+        self.assertEqual(aut.find('aaab'), {1, 2, 3, 4})
+        self.assertEqual(aut.find('aa'), set())
+
+    def test_text_index(self):
+
+        needles = (('yz', 0), ('xy', 1), ('zw', 2), ('xyzw', 3), ('', 0), ('ČĎ', 0), ('q', 1), ('ě', 2))
+        index = utils.TextIndex((x[0], x[1], idx) for idx, x in enumerate(needles))
+        for haystack in ('xyzw', 'XYZW', 'áčďě', '', 'q', 'acde'):
+            res = index.find(haystack)
+            for idx, needle in enumerate(needles):
+                if utils.text_opt(needle[0], haystack, needle[1]):
+                    self.assertIn(idx, res)
+        self.assertEqual(index.find('xyzw'), {0, 1, 2, 3, 4})
+        self.assertEqual(index.find('acde'), {4, 5, 7})
+
+    def test_logger(self):
+
+        class Fmt:
+            calls = 0
+
+            def __format__(self, spec):
+                Fmt.calls += 1
+                return 'x'
+
+        with self.assertLogs('logger', level='DEBUG') as log:
+            utils.LOGGER.info('Test {}', 'req', 'par', fmt=(Fmt(),))
+            utils.LOGGER.debug('Plain')
+        rec = log.records[0]
+        self.assertEqual(rec.package, 'TESTS')
+        self.assertEqual(rec.request, 'req')
+        self.assertEqual(rec.params, 'par')
+        self.assertEqual(log.output[0], 'INFO:logger:Test x')
+        self.assertEqual(Fmt.calls, 1)
+        self.assertFalse(hasattr(log.records[1], 'request'))
+        self.assertEqual(log.records[1].getMessage(), 'Plain')
+
+        with self.assertLogs('logger', level='INFO') as log:
+            utils.LOGGER.debug('Suppressed {}', fmt=(Fmt(),))
+            utils.LOGGER.info('Emitted')
+        self.assertEqual(len(log.records), 1)
+        self.assertEqual(Fmt.calls, 1)
+
+    def test_token_bucket(self):
+
+        bucket = utils.TokenBucket(2, 2)
+        self.assertEqual(bucket.wait(), 0)
+        self.assertEqual(bucket.wait(), 0)
+        self.assertAlmostEqual(bucket.wait(), .5, places=1)
+
+    def test_http_client(self):
+
+        class Session:
+
+            def __init__(self, results):
+                self.results = list(results)
+                self.calls = []
+
+            def request(self, method, url, **kwargs):
+                self.calls.append((method, url, kwargs['timeout']))
+                res = self.results.pop(0)
+                if isinstance(res, Exception):
+                    raise res
+                return DummyResponse('ok', status=res)
+
+        class Client(utils.HTTPClient):
+
+            def session(self, host):
+                return sess
+
+        client = Client()
+        sess = Session((HTTPStatus.SERVICE_UNAVAILABLE, utils.requests.ConnectionError(), HTTPStatus.OK))
+        res = client.request('GET', 'http://test.example/a')
+        self.assertTrue(res.ok)
+        self.assertEqual(sess.calls, [('GET', 'http://test.example/a', utils.TIMEOUT)] * 3)
+
+        sess = Session([HTTPStatus.NOT_FOUND])
+        self.assertEqual(client.request('GET', 'http://test.example/b', timeout=1).status_code, HTTPStatus.NOT_FOUND)
+        self.assertEqual(sess.calls, [('GET', 'http://test.example/b', 1)])
+
+        sess = Session([utils.requests.Timeout()] * (utils.RETRIES + 1))
+        with self.assertRaises(utils.requests.Timeout):
+            client.request('POST', 'http://test.example/c')
+
+        stat = utils.http_stats()['test.example']
+        self.assertEqual(stat.requests, 4 + utils.RETRIES + 1)
+        self.assertEqual(stat.errors, 2 + utils.RETRIES + 1)
+        self.assertEqual(stat.retries, 2 + utils.RETRIES)
+        self.assertIn('requests: 8', repr(stat))
+
+    def test_fetch_all(self):
+
+        def fake_get(url, **kwargs):
+            if url.endswith('x'):
+                raise utils.requests.ConnectionError()
+            return DummyResponse(url)
+
+        items = [(num, 'http://test.example/{:d}{}'.format(num, 'x' if num % 5 == 2 else '')) for num in range(20)]
+        get, workers = utils.get, utils.FETCH_WORKERS
+        utils.get = fake_get
+        try:
+            for utils.FETCH_WORKERS in (1, 3):
+                res = dict(utils.fetch_all(iter(items)))
+                self.assertEqual(sorted(res), list(range(20)))
+                for num, url in items:
+                    if num % 5 == 2:
+                        self.assertIsNone(res[num])
+                    else:
+                        self.assertEqual(res[num].text, url)
+                gen = utils.fetch_all(iter(items))
+                next(gen)
+                gen.close()
+        finally:
+            utils.get, utils.FETCH_WORKERS = get, workers
+
 
 class TestUtils2(TestCase):
 
@@ -1968,6 +2417,54 @@ class TestUtils3(TestCase):
         res = utils.getcache('xxx', timedelta(1))
         self.assertEqual(res, (None, 'Chyba při komunikaci se serverem'))
 
+        utils.setcache('xxx', '\ufeffnew', timedelta(1), etag='"1"')
+        cache = models.Cache.objects.get(url='xxx')
+        self.assertEqual(cache.text, '')
+        self.assertEqual(cache.etag, '"1"')
+        self.assertEqual(utils.cache_text(cache), '\ufeffnew')
+        self.assertEqual(utils.getcache('xxx', timedelta(1)), ('new', None))
+
+        models.Cache.objects.filter(url='test').update(expire=(datetime.now() - timedelta(1)))
+        res = utils.getcache('test', timedelta(1))
+        self.assertEqual(res, (None, 'Chyba při komunikaci se serverem'))
+
+        models.Cache.objects.filter(url='xxx').update(expire=(datetime.now() - timedelta(1)))
+        reqs = []
+
+        def not_modified(url, **kwargs):
+            reqs.append(kwargs)
+            return DummyResponse(None, status=HTTPStatus.NOT_MODIFIED)
+
+        get = utils.get
+        utils.get = not_modified
+        try:
+            self.assertEqual(utils.getcache('xxx', timedelta(1)), ('new', None))
+        finally:
+            utils.get = get
+        self.assertEqual(reqs, [{'headers': {'If-None-Match': '"1"'}}])
+        self.assertGreater(models.Cache.objects.get(url='xxx').expire, datetime.now())
+
+    def test_lrucache(self):
+
+        lru = utils.LRUCache(2)
+        lru.put('a', 1, None)
+        lru.put('b', 2, None)
+        self.assertEqual(lru.get('a'), 1)
+        lru.put('c', 3, None)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('a'), 1)
+        self.assertEqual(lru.get('c'), 3)
+        lru.put('c', 4, datetime.now() - timedelta(1))
+        self.assertIsNone(lru.get('c'))
+        lru.discard('a')
+        self.assertIsNone(lru.get('a'))
+        lru.put('d', 5, datetime.now() + timedelta(1))
+        lru.clear()
+        self.assertIsNone(lru.get('d'))
+        lru = utils.LRUCache(0)
+        lru.put('a', 1, None)
+        self.assertIsNone(lru.get('a'))
+
     def test_asset(self):
 
         self.assertIsNone(utils.getasset(
@@ -2008,6 +2505,19 @@ class TestUtils3(TestCase):
                 DummyRequest('test_session'),
                 'test_asset2'))
 
+        req = DummyRequest('test_session')
+        data = bytes(range(256)) * 8
+        self.assertTrue(utils.setasset(req, 'test_asset3', data, timedelta(1)))
+        asset = models.Asset.objects.get(assetid='test_asset3')
+        self.assertTrue(asset.compressed)
+        self.assertLess(len(asset.data), len(data))
+        self.assertFalse(models.Asset.objects.get(assetid='test_asset1').compressed)
+        self.assertEqual(utils.getasset(DummyRequest('test_session'), 'test_asset3'), data)
+
+        models.Asset.objects.filter(assetid='test_asset3').delete()
+        self.assertEqual(utils.getasset(req, 'test_asset3'), data)
+        self.assertIsNone(utils.getasset(DummyRequest('test_session'), 'test_asset3'))
+
 
 class TestValidators(TestCase):
 
@@ -2398,6 +2908,32 @@ class TestViews(TestCase):
         res = self.client.post('/stat/')
         self.assertEqual(res.status_code, HTTPStatus.METHOD_NOT_ALLOWED)
 
+        now = datetime.now()
+        for idx in range(10):
+            models.JobRun(
+                name='test',
+                start=now,
+                end=now,
+                duration=idx + 1,
+                wait=idx / 10,
+                outcome='failed' if idx == 9 else 'ok').save()
+        res = self.client.get('/stat/')
+        self.assertContains(res, '10× (1 chyb), medián 5,00 s, p95 10,00 s, celkem 55,00 s, čekání p95 0,90 s')
+        check_html(self, res.content)
+
+        res = self.client.get('/stat/jobs/')
+        self.assertEqual(res.status_code, HTTPStatus.OK)
+        self.assertEqual(res['content-type'], 'application/json; charset=utf-8')
+        job = loads(res.content.decode('utf-8'))['jobs'][0]
+        self.assertEqual(job['name'], 'test')
+        self.assertEqual(job['runs'], 10)
+        self.assertAlmostEqual(job['failure_rate'], .1)
+        self.assertEqual(job['p50'], 5)
+        self.assertEqual(job['p95'], 10)
+
+        res = self.client.post('/stat/jobs/')
+        self.assertEqual(res.status_code, HTTPStatus.METHOD_NOT_ALLOWED)
+
     def test_useradd(self):
 
         res = self.client.get('/accounts/useradd/')
@@ -21,7 +21,7 @@
 #
 
 from http import HTTPStatus
-from datetime import date
+from datetime import date, datetime
 from os.path import join
 
 from bs4 import BeautifulSoup
@@ -31,8 +31,8 @@ from django.contrib.auth.models import User
 from legal.settings import TEST_DATA_DIR, FULL_CONTENT_TYPE
 from legal.common.glob import LOCAL_DOMAIN
 from legal.sir.cron import cron_gettr, cron_proctr
-from legal.sir.models import Vec
-from legal.dir import cron, forms, models
+from legal.sir.models import Vec, Osoba
+from legal.dir import cron, forms, models, utils
 
 from tests.utils import link_equal, setdl, check_html
 
@@ -87,7 +87,7 @@ class TestCron(TransactionTestCase):
  - Test 14, sp. zn. MSPH 0 INS 20/2008
    https://legal.pecina.cz/link
 
- - Test 15, sp. zn. KSPH 0 INS 8/2008
+ - Test 15, sp. zn. KSCB 0 INS 28/2008
    https://legal.pecina.cz/link
 
  - Test 15, sp. zn. KSOS 0 INS 11/2008
@@ -96,13 +96,50 @@ class TestCron(TransactionTestCase):
  - Test 15, sp. zn. KSCB 0 INS 27/2008
    https://legal.pecina.cz/link
 
- - Test 15, sp. zn. KSCB 0 INS 28/2008
+ - Test 15, sp. zn. KSPH 0 INS 8/2008
    https://legal.pecina.cz/link
 
 ''')
         self.assertFalse(models.Discovered.objects.exists())
 
 
+class TestUtils(TestCase):
+
+    fixtures = ('dir_test.json',)
+
+    def test_debtor_index(self):
+
+        osoby = (
+            Osoba(idOsobyPuvodce='KSJIMBM', nazevOsoby='AZ Centrum s.r.o.'),
+            Osoba(idOsobyPuvodce='KSOSCEO', nazevOsoby='Informační služby', ic='12345678'),
+            Osoba(idOsobyPuvodce='MSPHAAB', nazevOsoby='Novák', jmeno='Jan', rc='7001011234',
+                  datumNarozeni=datetime(1970, 1, 1)),
+            Osoba(idOsobyPuvodce='MSPHAAB', nazevOsoby='Nováková', jmeno='Jana', datumNarozeni=date(1970, 1, 1)),
+            Osoba(idOsobyPuvodce='KSPLZEN', nazevOsoby=''),
+        )
+
+        def brute():
+            res = {}
+            for debtor in models.Debtor.objects.values('id', *utils.DEBTOR_FIELDS):
+                for osoba in osoby:
+                    if utils.debtor_match(debtor, osoba):
+                        res.setdefault(debtor['id'], []).append(osoba)
+            return res
+
+        index = utils.DebtorIndex()
+        self.assertEqual(index.match(osoby), brute())
+        self.assertIn(2, index.match(osoby))
+        debtor = models.Debtor.objects.create(
+            uid_id=1, desc='Test', name='nov', name_opt=1, first_name_opt=0, birthid='7001011234')
+        models.Debtor.objects.create(
+            uid_id=1, desc='Test', name_opt=0, first_name_opt=0, date_birth=date(1970, 1, 1), year_birth_from=1970)
+        models.Debtor.objects.create(uid_id=1, desc='Test', name_opt=0, first_name_opt=0, genid='12345678')
+        models.Debtor.objects.filter(id=2).delete()
+        self.assertEqual(index.match(osoby), brute())
+        self.assertEqual(index.match(osoby)[debtor.id], [osoby[2]])
+        self.assertEqual(index.match(()), {})
+
+
 class TestForms(SimpleTestCase):
 
     def test_debtor_form(self):
@@ -144,7 +181,7 @@ class TestModels(TransactionTestCase):
 
         Vec.objects.update(link="https://legal.pecina.cz/link")
         self.assertEqual(str(models.Debtor.objects.first()), 'Error 01')
-        self.assertEqual(str(models.Discovered.objects.first()), 'Test 02')
+        self.assertEqual(str(models.Discovered.objects.first()), 'Test 04')
 
 
 class TestViews1(TransactionTestCase):
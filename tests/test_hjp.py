@@ -31,6 +31,8 @@ from django.test import SimpleTestCase, TestCase
 from django.contrib.auth.models import User
 
 from legal.settings import TEST_DATA_DIR, BASE_DIR, FULL_CONTENT_TYPE
+from legal.common import utils
+from legal.common.models import Asset
 from legal.common.utils import p2c
 from legal.hjp import forms, views
 
@@ -1103,6 +1105,90 @@ class TestViews2(TestCase):
             self.assertIsNone(calc[0])
             self.assertEqual(calc[1], test[6])
 
+    def test_checkpoints(self):
+
+        checkpoints = utils.CHECKPOINTS
+        utils.CHECKPOINTS = utils.LRUCache(4)
+        try:
+            for idx in (1, 8, 13):
+                with open(join(TEST_DATA_DIR, 'hjp_debt{:d}.xml'.format(idx)), 'rb') as infile:
+                    dat = infile.read()
+                res = []
+                for _ in range(3):
+                    debt = views.from_xml(dat)[0]
+                    debt.rates = {}
+                    res.append((views.getrows(debt), debt.rates))
+                    if len(res) == 3:
+                        [x for x in debt.transactions if x.transaction_type != 'balance'][-1].amount += 100
+                        res.append((views.getrows(debt), debt.rates))
+                self.assertEqual(res[0], res[1])
+                self.assertEqual(res[0], res[2])
+                self.assertFalse({'pre_total', 'change_interest'} & set(utils.CHECKPOINTS.entries))
+                restored = []
+                get_checkpoints = views.get_checkpoints
+                views.get_checkpoints = lambda *args: restored.append(get_checkpoints(*args)) or restored[-1]
+                try:
+                    debt.rates = {}
+                    views.getrows(debt)
+                finally:
+                    views.get_checkpoints = get_checkpoints
+                num = len({x.date for x in debt.transactions}) if idx == 13 else len(debt.transactions)
+                self.assertEqual(len(restored[0]), num)
+                utils.CHECKPOINTS.clear()
+                debt.rates = {}
+                self.assertEqual(res[3], (views.getrows(debt), debt.rates))
+            with open(join(TEST_DATA_DIR, 'hjp_debt1.xml'), 'rb') as infile:
+                debt = views.from_xml(infile.read())[0]
+            debt.rates = {}
+            res = (views.getrows(debt), debt.rates)
+            utils.CHECKPOINTS.clear()
+            calcint = views.calcint
+            views.calcint = lambda *args: (None, 'Chyba')
+            try:
+                debt.rates = {}
+                self.assertTrue(views.getrows(debt)[-1]['err'])
+            finally:
+                views.calcint = calcint
+            debt.rates = {}
+            self.assertEqual(res, (views.getrows(debt), debt.rates))
+            self.assertTrue(all(x[1] for x in utils.CHECKPOINTS.entries.values()))
+        finally:
+            utils.CHECKPOINTS = checkpoints
+
+    def test_api(self):
+
+        res = self.client.post('/hjp/api/', b'', content_type='text/xml')
+        self.assertEqual(res.status_code, HTTPStatus.FOUND)
+
+        self.assertTrue(self.client.login(username='user', password='none'))
+
+        res = self.client.get('/hjp/api/')
+        self.assertEqual(res.status_code, HTTPStatus.METHOD_NOT_ALLOWED)
+
+        res = self.client.post('/hjp/api/', b'XXX', content_type='text/xml')
+        self.assertEqual(res.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('error', res.json())
+
+        num = Asset.objects.count()
+        for idx in range(1, 19):
+            with open(join(TEST_DATA_DIR, 'hjp_debt{:d}.xml'.format(idx)), 'rb') as infile:
+                dat = infile.read()
+            res = self.client.post('/hjp/api/', dat, content_type='text/xml')
+            debt = views.from_xml(dat)[0]
+            debt.rates = {}
+            rows = views.getrows(debt)
+            if any('msg' in x for x in rows):
+                self.assertEqual(res.status_code, HTTPStatus.BAD_REQUEST)
+                continue
+            self.assertEqual(res.status_code, HTTPStatus.OK)
+            rsp = res.json()
+            self.assertEqual(rsp['currency'], debt.currency)
+            self.assertEqual([x['post_total'] for x in rsp['rows']], [x['post_total'] for x in rows])
+            if rows:
+                self.assertEqual(rsp['total'], rows[-1]['post_total'])
+            self.assertEqual([x['rate'] for x in rsp['rates']], [debt.rates[x] for x in sorted(debt.rates)])
+        self.assertEqual(Asset.objects.count(), num)
+
     def test_calculation(self):
 
         self.assertTrue(self.client.login(username='user', password='none'))
@@ -22,7 +22,7 @@
 
 from http import HTTPStatus
 from datetime import date
-from io import BytesIO
+from io import BytesIO, StringIO
 from os.path import join
 
 from bs4 import BeautifulSoup
@@ -31,6 +31,9 @@ from django.test import SimpleTestCase, TestCase
 from django.contrib.auth.models import User
 
 from legal.settings import TEST_DATA_DIR, BASE_DIR, FULL_CONTENT_TYPE
+from legal.common import utils
+from legal.common.glob import ODP
+from legal.common.models import Asset
 from legal.hsp import forms, views
 
 from tests.glob import TEST_STRING
@@ -1712,6 +1715,94 @@ class TestViews2(TestCase):
             self.assertEqual(string, dat, msg=str(idx))
             idx += 1
 
+    def test_calc_gaps(self):
+
+        def rows(debt):
+            return [
+                (row['date'], row['description'], row['pre'], row['post'])
+                for row in views.calc(debt).rows if row['type'] != views.BAL]
+
+        for idx in (12, 13, 18):
+            with open(join(TEST_DATA_DIR, 'hsp_debt{:d}.xml'.format(idx)), 'rb') as infile:
+                dat = infile.read()
+            debt = views.from_xml(dat)[0]
+            dates = sorted(
+                [x.date for x in debt.credits + debt.balances] + [x.fixed_date for x in debt.debits if x.fixed_date])
+            mid = dates[0] + (dates[-1] - dates[0]) / 2
+            for date_from, date_to in ((None, None), (None, mid), (mid, None), (dates[0], mid + ODP * 40)):
+                debt = views.from_xml(dat)[0]
+                for debit in debt.debits:
+                    if debit.model == 'cust4':
+                        debit.date_from = date_from or debit.date_from
+                        debit.date_to = date_to
+                exp = rows(debt)
+                beg = min([dates[0]] + [x.date_from for x in debt.debits if x.date_from])
+                while beg <= dates[-1]:
+                    balance = views.Balance()
+                    balance.date = beg
+                    debt.balances.append(balance)
+                    beg += ODP
+                self.assertEqual(rows(debt), exp, msg=str(idx))
+
+    def test_checkpoints(self):
+
+        checkpoints = utils.CHECKPOINTS
+        utils.CHECKPOINTS = utils.LRUCache(4)
+        try:
+            for idx in (1, 12, 18):
+                with open(join(TEST_DATA_DIR, 'hsp_debt{:d}.xml'.format(idx)), 'rb') as infile:
+                    dat = infile.read()
+                with open(join(TEST_DATA_DIR, 'hsp_debt{:d}.csv'.format(idx)), 'rb') as infile:
+                    exp = infile.read().decode('utf-8')
+                for _ in range(2):
+                    outfile = StringIO()
+                    views.to_csv(views.from_xml(dat)[0], outfile)
+                    self.assertEqual(outfile.getvalue(), exp)
+                debt = views.from_xml(dat)[0]
+                debt.credits[-1].amount /= 2
+                outfile = StringIO()
+                views.to_csv(debt, outfile)
+                utils.CHECKPOINTS.clear()
+                exp = StringIO()
+                views.to_csv(debt, exp)
+                self.assertEqual(outfile.getvalue(), exp.getvalue())
+        finally:
+            utils.CHECKPOINTS = checkpoints
+
+    def test_api(self):
+
+        res = self.client.post('/hsp/api/', b'', content_type='text/xml')
+        self.assertEqual(res.status_code, HTTPStatus.FOUND)
+
+        self.assertTrue(self.client.login(username='user', password='none'))
+
+        res = self.client.get('/hsp/api/')
+        self.assertEqual(res.status_code, HTTPStatus.METHOD_NOT_ALLOWED)
+
+        res = self.client.post('/hsp/api/', b'XXX', content_type='text/xml')
+        self.assertEqual(res.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('error', res.json())
+
+        num = Asset.objects.count()
+        for idx in range(1, 20):
+            with open(join(TEST_DATA_DIR, 'hsp_debt{:d}.xml'.format(idx)), 'rb') as infile:
+                dat = infile.read()
+            res = self.client.post('/hsp/api/', dat, content_type='text/xml')
+            self.assertEqual(res.status_code, HTTPStatus.OK)
+            self.assertEqual(res['content-type'], 'application/json')
+            rsp = res.json()
+            debt = views.from_xml(dat)[0]
+            exp = views.calc(debt)
+            self.assertEqual(rsp['title'], debt.title)
+            self.assertEqual(len(rsp['rows']), len(exp.rows))
+            for row, erow in zip(rsp['rows'], exp.rows):
+                self.assertEqual(row['date'], erow['date'].isoformat())
+                self.assertEqual(row['post'], erow['post'])
+            self.assertEqual([x['balance'] for x in rsp['debits']], exp.rows[-1]['post'])
+            self.assertEqual(len(rsp['fx_rates']), len(exp.fxinfo))
+            self.assertEqual(len(rsp['mpi_rates']), len(exp.mpi))
+        self.assertEqual(Asset.objects.count(), num)
+
     def test_hjp2hsp(self):
 
         self.assertTrue(self.client.login(username='user', password='none'))
@@ -32,6 +32,7 @@ from django.contrib.auth.models import User
 
 from legal.settings import TEST_DATA_DIR, BASE_DIR, FULL_CONTENT_TYPE
 from legal.common.utils import new_xml, p2c, xmlbool
+from legal.common.models import Asset
 from legal.knr import forms, models, views, utils
 
 from tests.glob import TEST_STRING
@@ -2306,3 +2307,36 @@ class TestViews2(TransactionTestCase):
             self.assertEqual(len(ttd), 4)
             for idx in range(4):
                 self.assertEqual(ttd[idx].text, '{} Kč'.format(views.convi(test[1][idx])))
+
+    def test_api(self):
+
+        res = self.client.post('/knr/api/', b'', content_type='text/xml')
+        self.assertEqual(res.status_code, HTTPStatus.FOUND)
+
+        self.assertTrue(self.client.login(username='user', password='none'))
+
+        res = self.client.get('/knr/api/')
+        self.assertEqual(res.status_code, HTTPStatus.METHOD_NOT_ALLOWED)
+
+        res = self.client.post('/knr/api/', b'XXX', content_type='text/xml')
+        self.assertEqual(res.status_code, HTTPStatus.BAD_REQUEST)
+        self.assertIn('error', res.json())
+
+        cases = (
+            (1, (17236, 72241, 15171, 104648)),
+            (2, (0, 0, 0, 0)),
+            (3, (1000, 1000, 100, 2100)),
+            (4, (20000, 4200, 420, 24620)),
+        )
+
+        num = Asset.objects.count()
+        for test in cases:
+            with open(join(TEST_DATA_DIR, 'knr_calc{:d}.xml'.format(test[0])), 'rb') as infile:
+                res = self.client.post('/knr/api/', infile.read(), content_type='text/xml')
+            self.assertEqual(res.status_code, HTTPStatus.OK)
+            rsp = res.json()
+            self.assertEqual(
+                (rsp['total_ex'], rsp['total_net'], rsp['total_vat'], rsp['total']),
+                test[1])
+            self.assertEqual(sum(x['amount'] for x in rsp['items']), rsp['total_ex'] + rsp['total_net'])
+        self.assertEqual(Asset.objects.count(), num)
@@ -23,16 +23,20 @@
 from http import HTTPStatus
 from datetime import datetime
 from os.path import join
+from time import perf_counter
+from unittest import skipUnless
 
 from bs4 import BeautifulSoup
+from django.db import connection, IntegrityError
 from django.test import SimpleTestCase, TransactionTestCase, TestCase
 from django.contrib.auth.models import User
 
 from legal.settings import TEST_DATA_DIR, FULL_CONTENT_TYPE
 from legal.common.glob import LOCAL_DOMAIN
+from legal.common.utils import LOGGER, Lease, LeaseLost
 from legal.sir import cron, glob, models
 
-from tests.utils import link_equal, setdl, setpr, getdl, getpr, check_html
+from tests.utils import link_equal, setdl, setpr, getdl, getpr, check_html, test_req, BENCHMARK
 
 
 APP = __package__.rpartition('.')[2]
@@ -46,18 +50,66 @@ class DummyTag:
 
 class TestCron1(SimpleTestCase):
 
-    def test_convdt(self):
-
-        self.assertEqual(
-            cron.convdt(DummyTag('2016-01-17T14:16:59.315489')),
-            datetime(2016, 1, 17, 14, 16, 59))
-
     def test_convd(self):
 
         self.assertEqual(
             cron.convd(DummyTag('2016-01-17T14:16:59.315489')),
             datetime(2016, 1, 17))
 
+    def test_gettr_parse(self):
+
+        content = test_req(True, cron.GETTR_URL, cron.gettr_query(472015)).content
+        res = cron.gettr_parse(content)
+        self.assertEqual(len(res), 115)
+        trans = res[0]
+        self.assertEqual(trans.id, 16130765)
+        self.assertEqual(trans.datumZalozeniUdalosti, datetime(2015, 1, 5, 10, 23, 8))
+        self.assertEqual(trans.datumZverejneniUdalosti, datetime(2015, 1, 5, 10, 28, 19))
+        self.assertEqual(
+            trans.dokumentUrl,
+            'https://isir.justice.cz:8443/isir_public_ws/doc/Document?idDokument=16188211')
+        self.assertEqual(trans.spisovaZnacka, 'INS 47/2015')
+        self.assertEqual(trans.typUdalosti, '185')
+        self.assertEqual(trans.popisUdalosti, 'Vyhláška o zahájení insolvenčního řízení')
+        self.assertEqual(trans.oddil, 'A')
+        self.assertEqual(trans.cisloVOddilu, 3)
+        self.assertTrue(trans.poznamkaText.startswith('<?xml'))
+        self.assertEqual(trans.shard, cron.get_shard('INS 47/2015'))
+        self.assertEqual(res[-1].id, 25707639)
+
+        start = content.index(b'<data>')
+        end = content.rindex(b'</data>') + len('</data>')
+        page = content[:start] + content[start:end] * 9 + content[end:]
+        self.assertEqual(len(cron.gettr_parse(page)), 1035)
+
+        self.assertEqual(cron.gettr_parse(test_req(True, cron.GETTR_URL, cron.gettr_query(25707639)).content), [])
+        self.assertIsNone(cron.gettr_parse(content.replace(b'<stav>OK', b'<stav>ERROR')))
+        self.assertIsNone(cron.gettr_parse(content[:-100]))
+        self.assertIsNone(cron.gettr_parse(b'<html><body>Error</body></html>'))
+
+    @skipUnless(BENCHMARK, 'set BENCHMARK to run benchmarks')
+    def test_gettr_parse_benchmark(self):
+
+        def soup_parse(content):
+            soup = BeautifulSoup(content.decode('utf-8'), 'lxml')
+            return [
+                (int(x.id.string), x.spisovaznacka.string.strip(), x.poznamka.string.strip() if x.poznamka else None)
+                for x in soup.find_all('data')]
+
+        content = test_req(True, cron.GETTR_URL, cron.gettr_query(472015)).content
+        start = content.index(b'<data>')
+        end = content.rindex(b'</data>') + len('</data>')
+        page = content[:start] + content[start:end] * 9 + content[end:]
+        times = []
+        for func in (soup_parse, cron.gettr_parse):
+            start = perf_counter()
+            for _ in range(5):
+                res = func(page)
+            times.append((perf_counter() - start) / 5)
+        self.assertEqual(
+            [(x.id, x.spisovaZnacka, x.poznamkaText) for x in cron.gettr_parse(page)], soup_parse(page))
+        LOGGER.info('gettr_parse: {:d} events, BeautifulSoup {:.3f} s, lxml {:.3f} s'.format(len(res), *times))
+
 
 def populate():
 
@@ -154,6 +206,128 @@ class TestCron4(TransactionTestCase):
         self.assertEqual(models.Transaction.objects.count(), 1)
 
 
+class TestCron6(TransactionTestCase):
+
+    def test_proctr_chunk(self):
+
+        def counts():
+            return [x.objects.count() for x in (models.Vec, models.Osoba, models.Role, models.Adresa)] + [
+                models.Vec.roles.through.objects.count(), models.Osoba.adresy.through.objects.count()]
+
+        setdl(472015)
+        cron.cron_gettr()
+        trans = list(models.Transaction.objects.all())
+        cron.cron_proctr()
+        exp = counts()
+        self.assertEqual(exp[:4], [1, 11, 11, 3])
+
+        chunk = cron.PROCTR_CHUNK
+        try:
+            for size in (7, 1):
+                for model in (
+                        models.Vec, models.Role, models.Osoba, models.Adresa, models.Transaction, models.Progress):
+                    model.objects.all().delete()
+                models.Transaction.objects.bulk_create(trans)
+                cron.PROCTR_CHUNK = size
+                cron.cron_proctr()
+                self.assertEqual(counts(), exp)
+        finally:
+            cron.PROCTR_CHUNK = chunk
+
+        cron.cron_deltr()
+        models.Transaction.objects.bulk_create(trans[:3])
+        tran = models.Transaction.objects.order_by('id')[1]
+        tran.poznamkaText = '<x/>'
+        tran.save()
+        cron.cron_proctr()
+        self.assertEqual(list(models.Transaction.objects.filter(error=True)), [tran])
+        self.assertEqual(counts(), exp)
+
+        def parse_trans(tran):
+            rec = orig_parse_trans(tran)
+            if tran.id == bad.id:
+                rec['osoba']['fields']['datumNarozeni'] = 'x'
+            return rec
+
+        for model in (
+                models.Vec, models.Role, models.Osoba, models.Adresa, models.Transaction, models.Progress):
+            model.objects.all().delete()
+        models.Transaction.objects.bulk_create(trans)
+        bad = [x for x in trans if cron.parse_trans(x)['osoba']][-1]
+        orig_parse_trans = cron.parse_trans
+        cron.parse_trans = parse_trans
+        try:
+            cron.cron_proctr()
+        finally:
+            cron.parse_trans = orig_parse_trans
+        self.assertEqual(list(models.Transaction.objects.filter(error=True)), [bad])
+        self.assertEqual(counts(), exp)
+        self.assertEqual(models.Progress.objects.get(shard=bad.shard).number, trans[-1].id)
+
+    def test_proctr_worker(self):
+
+        self.assertEqual(cron.get_shard('INS 4711/2015'), cron.get_shard('KSPH 38 INS 4711/2015'))
+        self.assertNotEqual(cron.get_shard('INS 4711/2015'), cron.get_shard('INS 4712/2015'))
+
+        setdl(472015)
+        cron.cron_gettr()
+        for trans in models.Transaction.objects.all():
+            self.assertEqual(trans.shard, cron.get_shard(trans.spisovaZnacka))
+        last = models.Transaction.objects.order_by('id').last().id
+        shard = models.Transaction.objects.first().shard
+
+        debtor = models.DruhRoleVRizeni.objects.create(desc='DLUŽNÍK')
+        self.assertIsNone(cron.proctr_worker(0, 2, debtor.id))
+        models.Progress.objects.bulk_create([models.Progress(shard=x) for x in range(cron.SHARDS)])
+        self.assertEqual(cron.proctr_worker(1, 2, debtor.id), last)
+        self.assertIsNone(cron.proctr_worker(0, 2, debtor.id))
+        self.assertEqual(models.Progress.objects.get(shard=shard).number, last)
+        self.assertEqual(models.Vec.objects.count(), 1)
+        self.assertEqual(models.Osoba.objects.count(), 11)
+
+        try:
+            with self.assertRaises(LeaseLost):
+                cron.proctr_worker(0, 2, debtor.id, ('sir', 'nobody'))
+        finally:
+            Lease.set_current(None)
+
+        cron.cron_proctr()
+        self.assertEqual(getdl(), 472015)
+        self.assertEqual(models.Osoba.objects.count(), 11)
+
+        cron.cron_deltr()
+        self.assertFalse(models.Progress.objects.exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'worker processes need a database shared across processes')
+    def test_proctr_workers(self):
+
+        setdl(472015)
+        cron.cron_gettr()
+        last = models.Transaction.objects.order_by('id').last().id
+        workers = cron.PROCTR_WORKERS
+        cron.PROCTR_WORKERS = 2
+        try:
+            cron.cron_proctr()
+        finally:
+            cron.PROCTR_WORKERS = workers
+        self.assertEqual(max(models.Progress.objects.values_list('number', flat=True)), last)
+        self.assertEqual(models.Vec.objects.count(), 1)
+        self.assertEqual(models.Osoba.objects.count(), 11)
+        self.assertEqual(models.Role.objects.count(), 11)
+        self.assertEqual(models.Adresa.objects.count(), 3)
+        self.assertFalse(models.Transaction.objects.filter(error=True).exists())
+
+    def test_get_descs(self):
+
+        first = models.DruhAdresy.objects.create(desc='TRVALÁ')
+        res = cron.get_descs(models.DruhAdresy, {'TRVALÁ', 'SÍDLO'})
+        self.assertEqual(res['TRVALÁ'], first)
+        self.assertEqual(cron.get_descs(models.DruhAdresy, {'SÍDLO'}), {'SÍDLO': res['SÍDLO']})
+        self.assertEqual(models.DruhAdresy.objects.count(), 2)
+        with self.assertRaises(IntegrityError):
+            models.DruhAdresy.objects.create(desc='SÍDLO')
+
+
 class TestCron5(TestCase):
 
     fixtures = ('sir_test1.json',)
@@ -34,7 +34,7 @@ from legal.psj.cron import cron_schedule, cron_update as psj_update
 from legal.psj.models import Task, Hearing
 from legal.udn.cron import cron_update as udn_update
 from legal.udn.models import Decision
-from legal.sur import cron, models
+from legal.sur import cron, models, utils
 
 from tests.utils import link_equal, check_html
 
@@ -158,6 +158,36 @@ sp. zn. 10 As 81/2016
         cleanup()
 
 
+class TestUtils(TestCase):
+
+    fixtures = ('sur_test.json',)
+
+    def test_party_index(self):
+
+        index = utils.PartyIndex()
+        self.assertEqual(index.match(('Jana Nováková',)), {})
+        party1 = models.Party.objects.create(uid_id=1, party='nová', party_opt=0)
+        party2 = models.Party.objects.create(uid_id=1, party='Jana', party_opt=1, check_psj=False)
+        party3 = models.Party.objects.create(uid_id=1, party='KOVÁ', party_opt=2)
+        party4 = models.Party.objects.create(uid_id=1, party='Jan Novák', party_opt=3)
+        names = ('Jana Nováková', 'Jan Novák', 'jan novak', 'Petr Nový')
+        self.assertEqual(
+            index.match(names),
+            {party1.id: ['Jana Nováková', 'Jan Novák'], party2.id: ['Jana Nováková'], party3.id: ['Jana Nováková'],
+             party4.id: ['Jan Novák']})
+        self.assertEqual(index.match(names, {'check_psj': True}).keys(), {party1.id, party3.id, party4.id})
+        party1.party = 'Nový'
+        party1.save()
+        party3.delete()
+        party5 = models.Party.objects.create(uid_id=1, party='Á', party_opt=2)
+        self.assertEqual(
+            index.match(names),
+            {party1.id: ['Petr Nový'], party2.id: ['Jana Nováková'], party4.id: ['Jan Novák'],
+             party5.id: ['Jana Nováková']})
+        self.assertEqual(index.match(names), utils.PartyIndex().match(names))
+        self.assertEqual(index.match(()), {})
+
+
 class TestModels(TransactionTestCase):
 
     fixtures = ('sur_test.json',)
@@ -284,6 +284,7 @@ def getpr():
 
 CHECK_HTML = bool(environ.get('CHECK_HTML'))
 WRITE_CHECKFILE = bool(environ.get('WRITE_CHECKFILE'))
+BENCHMARK = bool(environ.get('BENCHMARK'))
 CHECKFILE = open(join(TEST_DIR, 'test.chk'), 'w' if WRITE_CHECKFILE else 'r')
 
 